@@ -23,7 +23,7 @@
 __all__ = ['core', 'individual', 'spatial', 'recharge', 'network', 'helper', 'io', 'utils', 'tests']
 
 from .io import read_csv, to_json, to_csv
-from .core import User, Record, Recharge, Position
+from .core import User, Record, Recharge, Position, ColumnarRecords
 from . import individual, spatial, recharge, network, helper, utils, io, tests, core, visualization
 
 import bandicoot.helper.tools
@@ -0,0 +1,375 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015-2016 Massachusetts Institute of Technology.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Compute the indicators of many users in parallel, and stream them to disk.
+"""
+
+from __future__ import division, print_function
+
+import bandicoot as bc
+from bandicoot.io import CsvIndicatorWriter, NdjsonIndicatorWriter, \
+    filter_record, _load_attributes, _open_output
+from bandicoot.core import Recharge
+
+from datetime import datetime
+from json import dumps, loads
+import multiprocessing as mp
+import traceback
+import argparse
+import time
+import csv
+import sys
+import os
+
+
+def list_users(records_path, manifest=None):
+    """
+    Return the identifiers of the users to process: the lines of the
+    ``manifest`` file if given, or else the names of the CSV files in
+    ``records_path``.
+    """
+    if manifest is not None:
+        with open(manifest, 'r') as f:
+            return [line.strip() for line in f
+                    if line.strip() and not line.startswith('#')]
+
+    return sorted(f[:-4] for f in os.listdir(records_path)
+                  if f.endswith('.csv'))
+
+
+def _is_json(output):
+    name = output[:-3] if output.endswith('.gz') else output
+    return name.endswith('.json') or name.endswith('.ndjson')
+
+
+def csv_fields(records_path, users, load_options=None,
+               indicator_options=None):
+    """
+    Return the columns of the CSV file exported by :meth:`run`: the flatten
+    indicators returned by :meth:`~bandicoot.utils.all` for
+    ``indicator_options``, the recharges and network indicators if they are
+    loaded, and the attributes found in the attributes files of ``users``.
+    Users without recharges, network, or some attributes leave these
+    columns empty.
+    """
+    load_options = load_options or {}
+    options = dict(indicator_options or {})
+    with_attributes = options.pop('attributes', True)
+    network = options.pop('network', False) and load_options.get('network')
+    options['flatten'] = True
+
+    attributes = []
+    attributes_path = load_options.get('attributes_path')
+    if attributes_path is not None:
+        seen = set()
+        for user_id in users:
+            found = _load_attributes(
+                os.path.join(attributes_path, user_id + '.csv')) or {}
+            for name in found:
+                if name not in seen:
+                    seen.add(name)
+                    attributes.append(name)
+
+    # Indicators are named after the options, and not after the records,
+    # of the user
+    template = bc.User()
+    template.ignored_records = dict(filter_record([])[1])
+    if load_options.get('recharges_path') is not None:
+        template.recharges = [Recharge(datetime(1970, 1, day), 0., None)
+                              for day in (1, 8)]
+    fields = list(bc.utils.all(template, attributes=False, **options))
+
+    if network:
+        # The assortativity of indicators compares the indicators of users
+        # computed with default options, whatever the options of the run
+        indicators = [k for k in bc.utils.all(template, attributes=False,
+                                              flatten=True)
+                      if k != 'name' and not k.startswith('reporting__')]
+        fields += ['clustering_coefficient_unweighted',
+                   'clustering_coefficient_weighted']
+        fields += ['assortativity_attributes__' + a for a in attributes]
+        fields += ['assortativity_indicators__' + k for k in indicators]
+
+    if with_attributes:
+        fields += ['attributes__' + a for a in attributes]
+    return fields
+
+
+def _open_writer(output, append, fields=None):
+    if _is_json(output):
+        return NdjsonIndicatorWriter(output, append=append)
+    return CsvIndicatorWriter(output, fields=fields, append=append,
+                              strict=True)
+
+
+def _read_checkpoint(checkpoint):
+    if checkpoint is None or not os.path.exists(checkpoint):
+        return set()
+    with open(checkpoint, 'r') as f:
+        return set(line.rstrip('\n') for line in f if line.strip())
+
+
+def _exported_names(output):
+    """
+    Return the names of the users already exported to ``output``, including
+    the ones exported after the last checkpoint of an interrupted run.
+    """
+    if not os.path.exists(output) or os.path.getsize(output) == 0:
+        return set()
+
+    names = set()
+    with _open_output(output, 'r', None) as f:
+        if _is_json(output):
+            for line in f:
+                try:
+                    names.add(loads(line)['name'])
+                except ValueError:
+                    # Last line of an interrupted write
+                    pass
+        else:
+            for row in csv.DictReader(f):
+                names.add(row['name'])
+    return names
+
+
+_worker_options = None
+
+
+def _init_worker(options):
+    global _worker_options
+    _worker_options = options
+
+
+def _compute(user_id):
+    records_path, load_options, indicator_options = _worker_options
+    try:
+        user = bc.read_csv(user_id, records_path, describe=False,
+                           warnings=False, **load_options)
+        return user_id, bc.utils.all(user, **indicator_options), None
+    except Exception:
+        return user_id, None, traceback.format_exc()
+
+
+def run(records_path, output, manifest=None, load_options=None,
+        indicator_options=None, processes=None, chunksize=16,
+        checkpoint=None, errors=None, progress=True):
+    """
+    Compute the indicators of all the users of a directory on a pool of
+    processes, and write them to ``output`` as soon as they are computed.
+
+    Parameters
+    ----------
+    records_path : str
+        Directory of the records files.
+    output : str
+        File to export to: NDJSON for files ending in ``.json`` or
+        ``.ndjson``, or else CSV. Files ending in ``.gz`` are compressed.
+    manifest : str, optional
+        File with one user identifier per line. By default, all the users
+        of ``records_path`` are processed.
+    load_options : dict, optional
+        Arguments given to :meth:`~bandicoot.io.read_csv`, such as
+        ``antennas_path`` or ``duration_format``.
+    indicator_options : dict, optional
+        Arguments given to :meth:`~bandicoot.utils.all`, such as
+        ``groupby`` or ``split_week``.
+    processes : int, optional
+        Number of worker processes. Defaults to the number of CPUs. With
+        one process, users are processed in the current process.
+    chunksize : int, default 16
+        Number of users sent to a worker at once. Results and the
+        checkpoint are also written to disk every ``chunksize`` users.
+    checkpoint : str, optional
+        File listing the users already exported. Users listed in the file,
+        or already in ``output``, are skipped, and results are appended to
+        ``output``, so that an interrupted run can be resumed. Users which
+        failed are not listed, and are processed again.
+    errors : str, optional
+        NDJSON file receiving, for each user which failed, its identifier
+        and the traceback of the error.
+    progress : bool, default True
+        Report progress on the standard error.
+
+    Returns
+    -------
+    dict
+        The number of users processed, failed, and skipped.
+    """
+    load_options = dict(load_options or {})
+    indicator_options = dict(indicator_options or {})
+    if not _is_json(output):
+        # Flatten in the workers, to send smaller results to the parent
+        indicator_options['flatten'] = True
+
+    users = list_users(records_path, manifest)
+    done = _read_checkpoint(checkpoint)
+    if checkpoint is not None:
+        # Users exported after the last checkpoint are not exported twice
+        done |= _exported_names(output)
+    pending = [u for u in users if u not in done]
+    resume = len(done) > 0
+
+    stats = {'processed': 0, 'errors': 0, 'skipped': len(users) - len(pending)}
+    options = (records_path, load_options, indicator_options)
+
+    fields = None
+    if not _is_json(output):
+        fields = csv_fields(records_path, users, load_options,
+                            indicator_options)
+    writer = _open_writer(output, resume, fields)
+    errors_file = open(errors, 'a' if resume else 'w') if errors else None
+    checkpoint_file = open(checkpoint, 'a') if checkpoint else None
+
+    if processes == 1:
+        _init_worker(options)
+        pool = None
+        results = map(_compute, pending)
+    else:
+        pool = mp.Pool(processes, initializer=_init_worker,
+                       initargs=(options,))
+        results = pool.imap_unordered(_compute, pending, chunksize)
+
+    completed = []
+    start = last_report = time.time()
+
+    def report():
+        elapsed = time.time() - start
+        print("Processed {}/{} users ({} errors), {:.1f} users/s".format(
+            stats['processed'], len(pending), stats['errors'],
+            stats['processed'] / elapsed if elapsed > 0 else 0),
+            file=sys.stderr)
+
+    def commit():
+        # Results are written before the checkpoint. After a crash, users
+        # exported after the last checkpoint are found in the output.
+        writer.flush()
+        if errors_file is not None:
+            errors_file.flush()
+        if checkpoint_file is not None:
+            checkpoint_file.write(''.join(u + '\n' for u in completed))
+            checkpoint_file.flush()
+        del completed[:]
+
+    try:
+        for user_id, result, error in results:
+            if error is None:
+                writer.write(result)
+                completed.append(user_id)
+            else:
+                stats['errors'] += 1
+                if errors_file is not None:
+                    errors_file.write(dumps({'name': user_id,
+                                             'error': error}) + '\n')
+                else:
+                    print("Error with user {}:\n{}".format(user_id, error),
+                          file=sys.stderr)
+
+            stats['processed'] += 1
+            if stats['processed'] % chunksize == 0:
+                commit()
+
+            if progress and time.time() - last_report > 10:
+                last_report = time.time()
+                report()
+
+        commit()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        writer.close()
+        if errors_file is not None:
+            errors_file.close()
+        if checkpoint_file is not None:
+            checkpoint_file.close()
+
+    if progress:
+        report()
+
+    return stats
+
+
+def _none_or(value):
+    return None if value.lower() == 'none' else value
+
+
+def main(argv=None):
+    """
+    Entry point of the ``bandicoot-batch`` command.
+    """
+    parser = argparse.ArgumentParser(
+        description="Compute bandicoot indicators for a directory of users.")
+    parser.add_argument('records_path', help="directory of the records files")
+    parser.add_argument('output', help="CSV or NDJSON file to export to")
+    parser.add_argument('--manifest', help="file with one user id per line")
+    parser.add_argument('--antennas', help="antennas file")
+    parser.add_argument('--attributes', help="directory of attributes files")
+    parser.add_argument('--recharges', help="directory of recharges files")
+    parser.add_argument('--network', action='store_true',
+                        help="load the network of each user")
+    parser.add_argument('--duration-format', default='seconds')
+    parser.add_argument('--drop-duplicates', action='store_true')
+    parser.add_argument('--groupby', default='week', type=_none_or,
+                        help="week, month, year, or none")
+    parser.add_argument('--summary', default='default', type=_none_or,
+                        help="default, extended, or none")
+    parser.add_argument('--split-week', action='store_true')
+    parser.add_argument('--split-day', action='store_true')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=16)
+    parser.add_argument('--checkpoint',
+                        help="file of processed users, to resume a run")
+    parser.add_argument('--errors', help="NDJSON file to report errors")
+    parser.add_argument('--quiet', action='store_true',
+                        help="do not report progress")
+    args = parser.parse_args(argv)
+
+    load_options = {
+        'antennas_path': args.antennas,
+        'attributes_path': args.attributes,
+        'recharges_path': args.recharges,
+        'network': args.network,
+        'duration_format': args.duration_format,
+        'drop_duplicates': args.drop_duplicates
+    }
+    indicator_options = {
+        'groupby': args.groupby,
+        'summary': args.summary,
+        'split_week': args.split_week,
+        'split_day': args.split_day,
+        'network': args.network
+    }
+
+    stats = run(args.records_path, args.output, manifest=args.manifest,
+                load_options=load_options,
+                indicator_options=indicator_options,
+                processes=args.processes, chunksize=args.chunksize,
+                checkpoint=args.checkpoint, errors=args.errors,
+                progress=not args.quiet)
+    return 1 if stats['errors'] > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
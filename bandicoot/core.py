@@ -22,11 +22,26 @@
 
 from __future__ import division
 
+import array
+import copy
+import itertools
 import datetime
 from threading import Lock
 from collections import Counter
-from bandicoot.helper.tools import Colors
-from bandicoot.helper.group import positions_binning, grouping_query
+from operator import attrgetter
+from bisect import bisect_right
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
+from bandicoot.helper.tools import Colors, OrderedDict
+from bandicoot.helper.group import positions_binning, grouping_scan, \
+    query_scans, scan_tags, scan_keys, column_tags, scan_size, \
+    extend_columns, _chunk_key
+from bandicoot.helper.aggregate import FINER_PERIODS, merge_periods, \
+    pad_periods, touched_periods
+from bandicoot.helper.cache import LRUCache, Flight, content_size
+from bandicoot.helper.maths import keep_distributions
 import bandicoot as bc
 
 
@@ -90,6 +105,188 @@ class Record(object):
         return len(self.all_matches(iterable)) > 0
 
 
+class MatchIndex(object):
+    """
+    Index of records, used to find the records matching a given record (see
+    :meth:`Record.matches`) without scanning all of them.
+
+    Records are bucketed by interaction, call duration and direction, and
+    the datetimes of each bucket are sorted: looking for a match is a binary
+    search in the buckets with the same interaction and call duration but
+    another direction.
+
+    Examples
+    --------
+    >>> index = MatchIndex(correspondent.records)
+    >>> reciprocated = [r for r in user.records if index.has_match(r)]
+    """
+
+    _window = datetime.timedelta(seconds=30)
+
+    def __init__(self, records):
+        buckets = {}
+        for r in records:
+            directions = buckets.setdefault(
+                (r.interaction, r.call_duration), {})
+            directions.setdefault(r.direction, []).append(r.datetime)
+
+        for directions in buckets.values():
+            for times in directions.values():
+                times.sort()
+
+        self._buckets = buckets
+
+    def has_match(self, record):
+        """
+        Return True if at least one indexed record matches ``record``.
+        Equivalent to ``record.has_match(records)``.
+        """
+        directions = self._buckets.get(
+            (record.interaction, record.call_duration))
+        if directions is None:
+            return False
+
+        lower = record.datetime - self._window
+        upper = record.datetime + self._window
+        for direction, times in directions.items():
+            if direction == record.direction:
+                continue
+
+            i = bisect_right(times, lower)
+            if i < len(times) and times[i] < upper:
+                return True
+
+        return False
+
+
+def _position_field(name):
+    def getter(record):
+        # Falsy antennas and locations are all equivalent to missing ones
+        return getattr(record.position, name) or None
+    return getter
+
+
+class Deduplicator(object):
+    """
+    Detect duplicated records in a stream of records sorted by datetime.
+
+    Two records are duplicates if they share the same datetime and the same
+    value for each field of :attr:`Deduplicator.FIELDS`. Only the records of
+    the current datetime are kept in memory, and their keys are computed only
+    when several records share a datetime.
+
+    The first occurrence of a record is kept. Records which would be
+    duplicates for other combinations of fields can also be counted, using
+    the ``combinations`` parameter.
+
+    Parameters
+    ----------
+    combinations : list of tuples, optional
+        Additional combinations of fields (from
+        :attr:`Deduplicator.FIELDS`) for which duplicates are counted. The
+        datetime is always part of the combination.
+
+    Attributes
+    ----------
+    counts : OrderedDict
+        The number of duplicated records for each combination of fields,
+        starting with :attr:`Deduplicator.FIELDS`.
+
+    Examples
+    --------
+    >>> dedup = Deduplicator([('interaction', 'direction', 'correspondent_id')])
+    >>> records = list(dedup.filter(sorted_records))
+    >>> dedup.counts
+    OrderedDict([(('interaction', ..., 'location'), 2),
+                 (('interaction', 'direction', 'correspondent_id'), 5)])
+    """
+
+    FIELDS = ('interaction', 'direction', 'correspondent_id',
+              'call_duration', 'antenna', 'location')
+
+    _getters = {
+        'interaction': attrgetter('interaction'),
+        'direction': attrgetter('direction'),
+        'correspondent_id': attrgetter('correspondent_id'),
+        'call_duration': attrgetter('call_duration'),
+        'antenna': _position_field('antenna'),
+        'location': _position_field('location')
+    }
+
+    def __init__(self, combinations=()):
+        self.combinations = [self.FIELDS]
+        for fields in combinations:
+            fields = tuple(fields)
+            for f in fields:
+                if f not in self._getters:
+                    raise ValueError("Unknown field {!r}.".format(f))
+            if fields not in self.combinations:
+                self.combinations.append(fields)
+
+        # Keys of the full combination are built without generic getters
+        self._keys = [self._record_key] + \
+            [self._key_function(c) for c in self.combinations[1:]]
+        self.counts = OrderedDict((c, 0) for c in self.combinations)
+
+        self._datetime = None
+        self._first = None
+        self._seen = None
+
+    def _key_function(self, fields):
+        getters = [self._getters[f] for f in fields]
+        return lambda r: tuple(g(r) for g in getters)
+
+    @staticmethod
+    def _record_key(r):
+        position = r.position
+        return (r.interaction, r.direction, r.correspondent_id,
+                r.call_duration, position.antenna or None,
+                position.location or None)
+
+    def is_duplicate(self, record):
+        """
+        Return True if ``record`` duplicates a previous record, and update
+        the counts. Records must be given sorted by datetime.
+        """
+        dt = record.datetime
+        if dt != self._datetime:
+            if self._datetime is not None and dt < self._datetime:
+                raise ValueError("Records must be sorted by datetime.")
+            self._datetime, self._first, self._seen = dt, record, None
+            return False
+
+        if self._seen is None:
+            self._seen = [set([key(self._first)]) for key in self._keys]
+
+        duplicate = False
+        for i, (combination, key_function, seen) in enumerate(zip(
+                self.combinations, self._keys, self._seen)):
+            key = key_function(record)
+            if key in seen:
+                self.counts[combination] += 1
+                duplicate = duplicate or i == 0
+            else:
+                seen.add(key)
+
+        return duplicate
+
+    def filter(self, records):
+        """
+        Yield the records of ``records``, sorted by datetime, without
+        duplicates.
+        """
+        for r in records:
+            if not self.is_duplicate(r):
+                yield r
+
+    @property
+    def duplicated_records(self):
+        """
+        Number of duplicated records found so far.
+        """
+        return self.counts[self.FIELDS]
+
+
 class Position(object):
     """
     Data structure storing a generic location. Can be instantiated with either
@@ -154,17 +351,351 @@ class Position(object):
         return hash(self.__repr__())
 
 
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _to_timestamp(dt):
+    delta = dt - _EPOCH
+    return delta.days * 86400 + delta.seconds
+
+
+def _from_timestamp(ts):
+    return _EPOCH + datetime.timedelta(seconds=ts)
+
+
+class _Vocabulary(object):
+    """
+    Dictionary encoding of a categorical column: each distinct value is
+    stored once and records only keep its integer code.
+    """
+    __slots__ = ['values', 'codes']
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = dict((v, i) for i, v in enumerate(self.values))
+
+    def encode(self, value):
+        try:
+            return self.codes[value]
+        except KeyError:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            return code
+
+
+class AntennaRegistry(MutableMapping):
+    """
+    Mapping from antenna identifiers to ``(latitude, longitude)``
+    locations, where each antenna is assigned a dense integer code, in
+    order of insertion.
+
+    Registries loaded by :meth:`~bandicoot.io.read_csv` are shared by all
+    the users loaded with the same antennas file: each user receives a
+    :meth:`copy` of the registry, which shares its antennas until one of
+    them is modified.
+
+    Parameters
+    ----------
+    antennas : dict or iterable of (antenna_id, (lat, lon)) pairs
+        The locations of the antennas.
+
+    Examples
+    --------
+    >>> registry = AntennaRegistry({'a1': (42.36, -71.09)})
+    >>> registry['a1']
+    (42.36, -71.09)
+    >>> registry.codes['a1']
+    0
+    """
+
+    def __init__(self, antennas=()):
+        self.ids = []
+        self.codes = {}
+        self.locations = []
+        self._copied = False
+
+        if isinstance(antennas, Mapping):
+            antennas = antennas.items()
+
+        for antenna_id, (lat, lon) in antennas:
+            self[antenna_id] = (lat, lon)
+
+    def copy(self):
+        """
+        Return a copy of the registry, sharing its antennas until either
+        registry is modified.
+        """
+        clone = AntennaRegistry()
+        clone.ids, clone.codes, clone.locations = \
+            self.ids, self.codes, self.locations
+        clone._copied = self._copied = True
+        return clone
+
+    def _own(self):
+        # Copy the antennas shared with other registries before writing
+        if self._copied:
+            self.ids = list(self.ids)
+            self.codes = dict(self.codes)
+            self.locations = list(self.locations)
+            self._copied = False
+
+    def __getitem__(self, antenna_id):
+        return self.locations[self.codes[antenna_id]]
+
+    def get(self, antenna_id, default=None):
+        code = self.codes.get(antenna_id)
+        if code is None:
+            return default
+        return self.locations[code]
+
+    def __setitem__(self, antenna_id, location):
+        self._own()
+        code = self.codes.get(antenna_id)
+        if code is None:
+            self.codes[antenna_id] = len(self.ids)
+            self.ids.append(antenna_id)
+            self.locations.append(location)
+        else:
+            # As with a dictionary, the last location is kept
+            self.locations[code] = location
+
+    def __delitem__(self, antenna_id):
+        self._own()
+        code = self.codes.pop(antenna_id)
+        del self.ids[code]
+        del self.locations[code]
+        for i in range(code, len(self.ids)):
+            self.codes[self.ids[i]] = i
+
+    def __contains__(self, antenna_id):
+        return antenna_id in self.codes
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return "AntennaRegistry(%i antennas)" % len(self)
+
+
+class ColumnarRecords(object):
+    """
+    Compact, column-oriented storage for a time-sorted list of records.
+
+    Each field is stored in a typed :mod:`array`: timestamps as int64 epoch
+    seconds, interactions and directions as int8 codes, correspondents and
+    antennas as int32 dictionary codes, and durations and coordinates as
+    doubles (``NaN`` for missing values). Accessing an element or iterating
+    builds :class:`Record` views lazily.
+
+    .. note:: Record views are snapshots: modifying one of them does not
+        update the storage. Assign ``User.records`` again to persist changes.
+        Timestamps are stored with a precision of one second.
+    """
+
+    COLUMNS = [('timestamps', 'q'), ('interactions', 'b'),
+               ('directions', 'b'), ('correspondents', 'i'),
+               ('durations', 'd'), ('antennas', 'i'), ('latitudes', 'd'),
+               ('longitudes', 'd')]
+    VOCABULARIES = ['interaction_vocabulary', 'direction_vocabulary',
+                    'correspondent_vocabulary', 'antenna_vocabulary']
+
+    def __init__(self, records=()):
+        self.timestamps = array.array('q')
+        self.interactions = array.array('b')
+        self.directions = array.array('b')
+        self.correspondents = array.array('i')
+        self.durations = array.array('d')
+        self.antennas = array.array('i')
+        self.latitudes = array.array('d')
+        self.longitudes = array.array('d')
+
+        self.interaction_vocabulary = _Vocabulary()
+        self.direction_vocabulary = _Vocabulary()
+        self.correspondent_vocabulary = _Vocabulary()
+        self.antenna_vocabulary = _Vocabulary()
+        self.integer_durations = True
+
+        self.extend(records)
+
+    def extend(self, records):
+        """
+        Append records at the end of the storage. Records are expected to
+        be sorted by time, and to come after the ones already stored.
+        """
+        nan = float('nan')
+        for r in records:
+            self.timestamps.append(_to_timestamp(r.datetime))
+            self.interactions.append(
+                self.interaction_vocabulary.encode(r.interaction))
+            self.directions.append(
+                self.direction_vocabulary.encode(r.direction))
+            self.correspondents.append(
+                self.correspondent_vocabulary.encode(r.correspondent_id))
+
+            if r.call_duration is None:
+                self.durations.append(nan)
+            else:
+                if not isinstance(r.call_duration, int):
+                    self.integer_durations = False
+                self.durations.append(r.call_duration)
+
+            position = r.position
+            if position.antenna is None:
+                self.antennas.append(-1)
+            else:
+                self.antennas.append(
+                    self.antenna_vocabulary.encode(position.antenna))
+
+            if position.location is None:
+                self.latitudes.append(nan)
+                self.longitudes.append(nan)
+            else:
+                self.latitudes.append(position.location[0])
+                self.longitudes.append(position.location[1])
+
+    def merge(self, records):
+        """
+        Return a new storage with the records stored and ``records``, sorted
+        by time, merging the columns without building :class:`Record`
+        views. Records are expected to be sorted by time, and are stored
+        after the ones with the same timestamp.
+        """
+        merged = ColumnarRecords()
+        for name in self.VOCABULARIES:
+            setattr(merged, name, _Vocabulary(getattr(self, name).values))
+        merged.extend(records)
+        merged.integer_durations = \
+            self.integer_durations and merged.integer_durations
+
+        # Index of each new record in the stored ones
+        positions = []
+        lo = 0
+        for t in merged.timestamps:
+            lo = bisect_right(self.timestamps, t, lo)
+            positions.append(lo)
+
+        for name, typecode in self.COLUMNS:
+            column, new = getattr(self, name), getattr(merged, name)
+            values = array.array(typecode)
+            previous = 0
+            for value, position in zip(new, positions):
+                values.extend(column[previous:position])
+                values.append(value)
+                previous = position
+            values.extend(column[previous:])
+            setattr(merged, name, values)
+
+        return merged
+
+    def update_locations(self, antennas):
+        """
+        Replace the location of every record with the location of its
+        antenna in ``antennas``, or ``None`` if the antenna is unknown.
+        """
+        nan = float('nan')
+        locations = [antennas.get(a, None)
+                     for a in self.antenna_vocabulary.values]
+
+        for i, code in enumerate(self.antennas):
+            location = locations[code] if code != -1 else None
+            if location is None:
+                self.latitudes[i] = nan
+                self.longitudes[i] = nan
+            else:
+                self.latitudes[i], self.longitudes[i] = location
+
+    def _record(self, i):
+        duration = self.durations[i]
+        if duration != duration:
+            duration = None
+        elif self.integer_durations:
+            duration = int(duration)
+
+        code = self.antennas[i]
+        antenna = self.antenna_vocabulary.values[code] if code != -1 else None
+        latitude = self.latitudes[i]
+        location = None if latitude != latitude else \
+            (latitude, self.longitudes[i])
+
+        return Record(
+            interaction=self.interaction_vocabulary.values[
+                self.interactions[i]],
+            direction=self.direction_vocabulary.values[self.directions[i]],
+            correspondent_id=self.correspondent_vocabulary.values[
+                self.correspondents[i]],
+            datetime=_from_timestamp(self.timestamps[i]),
+            call_duration=duration,
+            position=Position(antenna=antenna, location=location))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._record(i) for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return self._record(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._record(i)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, ColumnarRecords)):
+            return len(self) == len(other) and list(self) == list(other)
+        return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "ColumnarRecords(%i records)" % len(self)
+
+
 class User(object):
     """
     Data structure storing all the call, text or mobility records of the user.
+
+    Parameters
+    ----------
+    columnar : bool, default False
+        If True, records are stored in a compact
+        :class:`~bandicoot.core.ColumnarRecords` instead of a list of
+        :class:`~bandicoot.core.Record` objects.
+
+    Attributes
+    ----------
+    use_aggregates : bool, default False
+        If True, the indicators exposing a partial state (see
+        :meth:`~bandicoot.helper.aggregate.mergeable`) are computed by
+        merging the states of each day, cached with the user. Queries
+        grouped by week, month, year, or over the whole period then share
+        the same daily states instead of scanning the records again.
+        The values of the other indicators are cached for each period. With
+        :meth:`append_records`, only the periods touched by new records
+        are then computed again.
     """
 
-    def __init__(self):
-        self._records = []
+    def __init__(self, columnar=False):
+        self.columnar = columnar
+        self._records = ColumnarRecords() if columnar else []
         self._antennas = {}
         self._recharges = []
-        self._cache = {}
+        # Groups of records and values, bounded to ten million records or
+        # objects by default
+        self._cache = LRUCache(max_size=10 ** 7)
         self._cache_lock = Lock()
+        self._flights = {}
+        self._columns = {}
+        self.partitions = OrderedDict()
+        self.use_aggregates = False
 
         self.name = None
         self.antennas_path = None
@@ -173,16 +704,18 @@ class User(object):
 
         self.start_time = None
         self.end_time = None
-        self.night_start = datetime.time(19)
-        self.night_end = datetime.time(7)
-        self.weekend = [6, 7]  # Saturday, Sunday by default
+        self._night_start = datetime.time(19)
+        self._night_end = datetime.time(7)
+        self._weekend = [6, 7]  # Saturday, Sunday by default
 
         self.home = None
+        self._home_candidates = None
         self.has_text = False
         self.has_call = False
         self.has_antennas = False
         self.attributes = {}
         self.ignored_records = None
+        self.data_quality = None
 
         self.percent_outofnetwork_calls = 0
         self.percent_outofnetwork_texts = 0
@@ -191,6 +724,82 @@ class User(object):
 
         self.network = {}
 
+    def __getstate__(self):
+        # Copies of the user, or users sent to other processes, have their
+        # own empty cache
+        state = self.__dict__.copy()
+        for name in ['_cache', '_cache_lock', '_flights', '_columns']:
+            del state[name]
+        state['_cache_max_records'] = self._cache.max_size
+        return state
+
+    def __setstate__(self, state):
+        max_records = state.pop('_cache_max_records')
+        self.__dict__.update(state)
+        self._cache = LRUCache(max_size=max_records)
+        self._cache_lock = Lock()
+        self._flights = {}
+        self._columns = {}
+
+    @property
+    def night_start(self):
+        """
+        Start of the night (19:00 by default), used with :attr:`night_end`
+        to split records between day and night.
+        """
+        return self._night_start
+
+    @night_start.setter
+    def night_start(self, value):
+        self._night_start = value
+        self._invalidate('night')
+
+    @property
+    def night_end(self):
+        """End of the night (07:00 by default)."""
+        return self._night_end
+
+    @night_end.setter
+    def night_end(self, value):
+        self._night_end = value
+        self._invalidate('night')
+
+    @property
+    def weekend(self):
+        """
+        Days of the weekend, from 1 (Monday) to 7 (Sunday). Saturday and
+        Sunday by default.
+        """
+        return self._weekend
+
+    @weekend.setter
+    def weekend(self, value):
+        self._weekend = value
+        self._invalidate('weekend')
+
+    def add_partition(self, name, function):
+        """
+        Add a dimension to split records with, in addition to the part of
+        the week, the part of the day, and the type of interaction.
+
+        Parameters
+        ----------
+        name : str
+            Name of the partition.
+        function : function
+            Function returning, for a record, its value in the partition.
+
+        Examples
+        --------
+        >>> family = set(['A', 'B'])
+        >>> user.add_partition('family', lambda r: r.correspondent_id in family)
+        >>> bc.individual.number_of_contacts(user, split_by={'family': [True]})
+        """
+        if name in ('using', 'interaction', 'part_of_week', 'part_of_day'):
+            raise ValueError("{} is a reserved partition name.".format(name))
+        self.partitions[name] = function
+        self._invalidate('partition:' + name)
+
     @property
     def antennas(self):
         """
@@ -204,13 +813,17 @@ class User(object):
     def antennas(self, input_):
         self._antennas = input_
         self.has_antennas = len(input_) > 0
-        for r in self._records:
-            if r.position.antenna in self._antennas:
-                r.position.location = self._antennas[r.position.antenna]
-            else:
-                r.position.location = None
+        if self.columnar:
+            self._records.update_locations(self._antennas)
+        else:
+            for r in self._records:
+                if r.position.antenna in self._antennas:
+                    r.position.location = self._antennas[r.position.antenna]
+                else:
+                    r.position.location = None
 
-        self.reset_cache()
+        # Cached groups of columnar records hold copies of the records
+        self._invalidate('records' if self.columnar else 'positions')
 
     @property
     def records(self):
@@ -224,20 +837,102 @@ class User(object):
 
     @records.setter
     def records(self, input):
-        self._records = sorted(input, key=lambda r: r.datetime)
+        self._set_records(sorted(input, key=lambda r: r.datetime))
+
+    def _set_records(self, records, flags=None):
+        """
+        Store a list of records already sorted by datetime. ``flags`` is an
+        optional ``(has_call, has_text, has_antennas)`` tuple, computed by
+        the caller to avoid another pass over the records.
+        """
+        self._records = records
+        if self.columnar:
+            self._records = ColumnarRecords(self._records)
+
         if len(self._records) > 0:
             self.start_time = self._records[0].datetime
             self.end_time = self._records[-1].datetime
 
-        # Reset all the states
-        self.has_call = False
-        self.has_text = False
-        self.has_antennas = False
-
         # Reset the cache query for groups of records
         self.reset_cache()
 
-        for r in self._records:
+        if flags is not None:
+            self.has_call, self.has_text, self.has_antennas = flags
+        else:
+            # Reset all the states
+            self.has_call = False
+            self.has_text = False
+            self.has_antennas = False
+
+            for r in self._records:
+                if r.interaction == 'text':
+                    self.has_text = True
+                elif r.interaction == 'call':
+                    self.has_call = True
+
+                if r.position.type() == 'antenna':
+                    self.has_antennas = True
+
+        self.recompute_home()
+
+    def append_records(self, records):
+        """
+        Add records to the user, such as the records of a new day, without
+        sorting and scanning all the records again.
+
+        Records must be sorted by datetime, and are merged with the
+        existing ones in linear time. As when loading a user, records with
+        missing or inconsistent fields are removed (see
+        :meth:`~bandicoot.io.filter_record`) and counted in
+        ``ignored_records``, and the location of the others is updated
+        from ``antennas``. The ``has_call``, ``has_text``, and
+        ``has_antennas`` flags and the home are updated from the new
+        records, and only the cached groups of the days, weeks, or months
+        they touch are computed again.
+
+        .. note:: Records are not deduplicated.
+
+        Examples
+        --------
+        >>> user = bc.read_csv('A', 'records/', describe=False)
+        >>> user.use_aggregates = True
+        >>> bc.utils.all(user)
+        >>> user.append_records(new_records)
+        >>> bc.utils.all(user)  # Only computes the last weeks again
+        """
+        batch, ignored, _ = bc.io.filter_record(records)
+        if ignored['all'] > 0:
+            counts = self.ignored_records or {}
+            self.ignored_records = dict(
+                (k, counts.get(k, 0) + v) for k, v in ignored.items())
+        if len(batch) == 0:
+            return
+        for previous, r in zip(batch, batch[1:]):
+            if r.datetime < previous.datetime:
+                raise ValueError("Records must be sorted by datetime.")
+
+        if len(self._antennas) > 0:
+            for r in batch:
+                r.position.location = self._antennas.get(r.position.antenna)
+
+        # Records are not modified in place, as they can be shared with
+        # copies of the user
+        start = len(self._records)
+        at_end = start == 0 or \
+            batch[0].datetime >= self._records[-1].datetime
+        if self.columnar:
+            self._records = self._records.merge(batch)
+        elif at_end:
+            self._records = self._records + batch
+        else:
+            # Timsort merges the two sorted runs in linear time
+            self._records = sorted(itertools.chain(self._records, batch),
+                                   key=attrgetter('datetime'))
+
+        self.start_time = self._records[0].datetime
+        self.end_time = self._records[-1].datetime
+
+        for r in batch:
             if r.interaction == 'text':
                 self.has_text = True
             elif r.interaction == 'call':
@@ -246,7 +941,13 @@ class User(object):
             if r.position.type() == 'antenna':
                 self.has_antennas = True
 
-        self.recompute_home()
+        if at_end and start > 0:
+            self._extend_home(start)
+        else:
+            self.recompute_home()
+
+        days = set(r.datetime.date() for r in batch)
+        self._invalidate_periods(days, start if at_end else None)
 
     def recompute_missing_neighbors(self):
         """
@@ -370,25 +1071,72 @@ class User(object):
         None is returned if there are no candidates for a home antenna
         """
 
+        # Bin positions by chunks of 30 minutes
+        candidates = list(
+            positions_binning(filter(self._night_filter(), self._records)))
+        counter = Counter(candidates)
+        last = candidates[-1] if candidates else None
+        self._home_candidates = ((self.night_start, self.night_end), counter,
+                                 last)
+        return self._elect_home(counter)
+
+    def _night_filter(self):
         if self.night_start < self.night_end:
-            night_filter = lambda r: self.night_end > r.datetime.time(
+            return lambda r: self.night_end > r.datetime.time(
             ) > self.night_start
         else:
-            night_filter = lambda r: not(
+            return lambda r: not(
                 self.night_end < r.datetime.time() < self.night_start)
 
-        # Bin positions by chunks of 30 minutes
-        candidates = list(
-            positions_binning(filter(night_filter, self._records)))
-
-        if len(candidates) == 0:
+    def _elect_home(self, counter):
+        if len(counter) == 0:
             self.home = None
         else:
-            self.home = Counter(candidates).most_common()[0][0]
+            self.home = counter.most_common()[0][0]
 
-        self.reset_cache()
         return self.home
 
+    def _extend_home(self, start):
+        """
+        Update the home after records were appended from the index
+        ``start``, by binning the positions of the new records, and again
+        the ones of the last chunk of 30 minutes.
+        """
+        settings = (self.night_start, self.night_end)
+        cached = getattr(self, '_home_candidates', None)
+        if cached is None or cached[0] != settings:
+            return self.recompute_home()
+
+        night_filter = self._night_filter()
+        _, counter, last = cached
+        records = self._records
+        appended = [r for r in (records[i] for i in range(start, len(records)))
+                    if night_filter(r)]
+        if len(appended) == 0:
+            return self.home
+
+        # Night records of the same chunk as the first new one
+        key = _chunk_key(appended[0].datetime)
+        last_chunk = []
+        for i in range(start - 1, -1, -1):
+            r = records[i]
+            if _chunk_key(r.datetime) != key:
+                break
+            if night_filter(r):
+                last_chunk.append(r)
+
+        if last_chunk:
+            # The candidate of the last chunk is binned again. Its key is
+            # kept, even with no occurrences, so that ties are broken in
+            # the order of first occurrence, as in recompute_home
+            counter[last] -= 1
+        for position in positions_binning(last_chunk[::-1] + appended):
+            counter[position] += 1
+            last = position
+
+        self._home_candidates = (settings, counter, last)
+        return self._elect_home(counter)
+
     @property
     def has_home(self):
         return self.home is not None
@@ -413,6 +1161,7 @@ class User(object):
     @recharges.setter
     def recharges(self, input):
         self._recharges = sorted(input, key=lambda r: r.datetime)
+        self._invalidate('recharges')
 
     def set_home(self, new_home):
         """
@@ -428,27 +1177,300 @@ class User(object):
         else:
             self.home = Position(antenna=new_home)
 
-        self.reset_cache()
-
     def _cached_grouping_query(self, query):
-        key = str(query)
+        """
+        Return the groups of records of a query, for all the combinations of
+        its parameters. Each combination is a scan, cached and shared with
+        the queries of other indicators (see
+        :meth:`~bandicoot.helper.group.query_scans`).
+        """
+        return [(params, self._cached_scan(scan))
+                for params, scan in query_scans(query)]
+
+    def _cached_scan(self, scan):
+        """
+        Return the groups of records of a scan, computed once even if
+        several threads need them at the same time.
+        """
+        return self._cached(scan, scan_tags(scan),
+                            lambda: grouping_scan(self, scan), scan_size)
+
+    def _aggregated_scan(self, f, scan, user_kwd, kwargs, keep):
+        """
+        Return the values of the indicator ``f`` for the groups of a scan,
+        by merging partial states (see
+        :meth:`~bandicoot.helper.aggregate.mergeable`): states are computed
+        for the days of each week in the same month, merged into weeks and
+        months, and months into years or the whole period. States are
+        cached, and shared by all the groupings of the scan and the
+        indicators with the same state function. They only keep
+        distributions, or their sketches, as given by ``keep`` (see
+        :meth:`~bandicoot.helper.maths.keep_distributions`).
+        """
+        state, finalize, defaults = f.partial_state
+        args = (self, ) if user_kwd else ()
+        state_kwargs = dict(defaults)
+        state_kwargs.update((k, v) for k, v in kwargs.items()
+                            if k in defaults)
+        tags = scan_tags(scan)
+
+        # States given the user may depend on its home or its nights
+        settings = (self.home, self.night_start, self.night_end) \
+            if user_kwd else None
+        prefix = ('states', state,
+                  scan._replace(groupby=None, filter_empty=True),
+                  tuple(sorted(state_kwargs.items())), settings, keep)
+        try:
+            hash(prefix)
+        except TypeError:
+            prefix = None
+
+        def period_states(groupby):
+            key = None if prefix is None else prefix + (groupby, )
+            if groupby in FINER_PERIODS:
+                finer = FINER_PERIODS[groupby]
+
+                def compute():
+                    return merge_periods(period_states(finer), finer, groupby,
+                                         self._stale(key))
+            else:
+                base = scan._replace(groupby=groupby, filter_empty=True)
+
+                def compute():
+                    known = self._stale(key)
+                    with keep_distributions(keep):
+                        return [(k, known[k] if k in known
+                                 else state(g, *args, **state_kwargs))
+                                for k, g in zip(self._scan_keys(base),
+                                                self._cached_scan(base))]
+
+            if key is None:
+                return compute()
+            # Sketches and counters are charged by their content
+            return self._cached(key, tags, compute, content_size)
+
+        def empty():
+            with keep_distributions(keep):
+                return state([], *args, **state_kwargs)
+
+        def compute(known):
+            states = pad_periods(period_states(scan.groupby), scan.groupby,
+                                 scan.filter_empty, empty)
+            return [(k, known[k] if k in known
+                     else finalize(s, *args, **kwargs))
+                    for k, s in zip(self._scan_keys(scan), states)]
+
+        return self._period_values(f, scan, kwargs, settings, keep, compute)
+
+    def _period_results(self, f, scan, user_kwd, kwargs, keep):
+        """
+        Return the values of the indicator ``f`` for the groups of a scan,
+        computed for each group.
+        """
+        args = (self, ) if user_kwd else ()
+        settings = (self.home, self.night_start, self.night_end) \
+            if user_kwd else None
+
+        def compute(known):
+            return [(k, known[k] if k in known else f(g, *args, **kwargs))
+                    for k, g in zip(self._scan_keys(scan),
+                                    self._cached_scan(scan))]
+
+        return self._period_values(f, scan, kwargs, settings, keep, compute)
+
+    def _period_values(self, f, scan, kwargs, settings, keep, compute):
+        """
+        Return the values of the indicator ``f`` for the groups of a scan,
+        cached for each period. ``compute(known)`` returns the ``(key,
+        value)`` pairs of the periods, given the values ``known`` of the
+        periods not touched by records appended since they were cached.
+        Distributions and sketches are copied, so that callers can not
+        modify the cached values.
+        """
+        key = ('results', f, scan._replace(groupby=None),
+               tuple(sorted(kwargs.items())), settings, keep, scan.groupby)
+        try:
+            hash(key)
+        except TypeError:
+            return [v for _, v in compute({})]
+
+        values = self._cached(key, scan_tags(scan),
+                              lambda: compute(self._stale(key)), content_size)
+        if keep:
+            return [copy.deepcopy(v) for _, v in values]
+        return [v for _, v in values]
+
+    def _scan_keys(self, scan):
+        """
+        Return the calendar keys of the groups of a scan (see
+        :meth:`~bandicoot.helper.group.scan_keys`).
+        """
+        return self._cached(('keys', scan), scan_tags(scan),
+                            lambda: scan_keys(self, scan), content_size)
 
+    def _stale(self, key):
+        """
+        Return the periods kept for a cached key after records were
+        appended, as a dictionary, and forget them.
+        """
+        if key is None:
+            return {}
+        with self._cache_lock:
+            periods = self._cache.pop(('stale', key))
+        return {} if periods is None else dict(periods)
+
+    def _invalidate_periods(self, days, start=None):
+        """
+        Remove the cached groups after records were added on ``days``.
+        Cached states and results are kept for the periods not touched by
+        these days, in the cache under the key ``('stale', key)``. If the
+        records were appended from the index ``start``, the cached columns
+        are extended instead of computed again.
+        """
+        with self._cache_lock:
+            entries = []
+            for key, value, tags in self._cache.items():
+                if not isinstance(key, tuple) or 'records' not in tags:
+                    continue
+                size = self._cache.size_of(key)
+                if key[0] == 'stale':
+                    entries.append((key[1], value, tags, size))
+                elif key[0] in ('states', 'results'):
+                    entries.append((key, value, tags, size))
+
+            # Values given the user are only kept for its current home
+            settings = (self.home, self.night_start, self.night_end)
+            touched = {}
+            stale = {}
+            for key, periods, tags, size in entries:
+                if key[4] is not None and key[4] != settings:
+                    continue
+                groupby = key[-1]
+                if groupby not in touched:
+                    touched[groupby] = touched_periods(days, groupby)
+                kept = [(k, v) for k, v in periods
+                        if k not in touched[groupby]]
+                if kept:
+                    # Kept periods are charged their share of the entry
+                    size = max(1, size * len(kept) // len(periods))
+                    stale[key] = (tags, kept, size)
+
+            self._cache.invalidate('records')
+            for key, (tags, kept, size) in stale.items():
+                self._cache.put(('stale', key), kept, tags=tags, size=size)
+            self._flights = dict(
+                (k, f) for k, f in self._flights.items()
+                if 'records' not in f.tags)
+            if start is None:
+                self._columns = dict(
+                    (k, v) for k, v in list(self._columns.items())
+                    if 'records' not in column_tags(k))
+            else:
+                extend_columns(self, 'records', start)
+
+    def _cached(self, key, tags, compute, size):
+        """
+        Return the cached value of ``key``, or store the value returned by
+        ``compute()``, of size ``size(value)``. The lock is only held to
+        access the cache: threads computing different values run
+        concurrently, and threads needing a value being computed wait for
+        it, or for its exception.
+        """
         with self._cache_lock:
             try:
-                entry = self._cache[key]
+                return self._cache.get(key)
             except KeyError:
-                entry = self._cache[key] = grouping_query(self, query)
-        return entry
+                pass
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                waiting = True
+            else:
+                waiting = False
+                flight = self._flights[key] = Flight(tags)
+
+        if waiting:
+            return flight.wait()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._cache_lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.set_error(e)
+            raise
+
+        with self._cache_lock:
+            # The value is not cached if the user changed in the meantime
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+                self._cache.put(key, value, tags=flight.tags,
+                                size=size(value))
+        flight.set_result(value)
+        return value
+
+    def _invalidate(self, *tags):
+        """
+        Remove the cached groups and columns depending on any of ``tags``
+        (see :meth:`~bandicoot.helper.group.scan_tags`).
+        """
+        tags = set(tags)
+        with self._cache_lock:
+            self._cache.invalidate(*tags)
+            self._flights = dict(
+                (k, f) for k, f in self._flights.items()
+                if tags.isdisjoint(f.tags))
+            self._columns = dict(
+                (k, v) for k, v in list(self._columns.items())
+                if tags.isdisjoint(column_tags(k)))
 
     def reset_cache(self):
         """
         Reset the cache used to groups records when computing indicators.
 
-        .. note:: The cache is automatically emptied when records, positions,
-            or recharges attributes are modified.
+        .. note:: The cache is automatically emptied when records are
+            modified. Changing positions, recharges, partitions, or the
+            weekend and night settings only removes the groups depending on
+            them.
+        """
+        with self._cache_lock:
+            self._cache.clear()
+            self._flights = {}
+            self._columns = {}
+
+    def cache_info(self):
+        """
+        Return the number of hits, misses, and evictions of the cache of
+        groups of records, its number of entries, and its current and
+        maximum size (see ``user.cache_max_records``).
+
+        The maximum size can be changed with ``user.cache_max_records``.
         """
         with self._cache_lock:
-            self._cache = {}
+            return self._cache.info()
+
+    @property
+    def cache_max_records(self):
+        """
+        Maximum size of the cache of groups of records (ten millions by
+        default), or None for an unbounded cache.
+
+        Groups count for their number of records, plus one per group. The
+        states, values, and calendar keys cached for each period count for the
+        number of objects they hold (see
+        :meth:`~bandicoot.helper.cache.content_size`), and the periods kept
+        after records are appended for their share of them. The values shared by
+        the indicators of a group (see
+        :meth:`~bandicoot.helper.group.shared`) are not counted, but each
+        group keeps a bounded number of them.
+        """
+        return self._cache.max_size
+
+    @cache_max_records.setter
+    def cache_max_records(self, value):
+        with self._cache_lock:
+            self._cache.resize(value)
 
 
 class Recharge(object):
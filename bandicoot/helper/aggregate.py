@@ -0,0 +1,211 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015-2016 Massachusetts Institute of Technology.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from collections import Counter
+from datetime import date
+import copy
+import numbers
+
+from bandicoot.helper.group import CALENDAR_KEYS
+
+
+def mergeable(state, finalize=None):
+    """
+    Decorator exposing the partial state of an indicator, to compute it from
+    the states of shorter periods (see :attr:`User.use_aggregates
+    <bandicoot.core.User.use_aggregates>`). It is applied below
+    :meth:`~bandicoot.helper.group.grouping`.
+
+    Parameters
+    ----------
+    state : function
+        Returns the state of a group of records, called as the indicator
+        with the keyword arguments it names. Indicators with the same state
+        function share their states. States are merged with
+        :meth:`merge_states`, and must not be modified.
+    finalize : function, optional
+        Returns the value of the indicator from a state, called with the
+        state instead of the records, and all the arguments of the
+        indicator. By default, the state is returned.
+
+    Examples
+    --------
+    >>> @grouping
+    ... @mergeable(lambda records: len(records))
+    ... def number_of_records(records):
+    ...     return len(records)
+    """
+    if finalize is None:
+        finalize = _identity
+
+    # Keyword arguments of the state, with their default values
+    code = state.__code__
+    parameters = code.co_varnames[:code.co_argcount]
+    defaults = state.__defaults__ or ()
+    defaults = dict(zip(parameters[len(parameters) - len(defaults):],
+                        defaults))
+
+    def decorator(f):
+        f.partial_state = (state, finalize, defaults)
+        return f
+
+    return decorator
+
+
+def _identity(state, *args, **kwargs):
+    # States are cached: indicators return a copy
+    return copy.deepcopy(state)
+
+
+def merge_states(states):
+    """
+    Merge a non-empty list of partial states into a new state, without
+    modifying them:
+
+    * Counters are added, keeping the keys of the first state first,
+    * sets are joined, and numbers are added,
+    * tuples are merged element by element,
+    * other objects are copied and merged with their ``merge`` method, as
+      :class:`~bandicoot.helper.maths.SummaryStats` or the sketches of
+      :mod:`~bandicoot.helper.maths`, half with half.
+    """
+    first = states[0]
+
+    if isinstance(first, Counter):
+        merged = Counter(first)
+        for s in states[1:]:
+            # Unlike +, update keeps the keys with a count of zero
+            merged.update(s)
+        return merged
+
+    if isinstance(first, (set, frozenset)):
+        return set().union(*states)
+
+    if isinstance(first, numbers.Number):
+        return sum(states[1:], first)
+
+    if isinstance(first, tuple):
+        return tuple(merge_states(list(column)) for column in zip(*states))
+
+    if hasattr(first, 'merge'):
+        return _merge_objects(states)
+
+    raise TypeError("{} states can not be merged."
+                    .format(type(first).__name__))
+
+
+def _merge_objects(states):
+    # Merge halves recursively, so that each value of a distribution is
+    # only merged a logarithmic number of times
+    if len(states) == 1:
+        return copy.deepcopy(states[0])
+
+    middle = len(states) // 2
+    merged = _merge_objects(states[:middle])
+    merged.merge(_merge_objects(states[middle:]))
+    return merged
+
+
+# The periods whose states are merged into the states of a period: weeks
+# and months from the days of a week in the same month, years and the whole
+# period from months. Other states are computed from the records.
+FINER_PERIODS = {
+    'week': 'weekmonth',
+    'month': 'weekmonth',
+    'year': 'month',
+    None: 'month'
+}
+
+_PERIOD_OF = {
+    ('weekmonth', 'week'): lambda k: CALENDAR_KEYS['week'](
+        date.fromordinal(k)),
+    ('weekmonth', 'month'): lambda k: CALENDAR_KEYS['month'](
+        date.fromordinal(k)),
+    ('month', 'year'): lambda k: k // 12,
+    ('month', None): lambda k: None
+}
+
+
+def merge_periods(periods, finer, groupby, known=None):
+    """
+    Merge the states of periods into the states of coarser periods.
+
+    Parameters
+    ----------
+    periods : list
+        A list of ``(key, state)`` pairs, sorted by the calendar key of
+        their period (see :meth:`~bandicoot.helper.group.calendar_keys`).
+    finer : str
+        The periods of ``periods``, as given by :data:`FINER_PERIODS`.
+    groupby : str or None
+        The periods to merge states into, as in
+        :meth:`~bandicoot.helper.group.group_records`, or None to merge all
+        the states.
+    known : dict, optional
+        The states of coarser periods already merged, such as the periods
+        not touched by new records (see :meth:`touched_periods`), which are
+        not merged again.
+    """
+    period_of = _PERIOD_OF[(finer, groupby)]
+    known = known or {}
+    merged = []
+    for k, s in periods:
+        k = period_of(k)
+        if merged and merged[-1][0] == k:
+            merged[-1][1].append(s)
+        else:
+            merged.append((k, [s]))
+    return [(k, known[k] if k in known else merge_states(states))
+            for k, states in merged]
+
+
+def touched_periods(days, groupby):
+    """
+    Return the calendar keys of the periods containing some of ``days``, as
+    given by :meth:`~bandicoot.helper.group.calendar_keys` for ``groupby``.
+    The whole period (``groupby=None``) is touched by any day.
+    """
+    if groupby is None:
+        return set([None]) if days else set()
+    key = CALENDAR_KEYS[groupby]
+    return set(key(d) for d in days)
+
+
+def pad_periods(periods, groupby='week', filter_empty=True, empty=None):
+    """
+    Return the states of periods and, if ``filter_empty`` is False, the
+    state ``empty()`` of each period without records, as the groups of
+    :meth:`~bandicoot.helper.group.group_records_with_padding`.
+    """
+    states = [s for _, s in periods]
+    if filter_empty:
+        return states
+    if groupby is None:
+        return states if len(states) > 0 else [empty()]
+
+    padded, previous = [], None
+    for k, s in periods:
+        if previous is not None:
+            padded.extend(empty() for _ in range(k - previous - 1))
+        padded.append(s)
+        previous = k
+    return padded
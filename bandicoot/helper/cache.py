@@ -0,0 +1,239 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015-2016 Massachusetts Institute of Technology.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from collections import namedtuple
+from numbers import Number
+from threading import Event
+from bandicoot.helper.tools import OrderedDict
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions',
+                                     'entries', 'size', 'max_size'])
+
+
+def content_size(value):
+    """
+    Return the size of a value in a cache, as its number of objects: one
+    for each number, string, or object, plus the items of containers and
+    the attributes of objects, recursively. Buffers, such as arrays, count
+    for one object per eight bytes.
+
+    Examples
+    --------
+    >>> content_size([(1, 'a'), (2, 'b')])
+    7
+    """
+    if value is None or isinstance(value, (Number, str, bytes)):
+        return 1
+    if isinstance(value, (bytearray, memoryview)) or \
+            hasattr(value, 'itemsize'):
+        return 1 + len(value) * getattr(value, 'itemsize', 1) // 8
+    if isinstance(value, dict):
+        return 1 + sum(content_size(k) + content_size(v)
+                       for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return 1 + sum(content_size(v) for v in value)
+
+    if hasattr(value, '__dict__'):
+        attributes = list(vars(value).values())
+    else:
+        attributes = []
+    for cls in type(value).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if hasattr(value, name):
+                attributes.append(getattr(value, name))
+    return 1 + sum(content_size(v) for v in attributes)
+
+
+class LRUCache(object):
+    """
+    A least recently used cache, bounded by the total size of its entries.
+
+    Each entry has a size, such as the number of records it stores, and a
+    set of tags naming what it depends on. When the total size exceeds
+    ``max_size``, the least recently used entries are evicted.
+    :meth:`invalidate` removes the entries depending on some tags.
+
+    The cache is not thread-safe: callers are expected to hold a lock.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        Maximum total size of the entries. The cache is unbounded if None.
+        The most recent entry is always kept, even if it is larger.
+
+    Examples
+    --------
+    >>> cache = LRUCache(max_size=10)
+    >>> cache.put('week', groups, tags=['records'], size=8)
+    >>> cache.get('week')
+    >>> cache.invalidate('records')
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        Return the value stored for ``key``, and mark it as the most
+        recently used. Raise a KeyError if the key is missing.
+        """
+        try:
+            entry = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            raise
+
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, tags=(), size=1):
+        """
+        Store ``value`` for ``key``, and evict the least recently used
+        entries if the cache is full.
+        """
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (value, frozenset(tags), size)
+        self.size += size
+        self._evict()
+
+    def invalidate(self, *tags):
+        """
+        Remove the entries depending on any of ``tags``, and return their
+        number.
+        """
+        tags = set(tags)
+        removed = [key for key, (_, entry_tags, _) in self._entries.items()
+                   if not tags.isdisjoint(entry_tags)]
+        for key in removed:
+            self._remove(key)
+        return len(removed)
+
+    def size_of(self, key):
+        """
+        Return the size of the entry of ``key``, without marking it as
+        used. Raise a KeyError if the key is missing.
+        """
+        return self._entries[key][2]
+
+    def pop(self, key, default=None):
+        """
+        Remove the entry of ``key`` and return its value, or ``default``
+        if the key is missing. Counters are not changed.
+        """
+        if key not in self._entries:
+            return default
+        value = self._entries[key][0]
+        self._remove(key)
+        return value
+
+    def items(self):
+        """
+        Return the ``(key, value, tags)`` of the entries, from the least
+        recently used, without marking them as used.
+        """
+        return [(key, value, tags)
+                for key, (value, tags, _) in self._entries.items()]
+
+    def clear(self):
+        """
+        Remove all the entries. Counters are kept.
+        """
+        self._entries = OrderedDict()
+        self.size = 0
+
+    def resize(self, max_size):
+        """
+        Change the maximum size, and evict entries if needed.
+        """
+        self.max_size = max_size
+        self._evict()
+
+    def info(self):
+        """
+        Return the counters of the cache, as a ``CacheInfo`` named tuple.
+        """
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         len(self._entries), self.size, self.max_size)
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.size -= size
+
+    def _evict(self):
+        if self.max_size is None:
+            return
+
+        while self.size > self.max_size and len(self._entries) > 1:
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+
+class Flight(object):
+    """
+    A value being computed by one thread, which other threads needing the
+    same value can wait for instead of computing it again.
+
+    Parameters
+    ----------
+    tags : iterable
+        The tags of the value, as in :class:`LRUCache`.
+    """
+
+    def __init__(self, tags=()):
+        self.tags = frozenset(tags)
+        self._event = Event()
+        self._value = None
+        self._error = None
+
+    def set_result(self, value):
+        self._value = value
+        self._event.set()
+
+    def set_error(self, error):
+        self._error = error
+        self._event.set()
+
+    def wait(self):
+        """
+        Wait for the computation to finish, and return its value, or raise
+        the exception it raised.
+        """
+        self._event.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
@@ -23,10 +23,20 @@
 from __future__ import division
 
 from functools import partial
-from datetime import timedelta
+from operator import attrgetter
+from collections import namedtuple
+from datetime import datetime, timedelta
+from bisect import bisect_right
+from array import array
 import itertools
 
-from bandicoot.helper.maths import mean, std, SummaryStats
+try:
+    from collections.abc import Sequence
+except ImportError:  # Python 2
+    from collections import Sequence
+
+from bandicoot.helper.maths import mean, std, SummaryStats, \
+    QuantileSketch, keep_distributions
 from bandicoot.helper.tools import advanced_wrap, AutoVivification, OrderedDict
 import numbers
 
@@ -39,9 +49,138 @@ DATE_GROUPERS = {
     "year": lambda d: d.year
 }
 
+# Integer ids of the calendar buckets, consecutive for consecutive buckets.
+# Weeks start on Monday, as ISO weeks: the ordinal of 0001-01-01 is 1, and
+# it was a Monday.
+CALENDAR_KEYS = {
+    "day": lambda d: d.toordinal(),
+    "week": lambda d: (d.toordinal() - 1) // 7,
+    "month": lambda d: d.year * 12 + d.month - 1,
+    "year": lambda d: d.year,
+    # The days of a week in the same month, identified by the ordinal of
+    # their first day. Ids are not consecutive, and the groups are only
+    # merged into weeks and months (see bandicoot.helper.aggregate).
+    "weekmonth": lambda d: d.toordinal() - min(d.weekday(), d.day - 1)
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+# Translation table swapping 0 and 1, to take the complement of a mask
+_COMPLEMENT = bytes(bytearray([1, 0] + list(range(2, 256))))
+
+
+def _intersect(a, b):
+    """
+    Intersect two masks of the same length.
+    """
+    try:
+        n = len(a)
+        return bytearray((int.from_bytes(bytes(a), 'little') &
+                          int.from_bytes(bytes(b), 'little')).to_bytes(n, 'little'))
+    except AttributeError:  # Python 2
+        return bytearray(x & y for x, y in zip(a, b))
+
+
+def _union(a, b):
+    """
+    Unite two masks of the same length.
+    """
+    try:
+        n = len(a)
+        return bytearray((int.from_bytes(bytes(a), 'little') |
+                          int.from_bytes(bytes(b), 'little')).to_bytes(n, 'little'))
+    except AttributeError:  # Python 2
+        return bytearray(x | y for x, y in zip(a, b))
+
+
+def _is_night(user):
+    night_start, night_end = user.night_start, user.night_end
+    if night_start < night_end:
+        return lambda r: night_end > r.datetime.time() > night_start
+    return lambda r: not(night_end < r.datetime.time() < night_start)
+
+
+def _compute_mask(user, using, records, dimension, value):
+    if dimension == 'interaction':
+        if value == 'callandtext':
+            # Derived from the masks of calls and texts, shared with other
+            # indicators
+            return _union(
+                _partition_mask(user, using, records, dimension, 'call'),
+                _partition_mask(user, using, records, dimension, 'text'))
+        return bytearray(r.interaction == value for r in records)
+
+    if dimension == 'part_of_week':
+        if value == 'weekday':
+            return _partition_mask(user, using, records, dimension,
+                                   'weekend').translate(_COMPLEMENT)
+        weekend = frozenset(user.weekend)
+        return bytearray(r.datetime.isoweekday() in weekend for r in records)
+
+    if dimension == 'part_of_day':
+        if value == 'day':
+            return _partition_mask(user, using, records, dimension,
+                                   'night').translate(_COMPLEMENT)
+        is_night = _is_night(user)
+        return bytearray(is_night(r) for r in records)
+
+    function = user.partitions[dimension]
+    return bytearray(function(r) == value for r in records)
+
+
+def _extension_mask(user, records, dimension, value):
+    """
+    Return the mask of a partition for records appended to the user, without
+    the masks of other partitions.
+    """
+    if dimension == 'interaction':
+        values = ('call', 'text') if value == 'callandtext' else (value, )
+        return bytearray(r.interaction in values for r in records)
+
+    if dimension == 'part_of_week':
+        weekend = frozenset(user.weekend)
+        expected = value == 'weekend'
+        return bytearray((r.datetime.isoweekday() in weekend) == expected
+                         for r in records)
+
+    if dimension == 'part_of_day':
+        is_night = _is_night(user)
+        expected = value == 'night'
+        return bytearray(is_night(r) == expected for r in records)
+
+    function = user.partitions[dimension]
+    return bytearray(function(r) == value for r in records)
+
+
+def _mask_settings(user, dimension):
+    if dimension == 'part_of_week':
+        return tuple(user.weekend)
+    elif dimension == 'part_of_day':
+        return (user.night_start, user.night_end)
+    return None
+
+
+def _partition_mask(user, using, records, dimension, value):
+    """
+    Return a mask with, for each record, 1 if it belongs to the partition
+    ``dimension=value`` and 0 otherwise.
+
+    Masks are cached with the user, for its current ``weekend``,
+    ``night_start`` and ``night_end`` settings, until its records change.
+    """
+    settings = _mask_settings(user, dimension)
+    columns = user._columns
+    key = ('mask', using, dimension, value, settings)
+    mask = columns.get(key)
+    if mask is None or len(mask) != len(records):
+        mask = columns[key] = _compute_mask(user, using, records, dimension,
+                                            value)
+    return mask
+
 
 def filter_user(user, using='records', interaction=None,
-                part_of_week='allweek', part_of_day='allday'):
+                part_of_week='allweek', part_of_day='allday', **partitions):
     """
     Filter records of a User objects by interaction, part of week and day.
 
@@ -64,45 +203,77 @@ def filter_user(user, using='records', interaction=None,
         * "callandtext", for only callandtext;
         * a string, to filter for one type;
         * None, to use all records.
+    **partitions
+        Values of the dimensions added with
+        :meth:`~bandicoot.core.User.add_partition`, or None to use all
+        records.
+
+    Notes
+    -----
+    Each partition is computed once per user as a mask, and combinations are
+    obtained by intersecting the masks.
     """
 
+    records, mask = _select(user, using, interaction, part_of_week,
+                            part_of_day, **partitions)
+    if mask is None:
+        return list(records)
+    return _compress(records, mask)
+
+
+def _select(user, using, interaction=None, part_of_week='allweek',
+            part_of_day='allday', **partitions):
+    """
+    Return the records (or recharges) of the user, and the mask of the ones
+    selected by :meth:`~bandicoot.helper.group.filter_user`, or None if all
+    of them are.
+    """
     if using == 'recharges':
         records = user.recharges
+        selection = []
     else:
         records = user.records
-        if interaction == 'callandtext':
-            records = filter(
-                lambda r: r.interaction in ['call', 'text'], records)
-        elif interaction is not None:
-            records = filter(lambda r: r.interaction == interaction, records)
-
-    if part_of_week == 'weekday':
-        records = filter(
-            lambda r: r.datetime.isoweekday() not in user.weekend, records)
-    elif part_of_week == 'weekend':
-        records = filter(
-            lambda r: r.datetime.isoweekday() in user.weekend, records)
-    elif part_of_week != 'allweek':
+        selection = [('interaction', interaction)]
+
+    if part_of_week not in ('allweek', 'weekday', 'weekend'):
         raise KeyError(
             "{} is not a valid value for part_of_week. it should be 'weekday', "
             "'weekend' or 'allweek'.".format(part_of_week))
-
-    if user.night_start < user.night_end:
-        night_filter = lambda r: user.night_end > r.datetime.time(
-        ) > user.night_start
-    else:
-        night_filter = lambda r: not(
-            user.night_end < r.datetime.time() < user.night_start)
-
-    if part_of_day == 'day':
-        records = filter(lambda r: not(night_filter(r)), records)
-    elif part_of_day == 'night':
-        records = filter(night_filter, records)
-    elif part_of_day != 'allday':
+    if part_of_day not in ('allday', 'day', 'night'):
         raise KeyError(
             "{} is not a valid value for part_of_day. It should be 'day', 'night' or 'allday'.".format(part_of_day))
+    for name in partitions:
+        if name not in user.partitions:
+            raise KeyError("{} is not a partition of the user.".format(name))
+
+    if part_of_week != 'allweek':
+        selection.append(('part_of_week', part_of_week))
+    if part_of_day != 'allday':
+        selection.append(('part_of_day', part_of_day))
+    selection.extend(sorted(partitions.items()))
+
+    masks = [_partition_mask(user, using, records, dimension, value)
+             for dimension, value in selection if value is not None]
+    if len(masks) == 0:
+        return records, None
 
-    return list(records)
+    mask = masks[0]
+    for other in masks[1:]:
+        mask = _intersect(mask, other)
+    if 0 not in mask:
+        return records, None
+    return records, mask
+
+
+def _compress(records, mask):
+    if isinstance(records, list):
+        return list(itertools.compress(records, mask))
+    return [records[i] for i in itertools.compress(range(len(records)), mask)]
+
+
+def _chunk_key(d):
+    # Chunks of 30 minutes, used to bin positions
+    return (d.year, d.month, d.day, d.hour, d.minute // 30)
 
 
 def positions_binning(records):
@@ -112,10 +283,7 @@ def positions_binning(records):
     If multiple positions have the same number of occurrences
     (during 30 minutes), we select the last one.
     """
-    def get_key(d):
-        return (d.year, d.month, d.day, d.hour, d.minute // 30)
-
-    chunks = itertools.groupby(records, key=lambda r: get_key(r.datetime))
+    chunks = itertools.groupby(records, key=lambda r: _chunk_key(r.datetime))
 
     for _, items in chunks:
         positions = [i.position for i in items]
@@ -158,55 +326,218 @@ def _group_range(records, method):
         d = increment(d)
 
 
-def group_records_with_padding(records, groupby='week'):
-    if groupby is None:
-        yield records
-        return
+class RecordGroup(Sequence):
+    """
+    A group of records, as given to indicator functions by
+    :meth:`~bandicoot.helper.group.grouping`: a view of the records
+    ``records[start:stop]``, which can be iterated or indexed as a list
+    without copying the records.
+
+    Records are sorted by datetime, so that each day, week, month, or year
+    of records is a contiguous range. Groups are cached with the user, and
+    the same group is given to all the indicators using the same records.
+    Intermediate results needed by several indicators are computed once
+    per group with :meth:`~bandicoot.helper.group.shared`.
+    """
 
-    if records == []:
-        return
+    __slots__ = ('records', 'start', 'stop', '_shared')
+
+    def __init__(self, records=(), start=0, stop=None):
+        if not hasattr(records, '__getitem__'):
+            records = list(records)
+        self.records = records
+        self.start = start
+        self.stop = len(records) if stop is None else stop
+        self._shared = {}
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        records = self.records
+        if self.start == 0 and self.stop == len(records):
+            return iter(records)
+
+        # Iterate over the range without copying it: list iterators can
+        # start at an index, and other records are accessed by index
+        iterator = iter(records)
+        if self.start == 0 or hasattr(iterator, '__setstate__'):
+            if self.start != 0:
+                iterator.__setstate__(self.start)
+            return itertools.islice(iterator, len(self))
+        return map(records.__getitem__, range(self.start, self.stop))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return RecordGroup(self.records, self.start + start,
+                                   self.start + max(start, stop))
+            return [self[i] for i in range(start, stop, step)]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return self.records[self.start + index]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, RecordGroup)):
+            return len(self) == len(other) and list(self) == list(other)
+        return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "RecordGroup(%i records)" % len(self)
+
+
+def _compute_calendar_keys(records, groupby):
+    key = CALENDAR_KEYS[groupby]
+    timestamps = getattr(records, 'timestamps', None)
+    if timestamps is None:
+        return array('l', [key(r.datetime) for r in records])
+
+    # Columnar records: compute the key once per day, from the timestamps
+    keys = array('l')
+    by_day = {}
+    for ts in timestamps:
+        day = ts // 86400
+        k = by_day.get(day)
+        if k is None:
+            k = by_day[day] = key(_EPOCH + timedelta(days=day))
+        keys.append(k)
+    return keys
+
+
+def calendar_keys(user, groupby='week', using='records'):
+    """
+    Return, for each record (or recharge) of the user, the id of its day,
+    week, month, or year. Ids of consecutive periods are consecutive
+    integers, and all the periods between the first and the last records
+    are ``range(keys[0], keys[-1] + 1)``.
 
-    _range = _group_range(records, groupby)
-    _fun = DATE_GROUPERS[groupby]
+    Keys are cached with the user until its records change.
+    """
+    records = user.recharges if using == 'recharges' else user.records
+    columns = user._columns
+    key = ('calendar', using, groupby)
+    keys = columns.get(key)
+    if keys is None or len(keys) != len(records):
+        keys = columns[key] = _compute_calendar_keys(records, groupby)
+    return keys
 
-    # Ad hoc grouping with padding
-    pointer = next(_range)
-    for key, chunk in itertools.groupby(records, key=lambda r: _fun(r.datetime)):
-        chunk = list(chunk)
 
-        while _fun(pointer) < key:
-            yield []
-            pointer = next(_range)
+def _buckets(keys):
+    """
+    Yield the key, start, and end of each run of equal keys.
+    """
+    i, n = 0, len(keys)
+    while i < n:
+        key = keys[i]
+        j = bisect_right(keys, key, i)
+        yield key, i, j
+        i = j
+
+
+def group_records_with_padding(records, groupby='week', keys=None):
+    """
+    Group records as :meth:`~bandicoot.helper.group.group_records`, with
+    an empty list for each period without records between the first and
+    the last records.
+    """
+    if groupby is None:
+        yield RecordGroup(records)
+        return
+
+    if len(records) == 0:
+        return
 
-        yield chunk
+    if keys is None:
+        keys = _compute_calendar_keys(records, groupby)
 
-        try:
-            pointer = next(_range)
-        except StopIteration as e:
-            pass
+    previous = None
+    for key, start, end in _buckets(keys):
+        if previous is not None:
+            for _ in range(key - previous - 1):
+                yield RecordGroup(records, start, start)
+        yield RecordGroup(records, start, end)
+        previous = key
 
 
-def group_records(records, groupby='week'):
+def group_records(records, groupby='week', keys=None):
     """
-    Group records by year, month, week, or day.
+    Group records by year, month, week, or day. Groups are
+    :class:`~bandicoot.helper.group.RecordGroup` views of ``records``.
 
     Parameters
     ----------
-    records : iterator
-        An iterator over records
+    records : list
+        A list of records, sorted by datetime
 
     groupby : Default is 'week':
         * 'week': group all records by year and week
         * None: records are not grouped. This is useful if you don't want to
           divide records in chunks
         * "day", "month", and "year" also accepted
+
+    keys : sequence, optional
+        The keys of the records, as returned by
+        :meth:`~bandicoot.helper.group.calendar_keys`. They are computed if
+        not given.
+    """
+    if not hasattr(records, '__getitem__'):
+        records = list(records)
+    if groupby is None:
+        if len(records) > 0:
+            yield RecordGroup(records)
+        return
+
+    if keys is None:
+        keys = _compute_calendar_keys(records, groupby)
+
+    for _, start, end in _buckets(keys):
+        yield RecordGroup(records, start, end)
+
+
+# Maximum number of values shared by the indicators of a group
+SHARED_MAX_VALUES = 16
+
+
+def shared(records, function, *args):
+    """
+    Return ``function(records, *args)``, computed only once for each
+    :class:`~bandicoot.helper.group.RecordGroup`. The returned value is
+    shared between indicators, and must not be modified. Each group keeps
+    at most ``SHARED_MAX_VALUES`` values, the oldest ones being removed.
+
+    Examples
+    --------
+    >>> def _contacts(records):
+    ...     return Counter(r.correspondent_id for r in records)
+    >>> @grouping
+    ... def number_of_contacts(records):
+    ...     return len(shared(records, _contacts))
     """
+    try:
+        cache = records._shared
+    except AttributeError:
+        return function(records, *args)
 
-    def _group_date(records, _fun):
-        for _, chunk in itertools.groupby(records, key=lambda r: _fun(r.datetime)):
-            yield list(chunk)
+    key = (function, args)
+    try:
+        return cache[key]
+    except KeyError:
+        pass
 
-    return _group_date(records, DATE_GROUPERS[groupby])
+    value = function(records, *args)
+    if len(cache) >= SHARED_MAX_VALUES:
+        cache.pop(next(iter(cache), None), None)
+    cache[key] = value
+    return value
 
 
 def infer_type(data):
@@ -259,6 +590,11 @@ def statistics(data, summary='default', datatype=None):
     Given a list of ``SummaryStats`` tuples, the function will
     returns the mean, standard error of the mean, min and max for each attribute
     of the tuples.
+
+    With ``summary='sketch'``, the distribution is returned as a
+    :class:`~bandicoot.helper.maths.QuantileSketch`, which is exported
+    compactly, and can be merged with the sketches of other users. The
+    distributions of all groups are merged in a single sketch.
     """
 
     def _default_stats(agg):
@@ -271,9 +607,29 @@ def statistics(data, summary='default', datatype=None):
             return OrderedDict([('mean', mean(agg)), ('std', std(agg))])
 
     def _stats_dict(v):
-        rv = [(key, _default_stats([getattr(s, key, None) for s in data])) for key in v]
+        # Read all the attributes of each SummaryStats object at once, and
+        # aggregate them by column
+        getter = attrgetter(*v)
+        missing = (None, ) * len(v)
+        rows = [getter(s) if s is not None else missing for s in data]
+        columns = list(zip(*rows)) if rows else [[]] * len(v)
+        rv = [(key, _default_stats(list(c))) for key, c in zip(v, columns)]
         return OrderedDict(rv)
 
+    def _sketch(s):
+        if s.sketch is not None:
+            return s.sketch
+        sketch = QuantileSketch()
+        sketch.extend(s.distribution or [])
+        return sketch
+
+    def _merged_sketch(items):
+        sketch = QuantileSketch()
+        for s in items:
+            if s is not None:
+                sketch.merge(_sketch(s))
+        return sketch
+
     summary_keys = {
         'default': ['mean', 'std'],
         'extended': ['mean', 'std', 'median', 'skewness', 'kurtosis', 'min', 'max']
@@ -288,6 +644,8 @@ def statistics(data, summary='default', datatype=None):
     if datatype == 'summarystats':
         if summary is None:
             return data.distribution
+        elif summary == 'sketch':
+            return _sketch(data)
         elif summary in ['default', 'extended']:
             rv = [(key, getattr(data, key, None)) for key in summary_keys[summary]]
             return OrderedDict(rv)
@@ -299,12 +657,18 @@ def statistics(data, summary='default', datatype=None):
             return _default_stats(data)
         elif summary is None:
             return data
+        elif summary == 'sketch':
+            sketch = QuantileSketch()
+            sketch.extend(x for x in data if x is not None)
+            return sketch
         else:
             raise ValueError("{} is not a valid summary type".format(summary))
 
     if datatype == 'distribution_summarystats':
         if summary is None:
             return [item.distribution for item in data]
+        elif summary == 'sketch':
+            return _merged_sketch(data)
         elif summary in ['extended', 'default']:
             return _stats_dict(summary_keys[summary])
         else:
@@ -318,41 +682,329 @@ def _ordereddict_product(dicts):
             itertools.product(*dicts.values())]
 
 
-def grouping_query(user, query):
-    # Filter records for all possible combinations of parameters
+class Scan(namedtuple('Scan', ['using', 'binning', 'groupby', 'filter_empty',
+                               'params'])):
+    """
+    One combination of parameters of a query (see
+    :meth:`~bandicoot.helper.group.query_scans`), whose groups are computed
+    and cached once for all the indicators needing them. ``params`` is a
+    tuple of ``(dimension, value)`` pairs.
+    """
+    __slots__ = ()
+
+
+def query_scans(query):
+    """
+    Return the combinations of parameters of a query, as a list of
+    ``(params, scan)`` pairs, where ``params`` is an OrderedDict and
+    ``scan`` a :class:`~bandicoot.helper.group.Scan`. Queries of different
+    indicators share the scans of their common combinations.
+    """
     combinations = _ordereddict_product(query['divide_by'])
-    params_groups = [(p, filter_user(user, using=query['using'], **p))
-                     for p in combinations]
+    return [(p, Scan(query['using'], query['binning'], query['groupby'],
+                     query['filter_empty'], tuple(p.items())))
+            for p in combinations]
+
+
+def _binned_positions(user, using, params):
+    """
+    Return the positions of the records selected by ``params``, binned by
+    chunks of 30 minutes as in :meth:`positions_binning`, and the index of
+    the first record of each chunk.
+
+    Chunks never overlap two days, so that the records are binned once for
+    all parts of the week: the bins of weekdays and weekends are selected
+    from the bins of the whole week. Bins are cached with the user.
+    """
+    base = tuple((k, v) for k, v in params if k != 'part_of_week')
+    records, mask = _select(user, using, **dict(base))
+
+    if dict(base).get('part_of_day', 'allday') != 'allday':
+        settings = (user.night_start, user.night_end)
+    else:
+        settings = None
+
+    columns = user._columns
+    key = ('bins', using, base, settings)
+    cached = columns.get(key)
+    if cached is not None and cached[0] == len(records):
+        return cached[1], cached[2]
+
+    positions, first = [], array('l')
+    _bin_positions(records, mask, 0, positions, first)
+    columns[key] = (len(records), positions, first)
+    return positions, first
+
+
+def _bin_positions(records, mask, start, positions, first):
+    """
+    Bin the positions of the records selected by ``mask`` from the index
+    ``start``, and append them to ``positions``, and the index of the first
+    record of each chunk to ``first``.
+    """
+    indices = range(start, len(records))
+    if mask is not None:
+        indices = itertools.compress(indices, itertools.islice(mask, start,
+                                                               None))
+
+    for _, chunk in itertools.groupby(
+            indices, key=lambda i: _chunk_key(records[i].datetime)):
+        chunk = list(chunk)
+        chunk_positions = [records[i].position for i in chunk]
+        positions.append(max(chunk_positions, key=chunk_positions.count))
+        first.append(chunk[0])
+
+
+def extend_columns(user, using, start):
+    """
+    Update the columns cached by the user (masks, calendar keys, and bins)
+    after records were appended from the index ``start``. Masks and
+    calendar keys are extended with the ones of the new records, and
+    positions are binned again from the last chunk.
+    """
+    records = user.recharges if using == 'recharges' else user.records
+    appended = [records[i] for i in range(start, len(records))]
+    columns = user._columns
+
+    def extend(key, column):
+        if key[0] == 'calendar':
+            column.extend(_compute_calendar_keys(appended, key[2]))
+            return True
+
+        if key[0] == 'mask':
+            dimension, value, settings = key[2:]
+            if settings != _mask_settings(user, dimension) or \
+                    dimension not in _BUILTIN_DIMENSIONS and \
+                    dimension not in user.partitions:
+                return False
+            column.extend(_extension_mask(user, appended, dimension, value))
+            return True
+
+        # Bins depend on masks, extended first
+        length, positions, first = column
+        _, base, settings = key[1:]
+        if length != start or len(first) == 0 or \
+                settings not in (None, (user.night_start, user.night_end)):
+            return False
+        _, mask = _select(user, using, **dict(base))
+        last = first[-1]
+        positions.pop()
+        first.pop()
+        _bin_positions(records, mask, last, positions, first)
+        columns[key] = (len(records), positions, first)
+        return True
+
+    order = {'calendar': 0, 'mask': 0, 'bins': 1}
+    keys = sorted((k for k in columns if k[1] == using),
+                  key=lambda k: order[k[0]])
+    for key in keys:
+        column = columns[key]
+        if key[0] != 'bins' and len(column) != start or \
+                not extend(key, column):
+            del columns[key]
+
+
+def _scan_items(user, scan):
+    """
+    Return the records of a scan, or their binned positions if
+    ``scan.binning`` is True, and their calendar keys (None if
+    ``scan.groupby`` is None).
+    """
+    using, groupby = scan.using, scan.groupby
+
+    if scan.binning is True:
+        positions, first = _binned_positions(user, using, scan.params)
+        part_of_week = dict(scan.params).get('part_of_week', 'allweek')
+        if part_of_week != 'allweek':
+            records = user.recharges if using == 'recharges' else user.records
+            mask = _partition_mask(user, using, records, 'part_of_week',
+                                   part_of_week)
+            selected = [j for j, i in enumerate(first) if mask[i]]
+            positions = [positions[j] for j in selected]
+            first = [first[j] for j in selected]
+
+        keys = None
+        if groupby:
+            all_keys = calendar_keys(user, groupby, using)
+            keys = [all_keys[i] for i in first]
+        return positions, keys
+
+    keys = calendar_keys(user, groupby, using) if groupby else None
+    records, mask = _select(user, using, **dict(scan.params))
+    if mask is None:
+        # Groups are views of the records of the user, which are only
+        # copied if stored in columns
+        if not isinstance(records, list):
+            records = list(records)
+    else:
+        # Select the calendar keys with the same mask
+        if keys is not None:
+            keys = list(itertools.compress(keys, mask))
+        records = _compress(records, mask)
+
+    return records, keys
 
+
+def grouping_scan(user, scan):
+    """
+    Return the groups of records of a scan, or the groups of their binned
+    positions if ``scan.binning`` is True.
+    """
     # Group records by week, month, etc.
-    if query['filter_empty']:
+    if scan.filter_empty:
         agg_function = group_records
     else:
         agg_function = group_records_with_padding
 
-    def select_function(g):
-        if query['binning'] is True:
-            return [list(positions_binning(r)) for r in g]
-        else:
-            return [r for r in g]
+    items, keys = _scan_items(user, scan)
+    groups = agg_function(items, scan.groupby, keys=keys)
+    if scan.binning is True:
+        return [list(g) for g in groups]
+    return list(groups)
+
+
+def scan_keys(user, scan):
+    """
+    Return the calendar keys of the groups of a scan (see
+    :meth:`calendar_keys`), or ``[None]`` for the group of a scan without
+    ``groupby``.
+    """
+    items, keys = _scan_items(user, scan)
+    if scan.groupby is None:
+        return [None] if len(items) > 0 or not scan.filter_empty else []
+    if len(keys) == 0:
+        return []
+    if scan.filter_empty:
+        return [k for k, _, _ in _buckets(keys)]
+    return list(range(keys[0], keys[-1] + 1))
+
+
+def grouping_query(user, query):
+    """
+    Return the groups of records of a query, for all the combinations of its
+    parameters, without caching them.
+    """
+    return [(p, grouping_scan(user, scan)) for p, scan in query_scans(query)]
+
+
+_BUILTIN_DIMENSIONS = {
+    'interaction': None,
+    'part_of_week': 'weekend',
+    'part_of_day': 'night'
+}
+
+
+def _dimension_tags(dimension):
+    if dimension in _BUILTIN_DIMENSIONS:
+        tag = _BUILTIN_DIMENSIONS[dimension]
+        return [tag] if tag is not None else []
+    # User-defined partitions may depend on the location of records
+    return ['partition:' + dimension, 'positions']
+
+
+def _params_tags(params):
+    defaults = {'part_of_week': 'allweek', 'part_of_day': 'allday'}
+    tags = set()
+    for dimension, value in params:
+        if value != defaults.get(dimension):
+            tags.update(_dimension_tags(dimension))
+    return tags
+
+
+def scan_tags(scan):
+    """
+    Return the tags of what the groups of a scan depend on, to invalidate
+    them in the cache of the user:
+
+    * 'records' or 'recharges', for the records used,
+    * 'positions', for the locations of records (binned scans),
+    * 'weekend' and 'night', for the settings of split scans,
+    * 'partition:<name>' for each user-defined partition.
+    """
+    tags = set([scan.using])
+    if scan.binning:
+        tags.add('positions')
+    tags.update(_params_tags(scan.params))
+    return tags
 
-    groupby = query['groupby']
-    groups = [(p, select_function(agg_function(g, groupby)))
-              for p, g in params_groups]
 
-    return groups
+def column_tags(key):
+    """
+    Return the tags of a column (mask, calendar keys, or bins) cached by the
+    user.
+    """
+    tags = set([key[1]])
+    if key[0] == 'mask':
+        tags.update(_dimension_tags(key[2]))
+    elif key[0] == 'bins':
+        tags.add('positions')
+        tags.update(_params_tags(key[2]))
+    return tags
+
+
+def scan_size(groups):
+    """
+    Return the size of the groups of a scan in the cache: the number of
+    records (or positions) in its groups, plus one per group.
+    """
+    return sum(len(g) + 1 for g in groups)
+
+
+def indicator_queries(function, **kwargs):
+    """
+    Return the grouping queries of an indicator called with ``kwargs``,
+    without calling it. Queries are given by the ``grouping_query``
+    attribute of the indicators decorated with :meth:`grouping`,
+    :meth:`spatial_grouping`, or :meth:`recharges_grouping`, and keywords
+    bound with :func:`functools.partial` are included. Indicators not
+    grouping records have no queries.
+
+    Examples
+    --------
+    >>> indicator_queries(bc.individual.number_of_contacts, groupby=None)
+    [{'using': 'records', 'binning': False, 'groupby': None, ...}]
+    """
+    if isinstance(function, partial):
+        kwargs = dict(kwargs, **function.keywords)
+        function = function.func
+
+    query = getattr(function, 'grouping_query', None)
+    if query is None:
+        return []
+    return [query(**kwargs)]
+
+
+def _grouping_query(using, binning, groupby, filter_empty, split_week,
+                    split_day, interaction, split_by):
+    return {
+        'using': using,
+        'binning': binning,
+        'groupby': groupby,
+        'filter_empty': filter_empty,
+        'divide_by': divide_parameters(split_week, split_day, interaction,
+                                       split_by)
+    }
 
 
 def _generic_wrapper(f, user, operations, datatype):
+    # Groups are shared with other indicators, and are not copied
     def compute_indicator(g):
         if operations['apply']['user_kwd']:
-            return f(list(g), user, **operations['apply']['kwargs'])
+            return f(g, user, **operations['apply']['kwargs'])
         else:
-            return f(list(g), **operations['apply']['kwargs'])
+            return f(g, **operations['apply']['kwargs'])
+
+    def apply_to(groups):
+        return lambda: [compute_indicator(g) for g in groups]
+
+    # Distributions are only needed if they are returned
+    summary = operations['apply']['summary']
+    keep = 'sketch' if summary == 'sketch' else summary is None
 
     def map_and_apply(params_combinations):
-        for params, groups in params_combinations:
-            results = [compute_indicator(g) for g in groups]
+        for params, compute in params_combinations:
+            with keep_distributions(keep):
+                results = compute()
 
             if operations['grouping']['groupby'] is None:
                 results = results[0] if len(results) != 0 else None
@@ -363,15 +1015,33 @@ def _generic_wrapper(f, user, operations, datatype):
             yield list(params.values()), stats
 
     query = operations['grouping']
-    groups = user._cached_grouping_query(query)
+    if user.use_aggregates and hasattr(f, 'partial_state'):
+        # Merge the partial states of the days of each group. States keep
+        # the distributions needed for the median of extended summaries.
+        keep_states = keep or summary == 'extended'
+        combinations = [
+            (params, partial(user._aggregated_scan, f, scan,
+                             operations['apply']['user_kwd'],
+                             operations['apply']['kwargs'], keep_states))
+            for params, scan in query_scans(query)]
+    elif user.use_aggregates:
+        # Values cached for each period
+        combinations = [
+            (params, partial(user._period_results, f, scan,
+                             operations['apply']['user_kwd'],
+                             operations['apply']['kwargs'], keep))
+            for params, scan in query_scans(query)]
+    else:
+        combinations = [(params, apply_to(groups)) for params, groups
+                        in user._cached_grouping_query(query)]
 
     returned = AutoVivification()
-    for params, stats in map_and_apply(groups):
+    for params, stats in map_and_apply(combinations):
         returned.insert(params, stats)
     return returned
 
 
-def divide_parameters(split_week, split_day, interaction):
+def divide_parameters(split_week, split_day, interaction, split_by=None):
     if isinstance(interaction, str):
         interaction = [interaction]
 
@@ -383,17 +1053,18 @@ def divide_parameters(split_week, split_day, interaction):
     if split_week:
         part_of_week += ['weekday', 'weekend']
 
+    parameters = OrderedDict([
+        ('part_of_week', part_of_week),
+        ('part_of_day', part_of_day)
+    ])
     if interaction:
-        return OrderedDict([
-            ('part_of_week', part_of_week),
-            ('part_of_day', part_of_day),
-            ('interaction', interaction)
-        ])
-    else:
-        return OrderedDict([
-            ('part_of_week', part_of_week),
-            ('part_of_day', part_of_day)
-        ])
+        parameters['interaction'] = interaction
+
+    # User-defined partitions, see User.add_partition
+    for name, values in (split_by or {}).items():
+        parameters[name] = list(values)
+
+    return parameters
 
 
 def grouping(f=None, interaction=['call', 'text'], summary='default',
@@ -412,13 +1083,20 @@ def grouping(f=None, interaction=['call', 'text'], summary='default',
     interaction : 'call', 'text', 'location', or a list
         By default, all indicators use only 'call' and 'text' records, but the
         interaction keywords filters the records passed to the function.
-    summary: 'default', 'extended', None
+    summary: 'default', 'extended', 'sketch', None
         An indicator returns data statistics, ether *mean* and *std* by
-        default, more with 'extended', or the inner distribution with None.
+        default, more with 'extended', the inner distribution with None, or
+        a sketch of its quantiles with 'sketch'.
         See :meth:`~bandicoot.helper.group.statistics` for more details.
 
+    The decorated function accepts a ``split_by`` argument, a dictionary
+    mapping the partitions added with
+    :meth:`~bandicoot.core.User.add_partition` to the list of their values
+    to compute the indicator for.
+
     See :ref:`new-indicator-label` to learn how to write an indicator with
-    this decorator.
+    this decorator. The records given to the decorated function are shared
+    between indicators, and must not be modified.
 
     """
 
@@ -426,29 +1104,28 @@ def grouping(f=None, interaction=['call', 'text'], summary='default',
         return partial(grouping, user_kwd=user_kwd, interaction=interaction,
                        summary=summary)
 
-    def wrapper(user, groupby='week', interaction=interaction, summary=summary,
-                split_week=False, split_day=False, filter_empty=True,
-                datatype=None, **kwargs):
-
+    def query(groupby='week', interaction=interaction, split_week=False,
+              split_day=False, filter_empty=True, split_by=None, **kwargs):
         if interaction is None:
             interaction = ['call', 'text']
-        parameters = divide_parameters(split_week, split_day, interaction)
+        return _grouping_query('records', False, groupby, filter_empty,
+                               split_week, split_day, interaction, split_by)
+
+    def wrapper(user, groupby='week', interaction=interaction, summary=summary,
+                split_week=False, split_day=False, filter_empty=True,
+                datatype=None, split_by=None, **kwargs):
 
         operations = {
-            'grouping': {
-                'using': 'records',
-                'binning': False,
-                'groupby': groupby,
-                'filter_empty': filter_empty,
-                'divide_by': parameters
-            }, 'apply': {
+            'grouping': query(groupby, interaction, split_week, split_day,
+                              filter_empty, split_by),
+            'apply': {
                 'user_kwd': user_kwd,
                 'summary': summary,
                 'kwargs': kwargs
             }
         }
 
-        for i in parameters['interaction']:
+        for i in operations['grouping']['divide_by']['interaction']:
             if i not in ['callandtext', 'call', 'text', 'location']:
                 raise ValueError("%s is not a valid interaction value. Only "
                                  "'call', 'text', and 'location' are accepted."
@@ -456,7 +1133,9 @@ def grouping(f=None, interaction=['call', 'text'], summary='default',
 
         return _generic_wrapper(f, user, operations, datatype)
 
-    return advanced_wrap(f, wrapper)
+    decorated = advanced_wrap(f, wrapper)
+    decorated.grouping_query = query
+    return decorated
 
 
 def spatial_grouping(f=None, user_kwd=False, summary='default',
@@ -465,18 +1144,20 @@ def spatial_grouping(f=None, user_kwd=False, summary='default',
         return partial(spatial_grouping, user_kwd=user_kwd, summary=summary,
                        time_binning=time_binning)
 
+    def query(groupby='week', split_week=False, split_day=False,
+              filter_empty=True, split_by=None, **kwargs):
+        return _grouping_query('records', time_binning, groupby,
+                               filter_empty, split_week, split_day, None,
+                               split_by)
+
     def wrapper(user, groupby='week', summary=summary, split_week=False,
-                split_day=False, filter_empty=True, datatype=None, **kwargs):
+                split_day=False, filter_empty=True, datatype=None,
+                split_by=None, **kwargs):
 
-        parameters = divide_parameters(split_week, split_day, None)
         operations = {
-            'grouping': {
-                'using': 'records',
-                'binning': time_binning,
-                'groupby': groupby,
-                'filter_empty': filter_empty,
-                'divide_by': parameters
-            }, 'apply': {
+            'grouping': query(groupby, split_week, split_day, filter_empty,
+                              split_by),
+            'apply': {
                 'user_kwd': user_kwd,
                 'summary': summary,
                 'kwargs': kwargs
@@ -484,27 +1165,28 @@ def spatial_grouping(f=None, user_kwd=False, summary='default',
         }
         return _generic_wrapper(f, user, operations, datatype)
 
-    return advanced_wrap(f, wrapper)
+    decorated = advanced_wrap(f, wrapper)
+    decorated.grouping_query = query
+    return decorated
 
 
 def recharges_grouping(f=None, summary='default', user_kwd=False):
     if f is None:
         return partial(grouping, user_kwd=user_kwd, summary=summary)
 
+    def query(groupby='week', split_week=False, split_day=False,
+              filter_empty=True, split_by=None, **kwargs):
+        return _grouping_query('recharges', False, groupby, filter_empty,
+                               split_week, split_day, None, split_by)
+
     def wrapper(user, groupby='week', summary=summary,
                 split_week=False, split_day=False, filter_empty=True,
-                datatype=None, **kwargs):
-
-        parameters = divide_parameters(split_week, split_day, None)
+                datatype=None, split_by=None, **kwargs):
 
         operations = {
-            'grouping': {
-                'using': 'recharges',
-                'binning': False,
-                'groupby': groupby,
-                'filter_empty': filter_empty,
-                'divide_by': parameters
-            }, 'apply': {
+            'grouping': query(groupby, split_week, split_day, filter_empty,
+                              split_by),
+            'apply': {
                 'user_kwd': user_kwd,
                 'summary': summary,
                 'kwargs': kwargs
@@ -513,4 +1195,6 @@ def recharges_grouping(f=None, summary='default', user_kwd=False):
 
         return _generic_wrapper(f, user, operations, datatype)
 
-    return advanced_wrap(f, wrapper)
+    decorated = advanced_wrap(f, wrapper)
+    decorated.grouping_query = query
+    return decorated
@@ -21,8 +21,60 @@
 # SOFTWARE.
 
 from __future__ import division
+from contextlib import contextmanager
+from functools import partial
+from collections import OrderedDict
+import itertools
+import threading
+import hashlib
+import base64
+import struct
+import bisect
+import heapq
+import json
 import math
 
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, and only used for long lists
+    np = None
+
+
+# Minimum number of values for which NumPy is used: converting short lists
+# to arrays costs more than the pure Python loops.
+NUMPY_THRESHOLD = 32
+
+
+def _use_numpy(data):
+    return np is not None and len(data) >= NUMPY_THRESHOLD
+
+
+def _central_moments(data):
+    """
+    Return the mean, and the second, third, and fourth central moments of
+    ``data`` in a single pass. The pure Python implementation gives the
+    same results as :meth:`moment`.
+    """
+    n = len(data)
+    _mean = mean(data)
+    if n <= 1:
+        return _mean, 0, 0, 0
+
+    if _use_numpy(data):
+        deviations = np.fromiter(data, dtype=float, count=len(data)) - _mean
+        squares = deviations * deviations
+        return (_mean, float(squares.sum()) / n,
+                float((squares * deviations).sum()) / n,
+                float((squares * squares).sum()) / n)
+
+    m2 = m3 = m4 = 0
+    for item in data:
+        deviation = item - _mean
+        m2 += deviation ** 2
+        m3 += deviation ** 3
+        m4 += deviation ** 4
+    return _mean, float(m2) / n, float(m3) / n, float(m4) / n
+
 
 def mean(data):
     """
@@ -49,10 +101,10 @@ def kurtosis(data):
     if len(data) == 0:
         return None
 
-    num = moment(data, 4)
-    denom = moment(data, 2) ** 2.
+    _, m2, _, m4 = _central_moments(data)
+    denom = m2 ** 2.
 
-    return num / denom if denom != 0 else 0
+    return m4 / denom if denom != 0 else 0
 
 
 def skewness(data):
@@ -63,10 +115,10 @@ def skewness(data):
     if len(data) == 0:
         return None
 
-    num = moment(data, 3)
-    denom = moment(data, 2) ** 1.5
+    _, m2, m3, _ = _central_moments(data)
+    denom = m2 ** 1.5
 
-    return num / denom if denom != 0 else 0.
+    return m3 / denom if denom != 0 else 0.
 
 
 def std(data):
@@ -82,6 +134,10 @@ def moment(data, n):
         return 0
 
     _mean = mean(data)
+    if _use_numpy(data):
+        deviations = np.fromiter(data, dtype=float, count=len(data)) - _mean
+        return float((deviations ** n).sum()) / len(data)
+
     return float(sum([(item - _mean) ** n for item in data])) / len(data)
 
 
@@ -104,7 +160,10 @@ def median(data):
     if len(data) == 0:
         return None
 
-    data = sorted(data)
+    return _sorted_median(sorted(data))
+
+
+def _sorted_median(data):
     return float((data[len(data) // 2] + data[(len(data) - 1) // 2]) / 2.)
 
 
@@ -122,6 +181,578 @@ def maximum(data):
     return float(max(data))
 
 
+_local = threading.local()
+
+
+@contextmanager
+def keep_distributions(keep=True):
+    """
+    Context manager setting whether :meth:`summary_stats` keeps the
+    distribution in the current thread, when not told explicitly.
+    Distributions are kept by default. With ``keep='sketch'``, a
+    :class:`QuantileSketch` of the distribution is kept instead.
+
+    Examples
+    --------
+    >>> with keep_distributions(False):
+    ...     summary_stats([0, 1]).distribution is None
+    True
+    """
+    previous = getattr(_local, 'keep_distribution', True)
+    _local.keep_distribution = keep
+    try:
+        yield
+    finally:
+        _local.keep_distribution = previous
+
+
+class QuantileSketch(object):
+    """
+    A mergeable sketch of a numeric distribution, estimating its quantiles
+    with a bounded error in a bounded memory (KLL sketch, by Karnin, Lang,
+    and Liberty).
+
+    Values are stored in a hierarchy of compactors. When a compactor is
+    full, its values are sorted, and every other value is promoted to the
+    next level, where it stands for two values. Compactions alternate
+    between odd and even values, so that the sketch of a given sequence is
+    reproducible. With the default ``k=200``, the sketch keeps less than
+    ``3 * k`` values, and the rank of an estimated quantile is typically
+    within 2% of the requested one.
+
+    Two sketches with the same ``k`` can be merged, for instance to compute
+    the quantiles of an indicator over several weeks or several users.
+
+    Parameters
+    ----------
+    k : int
+        Size of the largest compactor, trading accuracy for memory.
+
+    Examples
+    --------
+    >>> sketch = QuantileSketch()
+    >>> sketch.extend(range(1000))
+    >>> sketch.median
+    500
+    >>> other = QuantileSketch.from_dict(sketch.to_dict())
+    >>> sketch.merge(other)
+    >>> sketch.count
+    2000
+    """
+    __slots__ = ['k', 'count', 'min', 'max', '_levels', '_compactions']
+
+    def __init__(self, k=200):
+        self.k = k
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._levels = [[]]
+        self._compactions = 0
+
+    def __repr__(self):
+        return "QuantileSketch(k=%r, count=%r)" % (self.k, self.count)
+
+    def __str__(self):
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+    def __len__(self):
+        return sum(len(items) for items in self._levels)
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.to_dict() == other.to_dict()
+        return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def _capacity(self, level):
+        depth = len(self._levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2. / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self._levels):
+                    self._levels.append([])
+                items.sort()
+
+                # With an odd number of values, the last one stays
+                leftover = [items.pop()] if len(items) % 2 else []
+                offset = self._compactions % 2
+                self._compactions += 1
+                self._levels[level + 1].extend(items[offset::2])
+                self._levels[level] = leftover
+            level += 1
+
+    def push(self, value):
+        """
+        Add a value to the sketch.
+        """
+        self.extend([value])
+
+    def extend(self, values):
+        """
+        Add the values of an iterable to the sketch.
+        """
+        level_0 = self._levels[0]
+        for value in values:
+            if self.count == 0:
+                self.min = self.max = value
+            elif value < self.min:
+                self.min = value
+            elif value > self.max:
+                self.max = value
+            self.count += 1
+            level_0.append(value)
+
+            if len(level_0) >= self._capacity(0):
+                self._compress()
+                level_0 = self._levels[0]
+
+    def merge(self, other):
+        """
+        Add the values of another sketch, with the same ``k``.
+        """
+        if other.k != self.k:
+            raise ValueError("Sketches with different sizes ({} and {}) can "
+                             "not be merged.".format(self.k, other.k))
+        if other.count == 0:
+            return
+
+        if self.count == 0:
+            self.min, self.max = other.min, other.max
+        else:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.count += other.count
+
+        while len(self._levels) < len(other._levels):
+            self._levels.append([])
+        for items, other_items in zip(self._levels, other._levels):
+            items.extend(other_items)
+        self._compress()
+
+    def quantile(self, q):
+        """
+        Return an estimate of the ``q``-th quantile, for ``q`` between 0 and
+        1, or None if the sketch is empty. The estimate is one of the
+        values added to the sketch.
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("{} is not a valid quantile.".format(q))
+        if self.count == 0:
+            return None
+        if q == 0:
+            return self.min
+        if q == 1:
+            return self.max
+
+        weighted = sorted((value, 2 ** level)
+                          for level, items in enumerate(self._levels)
+                          for value in items)
+        total = sum(weight for _, weight in weighted)
+        target = q * total
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return self.max
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+    def to_dict(self):
+        """
+        Return the state of the sketch as a dictionary, which can be
+        serialized to JSON and loaded with :meth:`from_dict`.
+        """
+        return OrderedDict([('k', self.k), ('count', self.count),
+                            ('min', self.min), ('max', self.max),
+                            ('levels', [list(items) for items in
+                                        self._levels]),
+                            ('compactions', self._compactions)])
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Create a sketch from the dictionary returned by :meth:`to_dict`.
+        """
+        sketch = cls(state['k'])
+        sketch.count = state['count']
+        sketch.min = state['min']
+        sketch.max = state['max']
+        sketch._levels = [list(items) for items in state['levels']]
+        # The parity of compactions selects the items kept by the next one
+        sketch._compactions = state.get('compactions', 0)
+        return sketch
+
+
+try:
+    _digest = partial(hashlib.blake2b, digest_size=8)
+except AttributeError:  # Python 2
+    _digest = hashlib.md5
+
+
+def _hash64(item):
+    """
+    Return a 64 bits hash of ``item``, computed from its string
+    representation. Unlike ``hash``, it is the same in all processes.
+    """
+    digest = _digest(str(item).encode('utf-8')).digest()
+    return struct.unpack('>Q', digest[:8])[0]
+
+
+class HyperLogLog(object):
+    """
+    A mergeable sketch estimating the number of distinct items in a stream
+    in a fixed memory (HyperLogLog, by Flajolet et al.).
+
+    The sketch stores ``2 ** p`` registers of one byte. The relative
+    standard error of the estimate is ``1.04 / sqrt(2 ** p)``, that is
+    1.6% with the default ``p=12``, whatever the number of items. Small
+    cardinalities, below a few thousands, are estimated with linear
+    counting, and are usually exact.
+
+    Items are hashed from their string representation, so that sketches
+    computed in different processes can be merged.
+
+    Parameters
+    ----------
+    p : int
+        Precision of the sketch, between 4 and 16.
+
+    Examples
+    --------
+    >>> sketch = HyperLogLog()
+    >>> sketch.update(['A', 'B', 'A'])
+    >>> int(round(sketch.cardinality()))
+    2
+    """
+    __slots__ = ['p', 'registers']
+
+    def __init__(self, p=12):
+        if not 4 <= p <= 16:
+            raise ValueError("{} is not a valid precision.".format(p))
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def __repr__(self):
+        return "HyperLogLog(p=%r)" % self.p
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.p == other.p and self.registers == other.registers
+        return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    @property
+    def relative_error(self):
+        """
+        Relative standard error of the estimated cardinality.
+        """
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, item):
+        """
+        Add an item to the sketch.
+        """
+        self.update([item])
+
+    def update(self, items):
+        """
+        Add the items of an iterable to the sketch.
+        """
+        p, registers = self.p, self.registers
+        width = 64 - p
+        mask = (1 << width) - 1
+        for item in items:
+            x = _hash64(item)
+            index = x >> width
+            # Position of the leftmost 1-bit in the remaining bits
+            rank = width - (x & mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other):
+        """
+        Add the items of another sketch, with the same precision.
+        """
+        if other.p != self.p:
+            raise ValueError("Sketches with different precisions ({} and {}) "
+                             "can not be merged.".format(self.p, other.p))
+        self.registers = bytearray(max(a, b) for a, b in
+                                   zip(self.registers, other.registers))
+
+    def cardinality(self):
+        """
+        Return the estimated number of distinct items.
+        """
+        m = len(self.registers)
+        zeros = self.registers.count(b'\x00')
+        if zeros == m:
+            return 0.
+
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2. ** -r for r in self.registers)
+        if estimate <= 2.5 * m and zeros > 0:
+            return m * math.log(m / zeros)
+        return estimate
+
+    def to_dict(self):
+        """
+        Return the state of the sketch as a dictionary, which can be
+        serialized to JSON and loaded with :meth:`from_dict`.
+        """
+        registers = base64.b64encode(bytes(self.registers)).decode('ascii')
+        return OrderedDict([('p', self.p), ('registers', registers)])
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Create a sketch from the dictionary returned by :meth:`to_dict`.
+        """
+        sketch = cls(state['p'])
+        sketch.registers = bytearray(base64.b64decode(state['registers']))
+        return sketch
+
+
+class SpaceSaving(object):
+    """
+    A mergeable sketch of the most frequent items of a stream, and of their
+    number of occurrences (Space-Saving, by Metwally et al.).
+
+    The sketch counts at most ``k`` items. When it is full, a new item
+    replaces the item with the smallest count, and inherits its count as
+    an error. Counts are thus overestimated by at most ``total / k``, and
+    every item occurring more than ``total / k`` times is kept. Counts are
+    exact as long as there are at most ``k`` distinct items.
+
+    Parameters
+    ----------
+    k : int
+        Maximum number of items counted.
+
+    Examples
+    --------
+    >>> sketch = SpaceSaving(k=2)
+    >>> sketch.extend(['A', 'B', 'A', 'C', 'A'])
+    >>> sketch.top()
+    [('A', 3, 0), ('C', 2, 1)]
+    """
+    __slots__ = ['k', 'total', '_counts', '_heap', '_order']
+
+    def __init__(self, k=200):
+        self.k = k
+        self.total = 0
+        # Count and error of each item, and a heap of (count, order, item)
+        # entries to find the smallest count, updated lazily
+        self._counts = {}
+        self._heap = []
+        self._order = itertools.count()
+
+    def __repr__(self):
+        return "SpaceSaving(k=%r, total=%r)" % (self.k, self.total)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.to_dict() == other.to_dict()
+        return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        other = self.from_dict(state)
+        for attr in self.__slots__:
+            setattr(self, attr, getattr(other, attr))
+
+    @property
+    def min_count(self):
+        """
+        Upper bound of the count of the items which are not in the sketch.
+        """
+        if len(self._counts) < self.k:
+            return 0
+        return min(count for count, _ in self._counts.values())
+
+    @property
+    def error_bound(self):
+        """
+        Upper bound of the overestimation of any count, ``total / k``.
+        """
+        return self.total / self.k
+
+    def update(self, item, count=1):
+        """
+        Add ``count`` occurrences of an item.
+        """
+        self.total += count
+        entry = self._counts.get(item)
+        if entry is not None:
+            entry[0] += count
+            return
+
+        heap = self._heap
+        if len(self._counts) < self.k:
+            self._counts[item] = [count, 0]
+            heapq.heappush(heap, (count, next(self._order), item))
+            return
+
+        # Refresh the outdated entries until the smallest count is found
+        while True:
+            smallest, _, victim = heap[0]
+            current = self._counts[victim][0]
+            if current == smallest:
+                break
+            heapq.heapreplace(heap, (current, next(self._order), victim))
+
+        del self._counts[victim]
+        self._counts[item] = [smallest + count, smallest]
+        heapq.heapreplace(heap, (smallest + count, next(self._order), item))
+
+    def extend(self, items):
+        """
+        Add one occurrence of each item of an iterable.
+        """
+        for item in items:
+            self.update(item)
+
+    def merge(self, other):
+        """
+        Add the items of another sketch, with the same ``k``. An item
+        missing from a full sketch is counted with the smallest count of
+        this sketch, as an error.
+        """
+        if other.k != self.k:
+            raise ValueError("Sketches with different sizes ({} and {}) can "
+                             "not be merged.".format(self.k, other.k))
+
+        counts = OrderedDict()
+        for sketch, missing in [(self, other.min_count),
+                                (other, self.min_count)]:
+            for item, count, error in sketch.top():
+                if item not in counts:
+                    counts[item] = [missing, missing]
+                counts[item][0] += count
+                counts[item][1] += error
+
+        kept = sorted(counts.items(), key=lambda x: -x[1][0])[:self.k]
+        self._rebuild(self.total + other.total,
+                      [(item, c, e) for item, (c, e) in kept])
+
+    def _rebuild(self, total, items):
+        self.total = total
+        self._counts = dict((item, [c, e]) for item, c, e in items)
+        self._order = itertools.count()
+        self._heap = [(c, next(self._order), item) for item, c, _ in items]
+        heapq.heapify(self._heap)
+
+    def top(self, n=None):
+        """
+        Return the ``n`` most frequent items, or all the items of the
+        sketch, as ``(item, count, error)`` tuples sorted by decreasing
+        count. The true count of an item is between ``count - error`` and
+        ``count``.
+        """
+        items = sorted(self._counts.items(), key=lambda x: -x[1][0])
+        return [(item, c, e) for item, (c, e) in items[:n]]
+
+    def _split(self, distinct=None):
+        """
+        Return the guaranteed counts of the items of the sketch, the number
+        of remaining occurrences, and the number of remaining items, among
+        which they are assumed to be evenly distributed.
+        """
+        head = [c - e for c, e in self._counts.values() if c > e]
+        tail = self.total - sum(head)
+        if tail == 0:
+            return head, 0, 0
+
+        if distinct is not None:
+            tail_items = int(round(distinct)) - len(head)
+        else:
+            tail_items = int(math.ceil(tail / max(self.min_count, 1)))
+        return head, tail, max(tail_items, 1)
+
+    def pareto(self, percentage, distinct=None):
+        """
+        Estimate the number of items accounting for ``percentage`` of the
+        occurrences, given the estimated number of ``distinct`` items.
+
+        Items are counted from their guaranteed counts, ``count - error``.
+        The remaining occurrences are assumed to be evenly distributed
+        among the remaining items. The estimate is exact if there are at
+        most ``k`` distinct items.
+        """
+        head, tail, tail_items = self._split(distinct)
+        target = math.ceil(self.total * percentage)
+
+        # Counts, and the number of items with this count
+        counts = [(c, 1) for c in head]
+        if tail > 0:
+            counts.append((tail / tail_items, tail_items))
+        counts.sort(key=lambda x: -x[0])
+
+        n = 0
+        for count, items in counts:
+            if target <= 0:
+                break
+            needed = min(items, int(math.ceil(target / count)))
+            target -= needed * count
+            n += needed
+        return n
+
+    def entropy(self, distinct=None):
+        """
+        Estimate the Shannon entropy of the items, given the estimated
+        number of ``distinct`` items, with the same assumptions as
+        :meth:`pareto`.
+        """
+        head, tail, tail_items = self._split(distinct)
+        if tail == 0:
+            return entropy(head)
+
+        total = self.total
+        rv = - sum(c / total * math.log(c / total) for c in head)
+        return rv - tail / total * math.log(tail / total / tail_items)
+
+    def to_dict(self):
+        """
+        Return the state of the sketch as a dictionary, which can be
+        serialized to JSON and loaded with :meth:`from_dict`.
+        """
+        return OrderedDict([('k', self.k), ('total', self.total),
+                            ('items', [list(x) for x in self.top()])])
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Create a sketch from the dictionary returned by :meth:`to_dict`.
+        """
+        sketch = cls(state['k'])
+        sketch._rebuild(state['total'], [tuple(x) for x in state['items']])
+        return sketch
+
+
 class SummaryStats(object):
     """
     Data structure storing a numeric distribution.
@@ -129,6 +760,13 @@ class SummaryStats(object):
     .. note:: You can generate a *SummaryStats* object using the
               :meth:`~bandicoot.helper.maths.summary_stats` function.
 
+    A *SummaryStats* object is also an accumulator: values can be added one
+    at a time with :meth:`push`, and two objects can be combined with
+    :meth:`merge`, updating the moments in a single pass (Welford's method,
+    generalized to the third and fourth moments by Terriberry and Pebay).
+    The median is only known if the distribution is kept, and estimated if
+    a sketch of the distribution is kept instead.
+
     Attributes
     ----------
     mean : float
@@ -146,12 +784,31 @@ class SummaryStats(object):
     kurtosis : float
         The kurtosis of the distribution, measuring its "peakedness"
     distribution : list
-        The complete distribution, as a list of floats
+        The complete distribution, as a sorted list of floats, or None if
+        it is not kept
+    sketch : QuantileSketch
+        A sketch of the distribution, or None if it is not kept
+    count : int
+        The number of values of the distribution
+
+    Examples
+    --------
+    >>> s = SummaryStats(distribution=[])
+    >>> for value in [0, 1, 2]:
+    ...     s.push(value)
+    >>> s.merge(summary_stats([3, 4]))
+    >>> s.mean, s.median
+    (2.0, 2.0)
     """
     __slots__ = ['mean', 'std', 'min', 'max', 'median',
-                 'skewness', 'kurtosis', 'distribution']
+                 'skewness', 'kurtosis', 'distribution', 'count', '_moments',
+                 'sketch']
+
+    _fields = __slots__[:8]
 
-    def __init__(self, mean, std, min, max, median, skewness, kurtosis, distribution):
+    def __init__(self, mean=None, std=None, min=None, max=None, median=None,
+                 skewness=None, kurtosis=None, distribution=None, count=0,
+                 moments=(0., 0., 0.), sketch=None):
         self.mean = mean
         self.std = std
         self.min = min
@@ -160,47 +817,213 @@ class SummaryStats(object):
         self.skewness = skewness
         self.kurtosis = kurtosis
         self.distribution = distribution
+        self.count = count
+        # Sums of the 2nd, 3rd, and 4th powers of deviations from the mean
+        self._moments = moments
+        self.sketch = sketch
 
     def __repr__(self):
-        attrs = ["%s=%r" % (x, getattr(self, x)) for x in self.__slots__]
+        attrs = ["%s=%r" % (x, getattr(self, x)) for x in self._fields]
         return "SummaryStats(" + ", ".join(attrs) + ")"
 
     def __eq__(self, other):
-        if isinstance(other, self.__class__) and self.__slots__ == other.__slots__:
-            return all(getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
+        if isinstance(other, self.__class__):
+            return all(getattr(self, attr) == getattr(other, attr) for attr in self._fields)
         return False
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def _check_accumulator(self):
+        if self.count == 0 and self.mean is not None:
+            raise ValueError("SummaryStats objects created from statistics, "
+                             "without count, can not be updated.")
+
+    def push(self, value):
+        """
+        Add a value to the distribution.
+        """
+        self._check_accumulator()
+        n1 = self.count
+        n = self.count = n1 + 1
+        m2, m3, m4 = self._moments
+
+        mean = self.mean if n1 > 0 else 0.
+        delta = value - mean
+        delta_n = delta / n
+        delta_n2 = delta_n * delta_n
+        term = delta * delta_n * n1
+
+        self.mean = mean + delta_n
+        self._moments = (
+            m2 + term,
+            m3 + term * delta_n * (n - 2) - 3 * delta_n * m2,
+            m4 + term * delta_n2 * (n * n - 3 * n + 3) +
+            6 * delta_n2 * m2 - 4 * delta_n * m3)
+
+        self.min = float(value) if n1 == 0 else min(self.min, float(value))
+        self.max = float(value) if n1 == 0 else max(self.max, float(value))
+        if self.distribution is not None:
+            bisect.insort(self.distribution, value)
+        if self.sketch is not None:
+            self.sketch.push(value)
+        self._update()
+
+    def merge(self, other):
+        """
+        Add the values of another *SummaryStats* object. The distribution,
+        or its sketch, is only kept if both objects keep it.
+        """
+        self._check_accumulator()
+        other._check_accumulator()
+        self._merge_sketch(other)
+        if other.count == 0:
+            if other.distribution is None:
+                self.distribution = None
+            self._update()
+            return
+
+        if self.count == 0:
+            distribution = self.distribution
+            for attr in ['mean', 'min', 'max', 'count', '_moments']:
+                setattr(self, attr, getattr(other, attr))
+            self.distribution = None
+            if distribution is not None and other.distribution is not None:
+                self.distribution = list(other.distribution)
+            self._update()
+            return
 
-def summary_stats(data):
+        na, nb = self.count, other.count
+        n = na + nb
+        a2, a3, a4 = self._moments
+        b2, b3, b4 = other._moments
+        delta = other.mean - self.mean
+        delta2 = delta * delta
+
+        self.mean = self.mean + delta * nb / n
+        self._moments = (
+            a2 + b2 + delta2 * na * nb / n,
+            a3 + b3 + delta2 * delta * na * nb * (na - nb) / (n * n) +
+            3 * delta * (na * b2 - nb * a2) / n,
+            a4 + b4 + delta2 * delta2 * na * nb * (na * na - na * nb + nb * nb) /
+            (n * n * n) + 6 * delta2 * (na * na * b2 + nb * nb * a2) / (n * n) +
+            4 * delta * (na * b3 - nb * a3) / n)
+        self.count = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+        if self.distribution is not None and other.distribution is not None:
+            # Sorting the two sorted runs merges them in linear time
+            self.distribution = sorted(self.distribution + other.distribution)
+        else:
+            self.distribution = None
+        self._update()
+
+    def _merge_sketch(self, other):
+        if self.sketch is None or other.sketch is None:
+            self.sketch = None
+        else:
+            self.sketch.merge(other.sketch)
+
+    def _update(self):
+        n = self.count
+        if n == 0:
+            self.mean = self.std = self.min = self.max = None
+            self.median = self.skewness = self.kurtosis = None
+            return
+
+        m2, m3, m4 = [m / n for m in self._moments]
+        self.std = m2 ** 0.5
+        self.skewness = m3 / m2 ** 1.5 if m2 ** 1.5 != 0 else 0.
+        self.kurtosis = m4 / m2 ** 2. if m2 ** 2. != 0 else 0
+        self.median = None
+        if self.distribution is not None:
+            self.median = _sorted_median(self.distribution)
+        elif self.sketch is not None:
+            self.median = float(self.sketch.median)
+
+
+def _select_median(data):
+    """
+    Return the median of ``data``, selecting the middle values with NumPy
+    if available instead of sorting the data.
+    """
+    if not _use_numpy(data):
+        return _sorted_median(sorted(data))
+
+    n = len(data)
+    middle = sorted(set([n // 2, (n - 1) // 2]))
+    values = np.partition(np.fromiter(data, dtype=float, count=n), middle)
+    return float((values[n // 2] + values[(n - 1) // 2]) / 2.)
+
+
+def summary_stats(data, keep_distribution=None):
     """
     Returns a :class:`~bandicoot.helper.maths.SummaryStats` object
     containing statistics on the given distribution.
 
+    Parameters
+    ----------
+    data : list
+        The values of the distribution.
+    keep_distribution : bool or 'sketch', optional
+        Store the sorted values in the ``distribution`` attribute. By
+        default, they are kept unless disabled with
+        :meth:`keep_distributions`. Otherwise, the data is not sorted.
+        With 'sketch', a :class:`QuantileSketch` of the values is stored in
+        the ``sketch`` attribute instead.
+
     Examples
     --------
     >>> summary_stats([0, 1])
     SummaryStats(mean=0.5, std=0.5, min=0.0, max=1.0, median=0.5, skewness=0.0, kurtosis=1.0, distribution=[0, 1])
     """
 
+    if keep_distribution is None:
+        keep_distribution = getattr(_local, 'keep_distribution', True)
+
     if data is None:
         data = []
-    data = sorted(data)
+
+    sketch = None
+    if keep_distribution == 'sketch':
+        keep_distribution = False
+        sketch = QuantileSketch()
+
+    if keep_distribution:
+        data = sorted(data)
+    elif not isinstance(data, list):
+        data = list(data)
+
+    if sketch is not None:
+        sketch.extend(data)
 
     if len(data) < 1:
-        return SummaryStats(None, None, None, None, None, None, None, [])
+        return SummaryStats(distribution=[] if keep_distribution else None,
+                            sketch=sketch)
 
-    _median = median(data)
+    # Statistics are computed from the moments, in one pass over the values
+    if keep_distribution:
+        _median = _sorted_median(data)
+        _minimum = float(data[0])
+        _maximum = float(data[-1])
+        _distribution = data
+    else:
+        _median = _select_median(data)
+        _minimum = minimum(data)
+        _maximum = maximum(data)
+        _distribution = None
 
-    _mean = mean(data)
-    _std = std(data)
-    _minimum = minimum(data)
-    _maximum = maximum(data)
-    _kurtosis = kurtosis(data)
-    _skewness = skewness(data)
-    _distribution = data
+    n = len(data)
+    _mean, m2, m3, m4 = _central_moments(data)
+    _std = m2 ** 0.5
+    _skewness = m3 / m2 ** 1.5 if m2 ** 1.5 != 0 else 0.
+    _kurtosis = m4 / m2 ** 2. if m2 ** 2. != 0 else 0
 
     return SummaryStats(_mean, _std, _minimum, _maximum,
-                        _median, _skewness, _kurtosis, _distribution)
+                        _median, _skewness, _kurtosis, _distribution,
+                        count=n, moments=(m2 * n, m3 * n, m4 * n),
+                        sketch=sketch)
 
 
 def entropy(data):
@@ -213,6 +1036,11 @@ def entropy(data):
 
     n = sum(data)
 
+    if _use_numpy(data):
+        frequencies = np.fromiter(data, dtype=float, count=len(data)) / n
+        if frequencies.min() > 0:
+            return - float((frequencies * np.log(frequencies)).sum())
+
     _op = lambda f: f * math.log(f)
     return - sum(_op(float(i) / n) for i in data)
 
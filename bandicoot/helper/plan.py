@@ -0,0 +1,174 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015-2016 Massachusetts Institute of Technology.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from bandicoot.helper.group import query_scans, indicator_queries, \
+    calendar_keys, _partition_mask
+from bandicoot.helper.tools import OrderedDict
+
+
+_DEFAULTS = {'interaction': None, 'part_of_week': 'allweek',
+             'part_of_day': 'allday'}
+
+
+def _format_params(params):
+    return ' '.join('{}={}'.format(k, v) for k, v in params)
+
+
+class QueryPlan(object):
+    """
+    The grouping work needed to compute a set of indicators for a user.
+
+    The queries of the indicators are divided into scans, one for each
+    combination of their parameters (see
+    :meth:`~bandicoot.helper.group.query_scans`). Each scan is computed once
+    and shared by all the indicators needing it, even if their queries
+    differ, for instance by their interactions. Scans themselves are built
+    from a minimal set of partition masks and calendar keys, computed once
+    per user, and binned scans of weekdays and weekends are derived from
+    the bins of the whole week.
+
+    Use :meth:`from_indicators` to plan the indicators of
+    :meth:`~bandicoot.utils.all`, :meth:`execute` to compute the scans in
+    the cache of the user, and :meth:`explain` to display the plan.
+
+    Examples
+    --------
+    >>> plan = bc.utils.plan(user, split_week=True)
+    >>> print(plan.explain())
+    >>> plan.execute(user)
+    """
+
+    def __init__(self):
+        self.indicators = OrderedDict()
+        self.scans = OrderedDict()
+
+    def add(self, name, query):
+        """
+        Add the grouping query of an indicator to the plan.
+        """
+        scans = self.indicators.setdefault(name, [])
+        for _, scan in query_scans(query):
+            scans.append(scan)
+            names = self.scans.setdefault(scan, [])
+            if name not in names:
+                names.append(name)
+
+    @classmethod
+    def from_indicators(cls, user, indicators, **kwargs):
+        """
+        Plan the indicators given as ``(name, function)`` pairs, called
+        with the user and ``kwargs``. The indicators are not computed:
+        their queries are given by
+        :meth:`~bandicoot.helper.group.indicator_queries`.
+        """
+        plan = cls()
+        for name, function in indicators:
+            for query in indicator_queries(function, **kwargs):
+                plan.add(name, query)
+        return plan
+
+    @property
+    def masks(self):
+        """
+        The partition masks needed by the scans, as ``(using, dimension,
+        value)`` tuples. Masks of weekdays and days are complements of the
+        masks of weekends and nights, and the mask of 'callandtext' is the
+        union of the masks of calls and texts.
+        """
+        masks = OrderedDict()
+        for scan in self.scans:
+            for dimension, value in scan.params:
+                if dimension in _DEFAULTS and value == _DEFAULTS[dimension]:
+                    continue
+                if value == 'callandtext':
+                    masks[(scan.using, dimension, 'call')] = True
+                    masks[(scan.using, dimension, 'text')] = True
+                masks[(scan.using, dimension, value)] = True
+        return list(masks)
+
+    @property
+    def calendar_keys(self):
+        """
+        The calendar keys needed by the scans, as ``(using, groupby)``
+        tuples.
+        """
+        keys = OrderedDict(((scan.using, scan.groupby), True)
+                           for scan in self.scans if scan.groupby is not None)
+        return list(keys)
+
+    @property
+    def bins(self):
+        """
+        The binned positions needed by the scans, as ``(using, params)``
+        tuples, where params exclude the part of the week.
+        """
+        bins = OrderedDict()
+        for scan in self.scans:
+            if scan.binning is True:
+                params = tuple((k, v) for k, v in scan.params
+                               if k != 'part_of_week')
+                bins[(scan.using, params)] = True
+        return list(bins)
+
+    def execute(self, user):
+        """
+        Compute the masks, calendar keys, and scans of the plan, and store
+        them in the cache of the user. Indicators computed afterwards read
+        their groups from the cache.
+        """
+        for using, dimension, value in self.masks:
+            records = user.recharges if using == 'recharges' else user.records
+            _partition_mask(user, using, records, dimension, value)
+        for using, groupby in self.calendar_keys:
+            calendar_keys(user, groupby, using)
+        for scan in self.scans:
+            user._cached_scan(scan)
+
+    def explain(self):
+        """
+        Return a description of the plan: the masks, calendar keys, and
+        bins computed, and each scan with the indicators using it.
+        """
+        requested = sum(len(s) for s in self.indicators.values())
+        lines = ["{} indicators, {} combinations requested, {} scans".format(
+            len(self.indicators), requested, len(self.scans))]
+
+        lines.append("Masks:")
+        lines.extend("  {} {}={}".format(*m) for m in self.masks)
+        lines.append("Calendar keys:")
+        lines.extend("  {} {}".format(*k) for k in self.calendar_keys)
+        lines.append("Bins:")
+        lines.extend("  {} {}".format(using, _format_params(params))
+                     for using, params in self.bins)
+
+        lines.append("Scans:")
+        for i, (scan, names) in enumerate(self.scans.items()):
+            description = [scan.using, 'groupby={}'.format(scan.groupby),
+                           _format_params(scan.params)]
+            if scan.binning:
+                description.append('binned')
+            if not scan.filter_empty:
+                description.append('padded')
+            lines.append("  {}. {}".format(i + 1, ' '.join(description)))
+            lines.append("     {}".format(', '.join(names)))
+
+        return '\n'.join(lines)
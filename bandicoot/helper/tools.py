@@ -35,8 +35,11 @@ import os
 class CustomEncoder(json.JSONEncoder):
     def default(self, obj):
         from bandicoot.core import User
+        from bandicoot.helper.maths import QuantileSketch
         if isinstance(obj, User):
             return repr(obj)
+        if isinstance(obj, QuantileSketch):
+            return obj.to_dict()
 
         return json.JSONEncoder.default(self, obj)
 
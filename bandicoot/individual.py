@@ -22,8 +22,9 @@
 
 from __future__ import division
 
-from .helper.group import grouping
-from .helper.maths import entropy, summary_stats
+from .helper.group import grouping, shared
+from .helper.aggregate import mergeable
+from .helper.maths import entropy, summary_stats, HyperLogLog, SpaceSaving
 from .helper.tools import pairwise
 from collections import Counter
 
@@ -32,6 +33,93 @@ import datetime
 from collections import defaultdict
 
 
+def _contacts(records, direction=None):
+    """
+    Counter of the number of interactions with each contact.
+    """
+    if direction is None:
+        return Counter(r.correspondent_id for r in records)
+    return Counter(r.correspondent_id for r in records
+                   if r.direction == direction)
+
+
+def _distinct_contacts(records, direction=None):
+    """
+    HyperLogLog sketch of the contacts.
+    """
+    sketch = HyperLogLog()
+    sketch.update(r.correspondent_id for r in records
+                  if direction is None or r.direction == direction)
+    return sketch
+
+
+def _frequent_contacts(records, direction=None):
+    """
+    Space-Saving sketch of the number of interactions with each contact.
+    """
+    sketch = SpaceSaving()
+    sketch.extend(r.correspondent_id for r in records
+                  if direction is None or r.direction == direction)
+    return sketch
+
+
+def _contacts_state(records, direction=None, approximate=False):
+    """
+    Partial state of the indicators on the interactions with each contact:
+    the Counter of their interactions, or, if ``approximate`` is True, the
+    HyperLogLog and Space-Saving sketches of the contacts.
+    """
+    if approximate:
+        return (shared(records, _distinct_contacts, direction),
+                shared(records, _frequent_contacts, direction))
+    return shared(records, _contacts, direction)
+
+
+def _number_of_contacts(state, direction=None, more=0, approximate=False):
+    if approximate and more == 0:
+        return int(round(state[0].cardinality()))
+    elif approximate:
+        return sum(1 for _, count, _ in state[1].top() if count > more)
+
+    return sum(1 for d in state.values() if d > more)
+
+
+def _entropy_of_contacts(state, normalize=False, approximate=False):
+    if approximate:
+        distinct, sketch = state
+        distinct = distinct.cardinality()
+        raw_entropy = sketch.entropy(distinct)
+        n = max(int(round(distinct)), len(sketch))
+    else:
+        raw_entropy = entropy(state.values())
+        n = len(state)
+
+    if normalize and n > 1:
+        return raw_entropy / math.log(n)
+    else:
+        return raw_entropy
+
+
+def _interactions_per_contact(state, direction=None):
+    return summary_stats(state.values())
+
+
+def _ratio(state, user=None):
+    part, total = state
+    return part / total if total != 0 else 0
+
+
+def _contact_conversations(records):
+    """
+    List of the conversations with each contact.
+    """
+    interactions = defaultdict(list)
+    for r in records:
+        interactions[r.correspondent_id].append(r)
+
+    return [list(_conversations(g)) for g in interactions.values()]
+
+
 @grouping
 def interevent_time(records):
     """
@@ -44,7 +132,8 @@ def interevent_time(records):
 
 
 @grouping
-def number_of_contacts(records, direction=None, more=0):
+@mergeable(_contacts_state, _number_of_contacts)
+def number_of_contacts(records, direction=None, more=0, approximate=False):
     """
     The number of contacts the user interacted with.
 
@@ -55,16 +144,26 @@ def number_of_contacts(records, direction=None, more=0):
         ``'in'`` for incoming, and ``'out'`` for outgoing.
     more : int, default is 0
         Counts only contacts with more than this number of interactions.
-    """
-    if direction is None:
-        counter = Counter(r.correspondent_id for r in records)
+    approximate : boolean, default is False
+        Estimates the number of contacts with a
+        :class:`~bandicoot.helper.maths.HyperLogLog` sketch, with a
+        relative standard error of 1.6%, instead of counting the
+        interactions with each contact. With ``more``, only the 200 most
+        frequent contacts are counted, with a
+        :class:`~bandicoot.helper.maths.SpaceSaving` sketch.
+    """
+    if approximate and more == 0:
+        state = (shared(records, _distinct_contacts, direction), None)
+    elif approximate:
+        state = (None, shared(records, _frequent_contacts, direction))
     else:
-        counter = Counter(r.correspondent_id for r in records if r.direction == direction)
-    return sum(1 for d in counter.values() if d > more)
+        state = shared(records, _contacts, direction)
+    return _number_of_contacts(state, direction, more, approximate)
 
 
 @grouping
-def entropy_of_contacts(records, normalize=False):
+@mergeable(_contacts_state, _entropy_of_contacts)
+def entropy_of_contacts(records, normalize=False, approximate=False):
     """
     The entropy of the user's contacts.
 
@@ -72,19 +171,18 @@ def entropy_of_contacts(records, normalize=False):
     ----------
     normalize: boolean, default is False
         Returns a normalized entropy between 0 and 1.
+    approximate : boolean, default is False
+        Estimates the entropy from the 200 most frequent contacts, assuming
+        the interactions with other contacts are evenly distributed. The
+        entropy is exact for users with at most 200 contacts.
 
     """
-    counter = Counter(r.correspondent_id for r in records)
-
-    raw_entropy = entropy(counter.values())
-    n = len(counter)
-    if normalize and n > 1:
-        return raw_entropy / math.log(n)
-    else:
-        return raw_entropy
+    state = _contacts_state(records, approximate=approximate)
+    return _entropy_of_contacts(state, normalize, approximate)
 
 
 @grouping
+@mergeable(_contacts_state, _interactions_per_contact)
 def interactions_per_contact(records, direction=None):
     """
     The number of interactions a user had with each of its contacts.
@@ -95,27 +193,33 @@ def interactions_per_contact(records, direction=None):
         Filters the records by their direction: ``None`` for all records,
         ``'in'`` for incoming, and ``'out'`` for outgoing.
     """
-    if direction is None:
-        counter = Counter(r.correspondent_id for r in records)
-    else:
-        counter = Counter(r.correspondent_id for r in records
-                          if r.direction == direction)
-    return summary_stats(counter.values())
+    return _interactions_per_contact(shared(records, _contacts, direction))
+
+
+def _initiated_state(records, user):
+    return sum(shared(records, _contacts, 'out').values()), len(records)
 
 
 @grouping(user_kwd=True, interaction='call')
+@mergeable(_initiated_state, _ratio)
 def percent_initiated_interactions(records, user):
     """
     The percentage of calls initiated by the user.
     """
-    if len(records) == 0:
-        return 0
+    return _ratio(_initiated_state(records, user))
 
-    initiated = sum(1 for r in records if r.direction == 'out')
-    return initiated / len(records)
+
+def _nocturnal_state(records, user):
+    if user.night_start < user.night_end:
+        night_filter = lambda d: user.night_end > d.time() > user.night_start
+    else:
+        night_filter = lambda d: not(user.night_end < d.time() < user.night_start)
+
+    return sum(1 for r in records if night_filter(r.datetime)), len(records)
 
 
 @grouping(user_kwd=True)
+@mergeable(_nocturnal_state, _ratio)
 def percent_nocturnal(records, user):
     """
     The percentage of interactions the user had at night.
@@ -123,18 +227,23 @@ def percent_nocturnal(records, user):
     By default, nights are 7pm-7am. Nightimes can be set in
     ``User.night_start`` and ``User.night_end``.
     """
-    if len(records) == 0:
-        return 0
+    return _ratio(_nocturnal_state(records, user))
+
+
+def _call_durations(records, direction=None):
+    if direction is None:
+        return [r.call_duration for r in records]
+    return [r.call_duration for r in records if r.direction == direction]
 
-    if user.night_start < user.night_end:
-        night_filter = lambda d: user.night_end > d.time() > user.night_start
-    else:
-        night_filter = lambda d: not(user.night_end < d.time() < user.night_start)
 
-    return sum(1 for r in records if night_filter(r.datetime)) / len(records)
+def _call_duration_state(records, direction=None):
+    # Moments are merged, and the distribution or its sketch only if the
+    # summary needs them (see User._aggregated_scan)
+    return summary_stats(_call_durations(records, direction))
 
 
 @grouping(interaction='call')
+@mergeable(_call_duration_state)
 def call_duration(records, direction=None):
     """
     The duration of the user's calls.
@@ -145,12 +254,7 @@ def call_duration(records, direction=None):
         Filters the records by their direction: ``None`` for all records,
         ``'in'`` for incoming, and ``'out'`` for outgoing.
     """
-    if direction is None:
-        call_durations = [r.call_duration for r in records]
-    else:
-        call_durations = [r.call_duration for r in records if r.direction == direction]
-
-    return summary_stats(call_durations)
+    return summary_stats(_call_durations(records, direction))
 
 
 def _conversations(group, delta=datetime.timedelta(hours=1)):
@@ -220,13 +324,8 @@ def response_rate_text(records):
     if len(records) == 0:
         return None
 
-    interactions = defaultdict(list)
-    for r in records:
-        interactions[r.correspondent_id].append(r)
-
-    def _response_rate(grouped):
+    def _response_rate(conversations):
         received, responded = 0, 0
-        conversations = _conversations(grouped)
 
         for conv in conversations:
             if len(conv) != 0:
@@ -240,7 +339,7 @@ def response_rate_text(records):
 
     # Group all records by their correspondent, and compute the response rate
     # for each
-    all_couples = map(_response_rate, list(interactions.values()))
+    all_couples = map(_response_rate, shared(records, _contact_conversations))
     responded, received = map(sum, list(zip(*all_couples)))
 
     return responded / received if received != 0 else None
@@ -268,20 +367,16 @@ def response_delay_text(records):
     sent no more than an hour after the previous. The response delay can thus
     not be greater than one hour.
     """
-    interactions = defaultdict(list)
-    for r in records:
-        interactions[r.correspondent_id].append(r)
-
-    def _response_delay(grouped):
+    def _response_delay(conversations):
         ts = ((b.datetime - a.datetime).total_seconds()
-              for conv in _conversations(grouped)
+              for conv in conversations
               for a, b in pairwise(conv)
               if b.direction == 'out' and a.direction == 'in')
 
         return ts
 
-    delays = [r for i in interactions.values() for r in _response_delay(i)
-              if r > 0]
+    delays = [r for i in shared(records, _contact_conversations)
+              for r in _response_delay(i) if r > 0]
 
     return summary_stats(delays)
 
@@ -296,16 +391,12 @@ def percent_initiated_conversations(records):
     See :ref:`Using bandicoot <conversations-label>` for a definition of
     conversations.
     """
-    interactions = defaultdict(list)
-    for r in records:
-        interactions[r.correspondent_id].append(r)
-
-    def _percent_initiated(grouped):
+    def _percent_initiated(conversations):
         mapped = [(1 if conv[0].direction == 'out' else 0, 1)
-                  for conv in _conversations(grouped)]
+                  for conv in conversations]
         return mapped
 
-    all_couples = [sublist for i in interactions.values()
+    all_couples = [sublist for i in shared(records, _contact_conversations)
                    for sublist in _percent_initiated(i)]
 
     if len(all_couples) == 0:
@@ -316,38 +407,88 @@ def percent_initiated_conversations(records):
     return init / total if total != 0 else 0
 
 
+def _active_days(records):
+    return set(r.datetime.date() for r in records)
+
+
 @grouping(interaction='callandtext')
+@mergeable(_active_days, len)
 def active_days(records):
     """
     The number of days during which the user was active. A user is considered
     active if he sends a text, receives a text, initiates a call, receives a
     call, or has a mobility point.
     """
-    days = set(r.datetime.date() for r in records)
-    return len(days)
+    return len(_active_days(records))
+
+
+def _pareto(counter, percentage):
+    """
+    The number of keys of ``counter`` accounting for ``percentage`` of its
+    total count.
+    """
+    target = int(math.ceil(sum(counter.values()) * percentage))
+    keys = sorted(counter.keys(), key=lambda x: counter[x])
+
+    while target > 0 and len(keys) > 0:
+        key = keys.pop()
+        target -= counter[key]
+
+    return len(counter) - len(keys)
+
+
+def _percent_pareto_interactions(state, percentage=0.8, approximate=False):
+    if approximate:
+        distinct, sketch = state
+        if sketch.total == 0:
+            return None
+        n = max(int(round(distinct.cardinality())), len(sketch))
+        return sketch.pareto(percentage, n) / n
+
+    if len(state) == 0:
+        return None
+    return _pareto(state, percentage) / len(state)
 
 
 @grouping
-def percent_pareto_interactions(records, percentage=0.8):
+@mergeable(_contacts_state, _percent_pareto_interactions)
+def percent_pareto_interactions(records, percentage=0.8, approximate=False):
     """
     The percentage of user's contacts that account for 80% of its interactions.
+
+    With ``approximate=True``, the number of interactions with the 200
+    most frequent contacts are counted with a
+    :class:`~bandicoot.helper.maths.SpaceSaving` sketch, overestimated by
+    at most 0.5% of all interactions, and the number of contacts is
+    estimated with a :class:`~bandicoot.helper.maths.HyperLogLog` sketch.
+    The percentage is exact for users with at most 200 contacts.
     """
     if len(records) == 0:
         return None
 
-    user_count = Counter(r.correspondent_id for r in records)
+    state = _contacts_state(records, approximate=approximate)
+    return _percent_pareto_interactions(state, percentage, approximate)
+
 
-    target = int(math.ceil(sum(user_count.values()) * percentage))
-    user_sort = sorted(user_count.keys(), key=lambda x: user_count[x])
+def _durations_state(records):
+    """
+    Counter of the total duration of the calls with each contact.
+    """
+    user_count = Counter()
+    for r in records:
+        if r.interaction == "call":
+            user_count[r.correspondent_id] += r.call_duration
+    return user_count
 
-    while target > 0 and len(user_sort) > 0:
-        user_id = user_sort.pop()
-        target -= user_count[user_id]
 
-    return (len(user_count) - len(user_sort)) / len(user_count)
+def _percent_pareto_durations(state, percentage=0.8):
+    if len(state) == 0:
+        return None
+    return _pareto(state, percentage) / len(state)
 
 
 @grouping(interaction='call')
+@mergeable(_durations_state, _percent_pareto_durations)
 def percent_pareto_durations(records, percentage=0.8):
     """
     The percentage of user's contacts that account for 80% of its total time
@@ -357,22 +498,26 @@ def percent_pareto_durations(records, percentage=0.8):
     if len(records) == 0:
         return None
 
-    user_count = defaultdict(int)
-    for r in records:
-        if r.interaction == "call":
-            user_count[r.correspondent_id] += r.call_duration
+    return _percent_pareto_durations(_durations_state(records), percentage)
+
 
-    target = int(math.ceil(sum(user_count.values()) * percentage))
-    user_sort = sorted(user_count.keys(), key=lambda x: user_count[x])
+def _balance_state(records):
+    return shared(records, _contacts, 'out'), shared(records, _contacts)
 
-    while target > 0 and len(user_sort) > 0:
-        user_id = user_sort.pop()
-        target -= user_count[user_id]
 
-    return (len(user_count) - len(user_sort)) / len(user_count)
+def _balance_of_contacts(state, weighted=True):
+    counter_out, counter = state
+
+    if not weighted:
+        balance = [counter_out[c] / counter[c] for c in counter]
+    else:
+        balance = [counter_out[c] / sum(counter.values()) for c in counter]
+
+    return summary_stats(balance)
 
 
 @grouping
+@mergeable(_balance_state, _balance_of_contacts)
 def balance_of_contacts(records, weighted=True):
     """
     The balance of interactions per contact. For every contact,
@@ -389,23 +534,18 @@ def balance_of_contacts(records, weighted=True):
         If ``True``, the balance for each contact is weighted by
         the number of interactions the user had with this contact.
     """
-    counter_out = defaultdict(int)
-    counter = defaultdict(int)
+    return _balance_of_contacts(_balance_state(records), weighted)
 
-    for r in records:
-        if r.direction == 'out':
-            counter_out[r.correspondent_id] += 1
-        counter[r.correspondent_id] += 1
 
-    if not weighted:
-        balance = [counter_out[c] / counter[c] for c in counter]
+def _number_of_interactions(records, direction=None):
+    if direction is None:
+        return len(records)
     else:
-        balance = [counter_out[c] / sum(counter.values()) for c in counter]
-
-    return summary_stats(balance)
+        return sum(shared(records, _contacts, direction).values())
 
 
 @grouping()
+@mergeable(_number_of_interactions)
 def number_of_interactions(records, direction=None):
     """
     The number of interactions.
@@ -416,7 +556,4 @@ def number_of_interactions(records, direction=None):
         Filters the records by their direction: ``None`` for all records,
         ``'in'`` for incoming, and ``'out'`` for outgoing.
     """
-    if direction is None:
-        return len(records)
-    else:
-        return len([r for r in records if r.direction == direction])
+    return _number_of_interactions(records, direction)
@@ -27,22 +27,202 @@ Contains tools for processing files (reading and writing csv and json files).
 from __future__ import with_statement, division
 
 from .utils import flatten
-from .core import User, Record, Position, Recharge
-from .helper.tools import OrderedDict, percent_overlapping_calls, \
-    percent_records_missing_location, antennas_missing_locations, ColorHandler
+from .core import User, Record, Position, Recharge, ColumnarRecords, \
+    MatchIndex, Deduplicator, AntennaRegistry, _Vocabulary
+from .helper.tools import OrderedDict, ColorHandler, CustomEncoder
+from .helper.cache import LRUCache
 
-from datetime import datetime
-from json import dumps
+from datetime import datetime, timedelta
+from json import dump, dumps, loads
 from collections import Counter
+from threading import Lock
 import logging as log
 import time
+import itertools
+import struct
+import array
+import copy
 import csv
+import gc
+import gzip
+import sys
 import os
 
 log.getLogger().setLevel(log.WARN)
 log.getLogger().addHandler(ColorHandler())
 
 
+def _open_output(filename, mode, compress):
+    if compress is None:
+        compress = filename.endswith('.gz')
+
+    if not compress:
+        return open(filename, mode)
+    elif sys.version_info[0] >= 3:
+        return gzip.open(filename, mode + 't')
+    else:
+        return gzip.open(filename, mode + 'b')
+
+
+def _csv_repr(item, digits):
+    if item is None:
+        return None
+    elif isinstance(item, float):
+        return repr(round(item, digits))
+    else:
+        return str(item)
+
+
+class CsvIndicatorWriter(object):
+    """
+    Export the flatten indicators of users to CSV, one user at a time.
+
+    The columns of the file are fixed when the writer is created, or by the
+    first exported object. Indicators missing from an object are left
+    empty, and indicators which are not columns of the file are ignored,
+    or raise a ValueError if ``strict`` is True.
+
+    Parameters
+    ----------
+    filename : string
+        File to export to.
+    fields : list, optional
+        Names of the columns. By default, the keys of the first object.
+    digits : int
+        Precision of floats.
+    compress : bool, optional
+        Compress the file with gzip. By default, files ending in ``.gz``
+        are compressed.
+    append : bool, default False
+        Add rows at the end of an existing file, using its columns.
+    strict : bool, default False
+        Raise a ValueError when an object has indicators which are not
+        columns of the file, instead of ignoring them.
+
+    Examples
+    --------
+    >>> with bc.io.CsvIndicatorWriter('results.csv') as writer:
+    ...     for user in users:
+    ...         writer.write(bc.utils.all(user))
+    """
+
+    def __init__(self, filename, fields=None, digits=5, compress=None,
+                 append=False, strict=False):
+        self.filename = filename
+        self.digits = digits
+        self.strict = strict
+        self.fields = list(fields) if fields is not None else None
+        self.count = 0
+        self._columns = None
+        self._ignored = set()
+
+        mode = 'w'
+        if append and os.path.exists(filename) and \
+                os.path.getsize(filename) > 0:
+            mode = 'a'
+            with _open_output(filename, 'r', compress) as f:
+                header = next(csv.reader(f), None)
+            if self.fields is not None and self.fields != header:
+                raise ValueError("The columns of {} do not match the given "
+                                 "fields.".format(filename))
+            self.fields = header
+
+        self._file = _open_output(filename, mode, compress)
+        self._writer = csv.writer(self._file)
+        if mode == 'w' and self.fields is not None:
+            self._writer.writerow(self.fields)
+
+    def write(self, obj):
+        """
+        Export one object, such as the result of
+        :meth:`~bandicoot.utils.all`.
+        """
+        row = flatten(obj)
+        if self.fields is None:
+            self.fields = list(row.keys())
+            self._writer.writerow(self.fields)
+
+        if self._columns is None:
+            self._columns = set(self.fields)
+        extra = [k for k in row
+                 if k not in self._columns and k not in self._ignored]
+        if extra and self.strict:
+            raise ValueError("{} indicator(s) are not columns of {}: {}."
+                             .format(len(extra), self.filename,
+                                     ', '.join(extra[:5])))
+        if extra:
+            # Warn only once for each ignored indicator
+            self._ignored.update(extra)
+            log.warn("{} indicator(s) are not columns of {} and were "
+                     "ignored.".format(len(extra), self.filename))
+
+        digits = self.digits
+        self._writer.writerow([_csv_repr(row.get(k), digits)
+                               for k in self.fields])
+        self.count += 1
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class NdjsonIndicatorWriter(object):
+    """
+    Export the indicators of users to newline-delimited JSON, one user at a
+    time. Each line of the file is the JSON object of one user.
+
+    Parameters
+    ----------
+    filename : string
+        File to export to.
+    compress : bool, optional
+        Compress the file with gzip. By default, files ending in ``.gz``
+        are compressed.
+    append : bool, default False
+        Add lines at the end of an existing file.
+
+    Examples
+    --------
+    >>> with bc.io.NdjsonIndicatorWriter('results.json.gz') as writer:
+    ...     for user in users:
+    ...         writer.write(bc.utils.all(user))
+    """
+
+    def __init__(self, filename, compress=None, append=False):
+        self.filename = filename
+        self.count = 0
+        self._file = _open_output(filename, 'a' if append else 'w', compress)
+
+    def write(self, obj):
+        """
+        Export one object, such as the result of
+        :meth:`~bandicoot.utils.all`.
+        """
+        self._file.write(dumps(obj, cls=CustomEncoder))
+        self._file.write('\n')
+        self.count += 1
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 def to_csv(objects, filename, digits=5, warnings=True):
     """
     Export the flatten indicators of one or several users to CSV.
@@ -66,30 +246,24 @@ def to_csv(objects, filename, digits=5, warnings=True):
 
     If you only have one object, you can simply pass it as argument:
     >>> bc.to_csv(bc.utils.all(U_1), 'results_1.csv')
+
+    To export users one at a time, without keeping their indicators in
+    memory, see :class:`~bandicoot.io.CsvIndicatorWriter`.
     """
 
     if not isinstance(objects, list):
         objects = [objects]
 
     data = [flatten(obj) for obj in objects]
-    all_keys = [d for datum in data for d in datum.keys()]
-    field_names = sorted(set(all_keys), key=lambda x: all_keys.index(x))
 
-    with open(filename, 'w') as f:
-        w = csv.writer(f)
-        w.writerow(field_names)
-
-        def make_repr(item):
-            if item is None:
-                return None
-            elif isinstance(item, float):
-                return repr(round(item, digits))
-            else:
-                return str(item)
+    # Keys in order of first appearance
+    field_names = list(OrderedDict.fromkeys(
+        k for datum in data for k in datum.keys()))
 
+    with CsvIndicatorWriter(filename, field_names, digits,
+                            compress=False) as writer:
         for row in data:
-            row = dict((k, make_repr(v)) for k, v in row.items())
-            w.writerow([make_repr(row.get(k, None)) for k in field_names])
+            writer.write(row)
 
     if warnings:
         print("Successfully exported {} object(s) to {}".format(len(objects),
@@ -117,6 +291,9 @@ def to_json(objects, filename, warnings=True):
 
     If you only have one object, you can simply pass it as argument:
     >>> bc.to_json(bc.utils.all(U_1), 'results_1.json')
+
+    To export users one at a time, see
+    :class:`~bandicoot.io.NdjsonIndicatorWriter`.
     """
 
     if not isinstance(objects, list):
@@ -125,7 +302,8 @@ def to_json(objects, filename, warnings=True):
     obj_dict = OrderedDict([(obj['name'], obj) for obj in objects])
 
     with open(filename, 'w') as f:
-        f.write(dumps(obj_dict, indent=4, separators=(',', ': ')))
+        dump(obj_dict, f, indent=4, separators=(',', ': '),
+             cls=CustomEncoder)
 
     if warnings:
         print("Successfully exported {} object(s) to {}".format(len(objects),
@@ -187,6 +365,157 @@ def _parse_record(data, duration_format='seconds'):
                   position=_tryto(_map_position, data))
 
 
+def _datetime_parser():
+    """
+    Return a function parsing ``%Y-%m-%d %H:%M:%S`` strings. Dates are
+    decoded by slicing and memoized, as many records share the same day,
+    and times are decoded by slicing. Strings not following exactly this
+    layout are handled by ``strptime``.
+    """
+    dates = {}
+
+    def _decode_date(s):
+        if s[4] == '-' and s[7] == '-' and \
+                (s[0:4] + s[5:7] + s[8:10]).isdigit():
+            return int(s[0:4]), int(s[5:7]), int(s[8:10])
+
+    def _parse(s):
+        if len(s) == 19 and s[10] == ' ' and s[13] == ':' and s[16] == ':':
+            day = s[:10]
+            try:
+                date = dates[day]
+            except KeyError:
+                date = dates[day] = _decode_date(day)
+
+            if date is not None and \
+                    (s[11:13] + s[14:16] + s[17:19]).isdigit():
+                return datetime(date[0], date[1], date[2], int(s[11:13]),
+                                int(s[14:16]), int(s[17:19]))
+
+        return datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
+
+    return _parse
+
+
+def _duration_parser(duration_format='seconds'):
+    """
+    Return a function parsing call durations. Durations in other formats
+    than seconds are memoized, as most of them appear many times.
+    """
+    if duration_format.lower() == 'seconds':
+        def _parse(s):
+            if s == '':
+                return None
+            return int(s)
+        return _parse
+
+    cache = {'': None}
+
+    def _parse_with_format(s):
+        try:
+            return cache[s]
+        except KeyError:
+            t = time.strptime(s, duration_format)
+            value = cache[s] = 3600 * t.tm_hour + 60 * t.tm_min + t.tm_sec
+            return value
+
+    return _parse_with_format
+
+
+# Number of threads parsing records, and whether the garbage collector was
+# enabled before the first one
+_gc_pause = {'parsers': 0, 'enabled': False}
+_gc_lock = Lock()
+
+
+def _parse_records(rows, fieldnames, duration_format='seconds'):
+    """
+    Parse raw CSV rows (lists of strings) into Record objects.
+
+    This is equivalent to calling :meth:`_parse_record` on each row of a
+    ``csv.DictReader``, but column indices are resolved once and each column
+    is decoded in bulk. The garbage collector is paused while parsing, as
+    the millions of (acyclic) objects created would otherwise trigger many
+    useless collections. It is paused by the first of the threads parsing
+    records, and enabled again by the last one, only if it was enabled.
+    """
+    with _gc_lock:
+        if _gc_pause['parsers'] == 0:
+            _gc_pause['enabled'] = gc.isenabled()
+            gc.disable()
+        _gc_pause['parsers'] += 1
+
+    try:
+        return _parse_columns(rows, fieldnames, duration_format)
+    finally:
+        with _gc_lock:
+            _gc_pause['parsers'] -= 1
+            if _gc_pause['parsers'] == 0 and _gc_pause['enabled']:
+                gc.enable()
+
+
+def _parse_columns(rows, fieldnames, duration_format):
+    rows = [row for row in rows if row != []]
+    if len(rows) == 0:
+        # Like csv.DictReader, columns are not checked without rows
+        return []
+
+    # Like csv.DictReader, fill missing values with None
+    width = len(fieldnames)
+    if rows and min(map(len, rows)) < width:
+        rows = [row + [None] * (width - len(row)) for row in rows]
+
+    def column(name):
+        # Like csv.DictReader, the last column wins for duplicated names
+        i = width - 1 - fieldnames[::-1].index(name)
+        return [row[i] for row in rows]
+
+    def try_map(function, values):
+        results = []
+        for v in values:
+            try:
+                results.append(function(v))
+            except Exception:
+                results.append(ValueError)
+        return results
+
+    for name in ['interaction', 'direction', 'correspondent_id', 'datetime',
+                 'call_duration']:
+        if name not in fieldnames:
+            raise KeyError(name)
+
+    interactions = [i if i else None for i in column('interaction')]
+    directions = column('direction')
+    correspondents = column('correspondent_id')
+    datetimes = try_map(_datetime_parser(), column('datetime'))
+    durations = try_map(_duration_parser(duration_format),
+                        column('call_duration'))
+
+    if 'place_id' in fieldnames:
+        positions = [ValueError] * len(rows)
+    else:
+        if 'antenna_id' in fieldnames:
+            antennas = [a if a else None for a in column('antenna_id')]
+        else:
+            antennas = [None] * len(rows)
+
+        if 'latitude' in fieldnames and 'longitude' in fieldnames:
+            locations = try_map(
+                lambda c: (float(c[0]), float(c[1])) if c[0] and c[1]
+                else None, zip(column('latitude'), column('longitude')))
+        else:
+            locations = [None] * len(rows)
+
+        positions = [ValueError if l is ValueError else Position(a, l)
+                     for a, l in zip(antennas, locations)]
+
+    return [Record(interaction=i, direction=d, correspondent_id=c,
+                   datetime=dt, call_duration=du, position=p)
+            for i, d, c, dt, du, p in zip(interactions, directions,
+                                          correspondents, datetimes,
+                                          durations, positions)]
+
+
 def _parse_recharge(data):
     def optional_parser(x):
         try:
@@ -219,26 +548,6 @@ def filter_record(records):
 
     """
 
-    def scheme(r):
-        if r.interaction is None:
-            call_duration_ok = True
-        elif r.interaction == 'call':
-            call_duration_ok = isinstance(r.call_duration, (int, float))
-        else:
-            call_duration_ok = True
-
-        callandtext = r.interaction in ['call', 'text']
-        not_callandtext = not callandtext
-
-        return {
-            'interaction': r.interaction in ['call', 'text', 'gps', None],
-            'direction': (not_callandtext and r.direction is None) or r.direction in ['in', 'out'],
-            'correspondent_id': not_callandtext or (r.correspondent_id not in [None, '']),
-            'datetime': isinstance(r.datetime, datetime),
-            'call_duration': call_duration_ok,
-            'location': callandtext or r.position.type() is not None
-        }
-
     ignored = OrderedDict([
         ('all', 0),
         ('interaction', 0),
@@ -249,29 +558,184 @@ def filter_record(records):
         ('location', 0),
     ])
 
+    valid_records = []
     bad_records = []
 
-    def _filter(records):
-        for r in records:
-            valid = True
-            for key, valid_key in scheme(r).items():
-                if not valid_key:
-                    ignored[key] += 1
-                    bad_records.append(r)
-                    # Not breaking, to count all fields with errors
-                    valid = False
-
-            if valid:
-                yield r
-            else:
-                ignored['all'] += 1
+    for r in records:
+        interaction = r.interaction
+        callandtext = interaction == 'call' or interaction == 'text'
+        errors = 0
+
+        # Not stopping at the first error, to count all fields with errors
+        if interaction not in ('call', 'text', 'gps', None):
+            ignored['interaction'] += 1
+            errors += 1
+        if not ((not callandtext and r.direction is None) or
+                r.direction in ('in', 'out')):
+            ignored['direction'] += 1
+            errors += 1
+        if callandtext and r.correspondent_id in (None, ''):
+            ignored['correspondent_id'] += 1
+            errors += 1
+        if not isinstance(r.datetime, datetime):
+            ignored['datetime'] += 1
+            errors += 1
+        if interaction == 'call' and \
+                not isinstance(r.call_duration, (int, float)):
+            ignored['call_duration'] += 1
+            errors += 1
+        if not callandtext and r.position.type() is None:
+            ignored['location'] += 1
+            errors += 1
+
+        if errors == 0:
+            valid_records.append(r)
+        else:
+            ignored['all'] += 1
+            bad_records.extend([r] * errors)
+
+    return valid_records, ignored, bad_records
+
+
+class DataQualityReport(object):
+    """
+    Counters describing the quality of the records of a user, computed
+    by :meth:`~bandicoot.io.validate_records` when loading the user.
+
+    Attributes
+    ----------
+    ignored : OrderedDict
+        Number of records removed for each missing or inconsistent field,
+        as returned by :meth:`~bandicoot.io.filter_record`.
+    number_of_records : int
+        Number of valid records, including duplicates.
+    records_missing_location : int
+        Number of valid records without a location.
+    antennas_missing_location : int
+        Number of antennas in the records without a location.
+    duplicated_records : int
+        Number of records identical to a previous one.
+    number_of_calls, number_of_texts : int
+        Number of calls and texts kept.
+    records_with_antenna : int
+        Number of records kept with an antenna.
+    overlapping_calls : int
+        Number of calls kept overlapping the next call by more than
+        5 minutes.
+    """
+
+    def __init__(self, ignored=None):
+        self.ignored = ignored if ignored is not None else OrderedDict()
+        self.number_of_records = 0
+        self.records_missing_location = 0
+        self.antennas_missing_location = 0
+        self.duplicated_records = 0
+        self.number_of_calls = 0
+        self.number_of_texts = 0
+        self.records_with_antenna = 0
+        self.overlapping_calls = 0
+
+    @property
+    def percent_records_missing_location(self):
+        if self.number_of_records == 0:
+            return 0.
+        return self.records_missing_location / self.number_of_records
+
+    @property
+    def percent_overlapping_calls(self):
+        if self.number_of_calls == 0:
+            return 0.
+        return self.overlapping_calls / self.number_of_calls
+
+    def __repr__(self):
+        return "DataQualityReport(%i records, %i ignored)" % (
+            self.number_of_records, self.ignored.get('all', 0))
+
+
+def validate_records(records, antennas=None, drop_duplicates=False):
+    """
+    Filter, sort and check records in a single pass after sorting.
+
+    Records missing a location are counted with the locations of
+    ``antennas`` when it is given, and the statistics otherwise computed by
+    :meth:`~bandicoot.helper.tools.percent_records_missing_location`,
+    :meth:`~bandicoot.helper.tools.antennas_missing_locations` and
+    :meth:`~bandicoot.helper.tools.percent_overlapping_calls` are
+    collected along the way.
+
+    Parameters
+    ----------
+    records : list
+        A list of Record objects
+    antennas : dict, optional
+        Dictionary of the position for each antenna.
+    drop_duplicates : boolean, default: False
+        Remove records identical to a previous one.
+
+    Returns
+    -------
+    records, bad_records, report : (Record list, Record list, DataQualityReport)
+        The valid records sorted by datetime, the records removed by
+        :meth:`~bandicoot.io.filter_record`, and the quality report.
+    """
+
+    records, ignored, bad_records = filter_record(records)
+    records.sort(key=lambda r: r.datetime)
+
+    report = DataQualityReport(ignored)
+    report.number_of_records = len(records)
+
+    lookup = antennas if antennas is not None else {}
+    kept = [] if drop_duplicates else records
+    record_antennas = set()
+
+    deduplicator = Deduplicator()
+    previous_call = None
+
+    for r in records:
+        position = r.position
+        antenna = position.antenna
+        # Records get the locations of the antennas once loaded (see load)
+        if antennas is not None:
+            location = lookup.get(antenna)
+        else:
+            location = position.location
+
+        if not location and (not antenna or lookup.get(antenna) is None):
+            report.records_missing_location += 1
+        if antenna is not None:
+            record_antennas.add(antenna)
+
+        if deduplicator.is_duplicate(r) and drop_duplicates:
+            continue
+
+        if drop_duplicates:
+            kept.append(r)
+
+        if r.interaction == 'call':
+            report.number_of_calls += 1
+            if previous_call is not None and previous_call.datetime + \
+                    timedelta(seconds=previous_call.call_duration - 300) \
+                    >= r.datetime:
+                report.overlapping_calls += 1
+            previous_call = r
+        elif r.interaction == 'text':
+            report.number_of_texts += 1
+
+        if antenna:
+            report.records_with_antenna += 1
 
-    return list(_filter(records)), ignored, bad_records
+    report.duplicated_records = deduplicator.duplicated_records
+    report.antennas_missing_location = sum(
+        1 for a in record_antennas if lookup.get(a) is None)
+
+    return kept, bad_records, report
 
 
 def load(name, records, antennas, attributes=None, recharges=None,
          antennas_path=None, attributes_path=None, recharges_path=None,
-         describe=False, warnings=False, drop_duplicates=False):
+         describe=False, warnings=False, drop_duplicates=False,
+         columnar=False):
     """
     Low-level function to create a new user. This function is used by
     read_csv, read_orange, and read_telenor.
@@ -326,6 +790,10 @@ def load(name, records, antennas, attributes=None, recharges=None,
         Remove duplicate records, and issue a warning message with the number
         of removed records.
 
+    columnar : boolean, default False
+        Store the records of the user in a compact
+        :class:`~bandicoot.core.ColumnarRecords` instead of a list.
+
 
     Examples
     --------
@@ -341,17 +809,31 @@ def load(name, records, antennas, attributes=None, recharges=None,
     will returns a new User object.
     """
 
-    user = User()
+    user = User(columnar=columnar)
     user.name = name
     user.antennas_path = antennas_path
     user.attributes_path = attributes_path
     user.recharges_path = recharges_path
 
-    user.records, ignored, bad_records = filter_record(records)
+    records, bad_records, report = validate_records(records, antennas,
+                                                    drop_duplicates)
+    ignored = report.ignored
+
+    has_antennas = report.records_with_antenna > 0
+    user._set_records(records, (report.number_of_calls > 0,
+                                report.number_of_texts > 0, has_antennas))
+    # As the home is computed from the positions of the records, antennas
+    # are given afterwards, and replace the locations of the records
+    if antennas is not None:
+        user.antennas = antennas
+    user.data_quality = report
 
-    _level = log.getLogger().level
+    # Silence warnings locally, without changing the level of the root
+    # logger shared with other users loaded concurrently
     if warnings is False:
-        log.getLogger().setLevel(log.ERROR)
+        warn = lambda msg: None
+    else:
+        warn = log.warn
 
     if ignored['all'] != 0:
         w = "{} record(s) were removed due to " \
@@ -360,76 +842,79 @@ def load(name, records, antennas, attributes=None, recharges=None,
             if k != 'all' and ignored[k] != 0:
                 w += "\n" + " " * 9 + "%s: %i record(s) with " \
                      "incomplete values" % (k, ignored[k])
-        log.warn(w)
+        warn(w)
 
     user.ignored_records = dict(ignored)
 
-    if antennas is not None:
-        user.antennas = antennas
     if attributes is not None:
         user.attributes = attributes
     if recharges is not None:
         user.recharges = recharges
 
     if not user.has_attributes and user.attributes_path is not None:
-        log.warn("Attributes path {} is given, but no "
-                 "attributes are loaded.".format(attributes_path))
+        warn("Attributes path {} is given, but no "
+             "attributes are loaded.".format(attributes_path))
 
     if not user.has_recharges and user.recharges_path is not None:
-        log.warn("Recharges path {} is given, but no "
-                 "recharges are loaded.".format(recharges_path))
+        warn("Recharges path {} is given, but no "
+             "recharges are loaded.".format(recharges_path))
 
-    percent_missing = percent_records_missing_location(user)
+    percent_missing = report.percent_records_missing_location
     if percent_missing > 0:
         w = "{0:.2%} of the records are missing " \
             "a location.".format(percent_missing)
         if antennas is None:
             w += "\n" + " " * 9 + "No antennas file was given and " \
                  "records are using antennas for position."
-        log.warn(w)
+        warn(w)
 
-    msg_loc = antennas_missing_locations(user)
-    if msg_loc > 0:
-        log.warn("{} antenna(s) are missing a location.".format(msg_loc))
+    if report.antennas_missing_location > 0:
+        warn("{} antenna(s) are missing a location.".format(
+            report.antennas_missing_location))
 
-    sorted_min_records = sorted(set(user.records), key=lambda r: r.datetime)
-    num_dup = len(user.records) - len(sorted_min_records)
+    num_dup = report.duplicated_records
     if num_dup > 0:
         if drop_duplicates:
-            user.records = sorted_min_records
             log.error("{0:d} duplicated record(s) were "
                       "removed.".format(num_dup), extra={'prefix': "Warning!"})
         else:
-            log.warn("{0:d} record(s) are duplicated.".format(num_dup))
+            warn("{0:d} record(s) are duplicated.".format(num_dup))
 
-    pct_overlap_calls = percent_overlapping_calls(user.records, 300)
+    pct_overlap_calls = report.percent_overlapping_calls
     if pct_overlap_calls > 0:
-        log.warn("{0:.2%} of calls overlap the next call by more than "
-                 "5 minutes.".format(pct_overlap_calls))
+        warn("{0:.2%} of calls overlap the next call by more than "
+             "5 minutes.".format(pct_overlap_calls))
 
     if describe:
         user.describe()
 
-    log.getLogger().setLevel(_level)
     return user, bad_records
 
 
 def _read_network(user, records_path, attributes_path, read_function,
                   antennas_path=None, warnings=True, extension=".csv",
-                  **kwargs):
+                  loader=None, **kwargs):
     connections = {}
     correspondents = Counter([r.correspondent_id for r in user.records])
 
-    # Try to load all the possible correspondent files
-    for c_id, count in sorted(correspondents.items()):
-        correspondent_file = os.path.join(records_path, c_id + extension)
-        if os.path.exists(correspondent_file):
-            connections[c_id] = read_function(c_id, records_path,
-                                              antennas_path, attributes_path,
-                                              describe=False, network=False,
-                                              warnings=False, **kwargs)
-        else:
-            connections[c_id] = None
+    if loader is not None:
+        # Shared users are copied, as their records are filtered below
+        shared = loader.get(sorted(correspondents.keys()))
+        for c_id, u in shared.items():
+            connections[c_id] = _copy_user(u) if u is not None else None
+    else:
+        # Try to load all the possible correspondent files
+        for c_id, count in sorted(correspondents.items()):
+            correspondent_file = os.path.join(records_path, c_id + extension)
+            if os.path.exists(correspondent_file):
+                connections[c_id] = read_function(
+                    c_id, records_path, antennas_path, attributes_path,
+                    describe=False, network=False, warnings=False, **kwargs)
+            else:
+                connections[c_id] = None
+
+    # Indexes are rebuilt when the records of a user are filtered
+    indexes = {}
 
     def _is_consistent(record):
         if record.correspondent_id == user.name:
@@ -439,7 +924,12 @@ def _read_network(user, records_path, attributes_path, read_function,
         else:
             return True  # consistent by default
 
-        return correspondent is None or record.has_match(correspondent.records)
+        if correspondent is None:
+            return True
+
+        if correspondent not in indexes:
+            indexes[correspondent] = MatchIndex(correspondent.records)
+        return indexes[correspondent].has_match(record)
 
     def all_user_iter():
         if user.name not in connections:
@@ -453,6 +943,7 @@ def _read_network(user, records_path, attributes_path, read_function,
     num_total_records = sum(len(u.records) for u in all_user_iter())
     for u in all_user_iter():
         u.records = filter(_is_consistent, u.records)
+        indexes.pop(u, None)
     num_total_records_filtered = sum(len(u.records) for u in all_user_iter())
 
     # Report non reciprocated records
@@ -467,6 +958,160 @@ def _read_network(user, records_path, attributes_path, read_function,
     return OrderedDict(sorted(connections.items(), key=lambda t: t[0]))
 
 
+def _copy_user(user):
+    """
+    Return a shallow copy of a user, with its own cache, whose records can
+    be replaced without modifying the original user.
+    """
+    clone = copy.copy(user)  # Copies have their own cache
+    clone.partitions = OrderedDict(user.partitions)
+    return clone
+
+
+class NetworkLoader(object):
+    """
+    Load the networks of many users from the same directory, sharing the
+    correspondents between egos.
+
+    The directory is listed once, and parsed users are kept in a
+    least-recently-used cache, bounded by their total number of records.
+    Missing correspondents are parsed one after the other: parsing holds
+    the global interpreter lock, and threads would not be faster. Each ego
+    receives copies of the shared users, filtered for its own network, so
+    that cached users are never modified.
+
+    Parameters
+    ----------
+    records_path : str
+        Path of the directory containing all the user files.
+    antennas_path : str, optional
+        Path of the CSV file containing (antenna_id, latitude, longitude)
+        values.
+    attributes_path : str, optional
+        Path of the directory containing attributes files.
+    read_function : function, default :meth:`read_csv`
+        Function used to load a single user, such as :meth:`read_csv` or
+        :meth:`read_orange`.
+    max_records : int, default 10000000
+        Maximum number of records kept in the cache of parsed users.
+    extension : str, default '.csv'
+        Extension of the user files.
+    **kwargs
+        Other arguments passed to ``read_function``, such as
+        ``drop_duplicates``.
+
+    Examples
+    --------
+    >>> loader = NetworkLoader('records/', 'antennas.csv')
+    >>> for user_id in loader.user_ids:
+    ...     user = loader.read(user_id)
+    ...     indicators = bandicoot.utils.all(user, network=True)
+    >>> loader.close()
+    """
+
+    def __init__(self, records_path, antennas_path=None, attributes_path=None,
+                 read_function=None, max_records=10000000, extension='.csv',
+                 **kwargs):
+        self.records_path = records_path
+        self.antennas_path = antennas_path
+        self.attributes_path = attributes_path
+        self.read_function = read_function or read_csv
+        self.max_records = max_records
+        self.extension = extension
+        self.kwargs = kwargs
+
+        self.user_ids = sorted(
+            f[:-len(extension)] for f in os.listdir(records_path)
+            if f.endswith(extension))
+        self._user_ids = set(self.user_ids)
+
+        self._cache = OrderedDict()
+        self._cached_records = 0
+        self._lock = Lock()
+
+    def _load(self, user_id):
+        return self.read_function(user_id, self.records_path,
+                                  self.antennas_path, self.attributes_path,
+                                  describe=False, network=False,
+                                  warnings=False, **self.kwargs)
+
+    def _store(self, user_id, user):
+        with self._lock:
+            if user_id in self._cache:
+                return
+
+            self._cache[user_id] = user
+            self._cached_records += len(user.records)
+
+            while self._cached_records > self.max_records and \
+                    len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_records -= len(evicted.records)
+
+    def get(self, user_ids):
+        """
+        Return a dictionary with the shared, loaded users for each id, or
+        None if there is no file for this id. Users missing from the cache
+        are loaded.
+        """
+        found = {}
+        missing = []
+
+        with self._lock:
+            for user_id in user_ids:
+                if user_id not in self._user_ids:
+                    found[user_id] = None
+                elif user_id in self._cache:
+                    self._cache[user_id] = self._cache.pop(user_id)
+                    found[user_id] = self._cache[user_id]
+                else:
+                    missing.append(user_id)
+
+        for user_id in missing:
+            user = self._load(user_id)
+            self._store(user_id, user)
+            found[user_id] = user
+
+        return found
+
+    def read(self, user_id, describe=False, warnings=True):
+        """
+        Return the user ``user_id`` with its network loaded, as
+        :meth:`read_csv` with ``network=True`` would.
+        """
+        user = self.get([user_id])[user_id]
+        if user is None:
+            raise IOError("No records file found for user {} in {}.".format(
+                user_id, self.records_path))
+
+        user = _copy_user(user)
+        user.network = _read_network(user, self.records_path,
+                                     self.attributes_path, self.read_function,
+                                     self.antennas_path, warnings,
+                                     self.extension, loader=self,
+                                     **self.kwargs)
+        user.recompute_missing_neighbors()
+
+        if describe:
+            user.describe()
+
+        return user
+
+    def close(self):
+        """
+        Empty the cache.
+        """
+        with self._lock:
+            self._cache = OrderedDict()
+            self._cached_records = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 def _load_attributes(path):
     try:
         with open(path, 'r') as csv_file:
@@ -485,9 +1130,50 @@ def _load_recharges(path):
         return None
 
 
+# Antennas files recently loaded in the process
+_antenna_registries = LRUCache(max_size=8)
+_antenna_registries_lock = Lock()
+
+
+def _load_antennas(path):
+    """
+    Load an antennas file as an :class:`~bandicoot.core.AntennaRegistry`.
+    The last registries loaded are shared in the process, and the file is
+    parsed again if its modification time or size changed. Each call
+    returns a copy of the registry, shared until it is modified.
+    """
+    try:
+        stat = os.stat(path)
+    except (IOError, OSError):
+        return None
+
+    key = (os.path.abspath(path),
+           getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size)
+
+    with _antenna_registries_lock:
+        try:
+            return _antenna_registries.get(key).copy()
+        except KeyError:
+            pass
+
+        try:
+            with open(path, 'r') as csv_file:
+                reader = csv.DictReader(csv_file)
+                registry = AntennaRegistry(
+                    (d['antenna_id'], (float(d['latitude']),
+                                       float(d['longitude'])))
+                    for d in reader)
+        except IOError:
+            return None
+
+        _antenna_registries.put(key, registry)
+        return registry.copy()
+
+
 def read_csv(user_id, records_path, antennas_path=None, attributes_path=None,
              recharges_path=None, network=False, duration_format='seconds',
-             describe=True, warnings=True, errors=False, drop_duplicates=False):
+             describe=True, warnings=True, errors=False, drop_duplicates=False,
+             columnar=False):
     """
     Load user records from a CSV file.
 
@@ -533,6 +1219,11 @@ def read_csv(user_id, records_path, antennas_path=None, attributes_path=None,
         If drop_duplicates, remove "duplicated records" (same correspondants,
         direction, date and time). Not activated by default.
 
+    columnar : boolean
+        If columnar is True, records are stored in a compact, array-backed
+        :class:`~bandicoot.core.ColumnarRecords`, which uses several times
+        less memory for large users. Not activated by default.
+
 
     Examples
     --------
@@ -560,19 +1251,13 @@ def read_csv(user_id, records_path, antennas_path=None, attributes_path=None,
 
     antennas = None
     if antennas_path is not None:
-        try:
-            with open(antennas_path, 'r') as csv_file:
-                reader = csv.DictReader(csv_file)
-                antennas = dict((d['antenna_id'], (float(d['latitude']),
-                                                   float(d['longitude'])))
-                                for d in reader)
-        except IOError:
-            pass
+        antennas = _load_antennas(antennas_path)
 
     user_records = os.path.join(records_path, user_id + '.csv')
     with open(user_records, 'r') as csv_file:
-        reader = csv.DictReader(csv_file)
-        records = [_parse_record(r, duration_format) for r in reader]
+        reader = csv.reader(csv_file)
+        fieldnames = next(reader, [])
+        records = _parse_records(reader, fieldnames, duration_format)
 
     attributes = None
     if attributes_path is not None:
@@ -587,13 +1272,15 @@ def read_csv(user_id, records_path, antennas_path=None, attributes_path=None,
     user, bad_records = load(user_id, records, antennas, attributes, recharges,
                              antennas_path, attributes_path, recharges_path,
                              describe=False, warnings=warnings,
-                             drop_duplicates=drop_duplicates)
+                             drop_duplicates=drop_duplicates,
+                             columnar=columnar)
 
     # Loads the network
     if network is True:
         user.network = _read_network(user, records_path, attributes_path,
                                      read_csv, antennas_path, warnings,
-                                     drop_duplicates=drop_duplicates)
+                                     drop_duplicates=drop_duplicates,
+                                     columnar=columnar)
         user.recompute_missing_neighbors()
 
     if describe:
@@ -604,6 +1291,267 @@ def read_csv(user_id, records_path, antennas_path=None, attributes_path=None,
     return user
 
 
+def iter_users(records_path, user_column='user_id', antennas_path=None,
+               attributes_path=None, recharges_path=None,
+               duration_format='seconds', warnings=False,
+               drop_duplicates=False, columnar=False):
+    """
+    Stream a CSV file containing the records of a whole population, and
+    yield one :class:`~bandicoot.core.User` per subscriber.
+
+    The file is read once, and only the records of the current user are
+    kept in memory. It uses the same columns as :meth:`read_csv`, with an
+    additional column identifying the user. Records of a given user must
+    be contiguous, for instance by sorting the file by user.
+
+    Parameters
+    ----------
+    records_path : str
+        Path of the CSV file with the records of all users.
+
+    user_column : str, default 'user_id'
+        Name of the column containing the identifier of the user. It is
+        stored in :attr:`User.name <bandicoot.core.User.name>`.
+
+    antennas_path : str, optional
+        Path of the CSV file containing (antenna_id, latitude, longitude)
+        values. It is loaded once and shared by all users.
+
+    attributes_path : str, optional
+        Path of the directory containing attributes files, one per user.
+
+    recharges_path : str, optional
+        Path of the directory containing recharges files, one per user.
+
+    duration_format : str, default is 'seconds'
+        Format of call durations, see :meth:`read_csv`.
+
+    warnings : boolean, default False
+        Output warnings on the standard output for each user.
+
+    drop_duplicates : boolean, default False
+        Remove duplicated records of each user.
+
+    columnar : boolean, default False
+        Store the records of each user in a compact, array-backed
+        :class:`~bandicoot.core.ColumnarRecords`.
+
+    Examples
+    --------
+
+    >>> for user in bandicoot.io.iter_users('population.csv'):
+    ...     indicators = bandicoot.utils.all(user)
+
+    .. note:: The network of users cannot be loaded with this function.
+    """
+
+    antennas = None
+    if antennas_path is not None:
+        antennas = _load_antennas(antennas_path)
+
+    with open(records_path, 'r') as csv_file:
+        reader = csv.reader(csv_file)
+        fieldnames = next(reader, [])
+        if user_column not in fieldnames:
+            raise KeyError(user_column)
+
+        user_index = fieldnames.index(user_column)
+        rows = (row for row in reader if row != [])
+        blocks = itertools.groupby(
+            rows, key=lambda row: row[user_index]
+            if len(row) > user_index else None)
+
+        for user_id, block in blocks:
+            records = _parse_records(block, fieldnames, duration_format)
+
+            attributes = None
+            if attributes_path is not None:
+                attributes = _load_attributes(
+                    os.path.join(attributes_path, user_id + '.csv'))
+
+            recharges = None
+            if recharges_path is not None:
+                recharges = _load_recharges(
+                    os.path.join(recharges_path, user_id + '.csv'))
+
+            user, _ = load(user_id, records, antennas, attributes,
+                           recharges, antennas_path, attributes_path,
+                           recharges_path, describe=False,
+                           warnings=warnings, drop_duplicates=drop_duplicates,
+                           columnar=columnar)
+            yield user
+
+
+_SNAPSHOT_MAGIC = b'BANDICOOT-USER\n'
+_SNAPSHOT_FORMAT = 1
+
+
+def save_user(user, path):
+    """
+    Save a user to a compact binary snapshot, which can be reloaded quickly
+    with :meth:`load_user`.
+
+    The snapshot stores the records in columnar form (see
+    :class:`~bandicoot.core.ColumnarRecords`), the antennas, recharges,
+    attributes, home and ignored records of the user, as well as the
+    version of bandicoot used to create it. The network of the user is not
+    stored.
+
+    Parameters
+    ----------
+    user : User
+        The user to save.
+    path : str
+        Path of the snapshot file.
+    """
+    import bandicoot
+
+    if user.columnar:
+        records = user.records
+    else:
+        records = ColumnarRecords(user.records)
+
+    def _time(t):
+        return t.strftime('%H:%M:%S')
+
+    home = None
+    if user.home is not None:
+        home = [user.home.antenna, user.home.location]
+
+    columns = []
+    offset = 0
+    for name, typecode in ColumnarRecords.COLUMNS:
+        column = getattr(records, name)
+        nbytes = len(column) * column.itemsize
+        columns.append([name, typecode, offset, nbytes])
+        offset += nbytes
+
+    header = OrderedDict([
+        ('format', _SNAPSHOT_FORMAT),
+        ('version', bandicoot.__version__),
+        ('byteorder', sys.byteorder),
+        ('name', user.name),
+        ('antennas_path', user.antennas_path),
+        ('attributes_path', user.attributes_path),
+        ('recharges_path', user.recharges_path),
+        ('night_start', _time(user.night_start)),
+        ('night_end', _time(user.night_end)),
+        ('weekend', user.weekend),
+        ('home', home),
+        ('has_call', user.has_call),
+        ('has_text', user.has_text),
+        ('has_antennas', user.has_antennas),
+        ('ignored_records', user.ignored_records),
+        ('attributes', user.attributes),
+        ('antennas', list(user.antennas.items())),
+        ('recharges', [[r.datetime.strftime('%Y-%m-%d %H:%M:%S'),
+                        r.amount, r.retailer_id]
+                       for r in user.recharges]),
+        ('integer_durations', records.integer_durations),
+        ('vocabularies', [getattr(records, v).values
+                          for v in ColumnarRecords.VOCABULARIES]),
+        ('columns', columns)
+    ])
+    encoded_header = dumps(header).encode('utf-8')
+
+    with open(path, 'wb') as f:
+        f.write(_SNAPSHOT_MAGIC)
+        f.write(struct.pack('<Q', len(encoded_header)))
+        f.write(encoded_header)
+        for name, _ in ColumnarRecords.COLUMNS:
+            getattr(records, name).tofile(f)
+
+
+def load_user(path, columnar=True, check_version=True):
+    """
+    Load a user from a binary snapshot created by :meth:`save_user`.
+
+    Columns are read from the file directly into their arrays: records
+    are neither parsed, validated, nor sorted again, and the home of the
+    user is not recomputed.
+
+    Parameters
+    ----------
+    path : str
+        Path of the snapshot file.
+    columnar : boolean, default True
+        Keep the records in a compact :class:`~bandicoot.core.ColumnarRecords`.
+        If False, records are converted to a list of
+        :class:`~bandicoot.core.Record` objects.
+    check_version : boolean, default True
+        Raise a ValueError if the snapshot was created with another version
+        of bandicoot.
+    """
+    import bandicoot
+
+    with open(path, 'rb') as f:
+        if f.read(len(_SNAPSHOT_MAGIC)) != _SNAPSHOT_MAGIC:
+            raise ValueError("{} is not a bandicoot snapshot.".format(path))
+
+        header_length, = struct.unpack('<Q', f.read(8))
+        header = loads(f.read(header_length).decode('utf-8'))
+        start = f.tell()
+
+        if header['format'] != _SNAPSHOT_FORMAT:
+            raise ValueError("Snapshot format {} is not supported.".format(
+                header['format']))
+        if check_version and header['version'] != bandicoot.__version__:
+            raise ValueError("The snapshot {} was created with bandicoot {} "
+                             "(current version: {}).".format(
+                                 path, header['version'],
+                                 bandicoot.__version__))
+
+        records = ColumnarRecords()
+        for name, typecode, offset, nbytes in header['columns']:
+            column = array.array(typecode)
+            f.seek(start + offset)
+            column.fromfile(f, nbytes // column.itemsize)
+            if header['byteorder'] != sys.byteorder:
+                column.byteswap()
+            setattr(records, name, column)
+
+    for name, values in zip(ColumnarRecords.VOCABULARIES,
+                            header['vocabularies']):
+        setattr(records, name, _Vocabulary(values))
+    records.integer_durations = header['integer_durations']
+
+    def _time(t):
+        return datetime.strptime(t, '%H:%M:%S').time()
+
+    def _location(l):
+        return tuple(l) if l is not None else None
+
+    user = User(columnar=columnar)
+    user._records = records if columnar else list(records)
+    if len(records) > 0:
+        user.start_time = records[0].datetime
+        user.end_time = records[-1].datetime
+
+    user._antennas = dict((a, _location(l)) for a, l in header['antennas'])
+    user._recharges = [Recharge(datetime.strptime(d, '%Y-%m-%d %H:%M:%S'),
+                                amount, retailer)
+                       for d, amount, retailer in header['recharges']]
+
+    user.name = header['name']
+    user.antennas_path = header['antennas_path']
+    user.attributes_path = header['attributes_path']
+    user.recharges_path = header['recharges_path']
+    user.night_start = _time(header['night_start'])
+    user.night_end = _time(header['night_end'])
+    user.weekend = header['weekend']
+    user.has_call = header['has_call']
+    user.has_text = header['has_text']
+    user.has_antennas = header['has_antennas']
+    user.ignored_records = header['ignored_records']
+    user.attributes = header['attributes']
+
+    if header['home'] is not None:
+        antenna, location = header['home']
+        user.home = Position(antenna=antenna, location=_location(location))
+
+    return user
+
+
 def read_orange(user_id, records_path, antennas_path=None,
                 attributes_path=None, recharges_path=None, network=False,
                 describe=True, warnings=True, errors=False):
@@ -24,13 +24,43 @@ from __future__ import division
 
 import math
 
-from .helper.group import spatial_grouping, grouping_query, statistics
-from .helper.maths import entropy, great_circle_distance
+from .helper.group import spatial_grouping, statistics
+from .helper.aggregate import mergeable
+from .helper.maths import entropy, great_circle_distance, HyperLogLog, \
+    SpaceSaving
 from .helper.tools import pairwise
 from collections import Counter, OrderedDict
 
 
+def _positions_state(positions, approximate=False):
+    """
+    Partial state of the indicators on the visited places: the Counter of
+    the positions, or, if ``approximate`` is True, the HyperLogLog sketch of
+    the positions and the Space-Saving sketch of their names.
+    """
+    if approximate:
+        distinct = HyperLogLog()
+        distinct.update(positions)
+        sketch = SpaceSaving()
+        sketch.extend(map(str, positions))
+        return distinct, sketch
+    return Counter(positions)
+
+
+def _home_state(positions, user):
+    return sum(1 for p in positions if p == user.home), len(positions)
+
+
+def _percent_at_home(state, user):
+    if not user.has_home:
+        return None
+
+    total_home, total = state
+    return float(total_home) / total if total != 0 else 0
+
+
 @spatial_grouping(user_kwd=True)
+@mergeable(_home_state, _percent_at_home)
 def percent_at_home(positions, user):
     """
     The percentage of interactions the user had while he was at home.
@@ -42,27 +72,18 @@ def percent_at_home(positions, user):
         will be ``None``.
     """
 
-    if not user.has_home:
-        return None
-
-    total_home = sum(1 for p in positions if p == user.home)
-    return float(total_home) / len(positions) if len(positions) != 0 else 0
+    return _percent_at_home(_home_state(positions, user), user)
 
 
-@spatial_grouping(user_kwd=True)
-def radius_of_gyration(positions, user):
+def _locations_state(positions, user):
     """
-    Returns the radius of gyration, the *equivalent distance* of the mass from
-    the center of gravity, for all visited places. [GON2008]_
-
-    References
-    ----------
-    .. [GON2008] Gonzalez, M. C., Hidalgo, C. A., & Barabasi, A. L. (2008).
-        Understanding individual human mobility patterns. Nature, 453(7196),
-        779-782.
+    Counter of the locations of the positions, if known.
     """
-    d = Counter(p._get_location(user) for p in positions
-                if p._get_location(user) is not None)
+    return Counter(p._get_location(user) for p in positions
+                   if p._get_location(user) is not None)
+
+
+def _radius_of_gyration(d, user):
     sum_weights = sum(d.values())
     positions = list(d.keys())  # Unique positions
 
@@ -84,17 +105,23 @@ def radius_of_gyration(positions, user):
     return math.sqrt(r)
 
 
-@spatial_grouping
-def entropy_of_antennas(positions, normalize=False):
+@spatial_grouping(user_kwd=True)
+@mergeable(_locations_state, _radius_of_gyration)
+def radius_of_gyration(positions, user):
     """
-    The entropy of visited antennas.
+    Returns the radius of gyration, the *equivalent distance* of the mass from
+    the center of gravity, for all visited places. [GON2008]_
 
-    Parameters
+    References
     ----------
-    normalize: boolean, default is False
-        Returns a normalized entropy between 0 and 1.
+    .. [GON2008] Gonzalez, M. C., Hidalgo, C. A., & Barabasi, A. L. (2008).
+        Understanding individual human mobility patterns. Nature, 453(7196),
+        779-782.
     """
-    counter = Counter(p for p in positions)
+    return _radius_of_gyration(_locations_state(positions, user), user)
+
+
+def _entropy_of_antennas(counter, normalize=False):
     raw_entropy = entropy(list(counter.values()))
     n = len(counter)
     if normalize and n > 1:
@@ -104,20 +131,52 @@ def entropy_of_antennas(positions, normalize=False):
 
 
 @spatial_grouping
-def number_of_antennas(positions):
+@mergeable(_positions_state, _entropy_of_antennas)
+def entropy_of_antennas(positions, normalize=False):
     """
-    The number of unique places visited.
+    The entropy of visited antennas.
+
+    Parameters
+    ----------
+    normalize: boolean, default is False
+        Returns a normalized entropy between 0 and 1.
     """
-    return len(set(positions))
+    return _entropy_of_antennas(Counter(positions), normalize)
+
+
+def _number_of_antennas(state, approximate=False):
+    if approximate:
+        return int(round(state[0].cardinality()))
+    return len(state)
 
 
 @spatial_grouping
-def frequent_antennas(positions, percentage=0.8):
+@mergeable(_positions_state, _number_of_antennas)
+def number_of_antennas(positions, approximate=False):
     """
-    The number of location that account for 80% of the locations where the user was.
-    Percentage can be supplied as a decimal (e.g., .8 for default 80%).
+    The number of unique places visited.
+
+    With ``approximate=True``, the number of places is estimated with a
+    :class:`~bandicoot.helper.maths.HyperLogLog` sketch, with a relative
+    standard error of 1.6%.
     """
-    location_count = Counter(list(map(str, positions)))
+    if approximate:
+        sketch = HyperLogLog()
+        sketch.update(positions)
+        return int(round(sketch.cardinality()))
+
+    return len(set(positions))
+
+
+def _frequent_antennas(state, percentage=0.8, approximate=False):
+    if approximate:
+        distinct, sketch = state
+        n = max(int(round(distinct.cardinality())), len(sketch))
+        return sketch.pareto(percentage, n)
+
+    location_count = Counter()
+    for p, count in state.items():
+        location_count[str(p)] += count
 
     target = math.ceil(sum(location_count.values()) * percentage)
     location_sort = sorted(list(location_count.keys()),
@@ -130,17 +189,24 @@ def frequent_antennas(positions, percentage=0.8):
     return len(location_count) - len(location_sort)
 
 
-def churn_rate(user, summary='default', **kwargs):
+@spatial_grouping
+@mergeable(_positions_state, _frequent_antennas)
+def frequent_antennas(positions, percentage=0.8, approximate=False):
     """
-    Computes the frequency spent at every towers each week, and returns the
-    distribution of the cosine similarity between two consecutives week.
+    The number of location that account for 80% of the locations where the user was.
+    Percentage can be supplied as a decimal (e.g., .8 for default 80%).
 
-    .. note:: The churn rate is always computed between pairs of weeks.
+    With ``approximate=True``, only the 200 most frequent locations are
+    counted, with a :class:`~bandicoot.helper.maths.SpaceSaving` sketch.
+    The number is exact for users with at most 200 locations.
     """
-    if len(user.records) == 0:
-        return statistics([], summary=summary)
+    state = _positions_state(positions, approximate)
+    return _frequent_antennas(state, percentage, approximate)
+
 
-    query = {
+def _churn_query(**kwargs):
+    # Weeks are always compared on all the binned positions
+    return {
         'groupby': 'week',
         'divide_by': OrderedDict([
             ('part_of_week', ['allweek']),
@@ -151,7 +217,19 @@ def churn_rate(user, summary='default', **kwargs):
         'binning': True
     }
 
-    rv = grouping_query(user, query)
+
+def churn_rate(user, summary='default', **kwargs):
+    """
+    Computes the frequency spent at every towers each week, and returns the
+    distribution of the cosine similarity between two consecutives week.
+
+    .. note:: The churn rate is always computed between pairs of weeks.
+    """
+    if len(user.records) == 0:
+        return statistics([], summary=summary)
+
+    # The binned positions are shared with the spatial indicators
+    rv = user._cached_grouping_query(_churn_query())
     weekly_positions = rv[0][1]
 
     all_positions = list(set(p for l in weekly_positions for p in l))
@@ -171,3 +249,6 @@ def churn_rate(user, summary='default', **kwargs):
         cos_dist.append(1 - num / (denom_1 ** .5 * denom_2 ** .5))
 
     return statistics(cos_dist, summary=summary)
+
+
+churn_rate.grouping_query = _churn_query
@@ -0,0 +1,182 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015-2016 Massachusetts Institute of Technology.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Test the parallel batch runner.
+"""
+
+import bandicoot as bc
+import bandicoot.batch
+import unittest
+import tempfile
+import shutil
+import json
+import csv
+import os
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        abspath = os.path.dirname(os.path.abspath(__file__))
+        self.samples = os.path.join(abspath, 'samples', 'manual')
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _expected(self, user_id):
+        user = bc.read_csv(user_id, self.samples, describe=False,
+                           warnings=False)
+        return bc.utils.all(user, flatten=True)
+
+    def test_run(self):
+        output = os.path.join(self.tmp_dir, 'results.csv')
+        manifest = os.path.join(self.tmp_dir, 'users.txt')
+        with open(manifest, 'w') as f:
+            f.write('A\nB\n')
+
+        stats = bc.batch.run(self.samples, output, manifest=manifest,
+                             processes=2, chunksize=1, progress=False)
+        self.assertEqual(stats, {'processed': 2, 'errors': 0, 'skipped': 0})
+
+        with open(output) as f:
+            rows = dict((r['name'], r) for r in csv.DictReader(f))
+        self.assertEqual(sorted(rows.keys()), ['A', 'B'])
+        expected = self._expected('A')
+        self.assertEqual(rows['A']['reporting__number_of_records'],
+                         str(expected['reporting__number_of_records']))
+
+    def test_errors_and_resume(self):
+        records_path = os.path.join(self.tmp_dir, 'records')
+        os.mkdir(records_path)
+        for name in ['A', 'B']:
+            shutil.copy(os.path.join(self.samples, name + '.csv'),
+                        records_path)
+        with open(os.path.join(records_path, 'broken.csv'), 'w') as f:
+            f.write('not,a,records,file\n1,2,3,4\n')
+
+        output = os.path.join(self.tmp_dir, 'results.json')
+        checkpoint = os.path.join(self.tmp_dir, 'checkpoint')
+        errors = os.path.join(self.tmp_dir, 'errors.json')
+
+        # Simulate an interrupted run, where A was already processed
+        with open(checkpoint, 'w') as f:
+            f.write('A\n')
+
+        stats = bc.batch.run(records_path, output, processes=1,
+                             checkpoint=checkpoint, errors=errors,
+                             progress=False)
+        self.assertEqual(stats, {'processed': 2, 'errors': 1, 'skipped': 1})
+
+        with open(output) as f:
+            results = [json.loads(line) for line in f]
+        self.assertEqual([r['name'] for r in results], ['B'])
+
+        with open(errors) as f:
+            error = json.loads(f.readline())
+        self.assertEqual(error['name'], 'broken')
+        self.assertIn('Traceback', error['error'])
+
+        # Users which failed are processed again when resuming
+        with open(checkpoint) as f:
+            self.assertEqual(sorted(f.read().split()), ['A', 'B'])
+        stats = bc.batch.run(records_path, output, processes=1,
+                             checkpoint=checkpoint, errors=errors,
+                             progress=False)
+        self.assertEqual(stats, {'processed': 1, 'errors': 1, 'skipped': 2})
+
+    def test_resume_after_checkpoint(self):
+        output = os.path.join(self.tmp_dir, 'results.csv')
+        checkpoint = os.path.join(self.tmp_dir, 'checkpoint')
+        manifest = os.path.join(self.tmp_dir, 'users.txt')
+        with open(manifest, 'w') as f:
+            f.write('A\nB\n')
+        bc.batch.run(self.samples, output, manifest=manifest, processes=1,
+                     progress=False)
+
+        # B was exported, but the run stopped before the checkpoint
+        with open(checkpoint, 'w') as f:
+            f.write('A\n')
+        stats = bc.batch.run(self.samples, output, manifest=manifest,
+                             processes=1, checkpoint=checkpoint,
+                             progress=False)
+        self.assertEqual(stats['processed'], 0)
+
+        with open(output) as f:
+            names = [r['name'] for r in csv.DictReader(f)]
+        self.assertEqual(sorted(names), ['A', 'B'])
+
+    def test_csv_fields(self):
+        # B has no attributes, and is exported before A
+        output = os.path.join(self.tmp_dir, 'results.csv')
+        manifest = os.path.join(self.tmp_dir, 'users.txt')
+        with open(manifest, 'w') as f:
+            f.write('B\nA\n')
+        attributes_path = os.path.join(os.path.dirname(self.samples),
+                                       'attributes')
+
+        bc.batch.run(self.samples, output, manifest=manifest, processes=1,
+                     load_options={'attributes_path': attributes_path},
+                     progress=False)
+
+        with open(output) as f:
+            rows = dict((r['name'], r) for r in csv.DictReader(f))
+        user = bc.read_csv('A', self.samples, describe=False, warnings=False,
+                           attributes_path=attributes_path)
+        expected = bc.utils.all(user, flatten=True)
+        attributes = [k for k in expected if k.startswith('attributes__')]
+        self.assertGreater(len(attributes), 0)
+        for key in attributes:
+            self.assertEqual(rows['A'][key], str(expected[key]))
+            self.assertEqual(rows['B'][key], '')
+
+    def test_network_options(self):
+        # Network columns are found with options other than the defaults
+        output = os.path.join(self.tmp_dir, 'results.csv')
+        network = os.path.join(os.path.dirname(self.samples), 'network')
+        antennas = os.path.join(os.path.dirname(self.samples), 'towers.csv')
+        attributes = os.path.join(os.path.dirname(self.samples), 'attributes')
+
+        status = bc.batch.main([network, output, '--network', '--quiet',
+                                '--antennas', antennas,
+                                '--attributes', attributes,
+                                '--groupby', 'none', '--summary', 'extended',
+                                '--split-week', '--processes', '1'])
+        self.assertEqual(status, 0)
+
+        with open(output) as f:
+            reader = csv.DictReader(f)
+            fields = reader.fieldnames
+            rows = dict((r['name'], r) for r in reader)
+
+        user = bc.read_csv('ego', network, antennas, describe=False,
+                           warnings=False, attributes_path=attributes,
+                           network=True)
+        expected = bc.utils.all(user, groupby=None, summary='extended',
+                                split_week=True, network=True, flatten=True)
+        self.assertLessEqual(set(expected), set(fields))
+        self.assertIn('assortativity_indicators__active_days__allweek__'
+                      'allday__callandtext__mean', fields)
+        for key, value in expected.items():
+            if key.startswith('assortativity') and value is not None:
+                self.assertAlmostEqual(float(rows['ego'][key]), value,
+                                       places=4)
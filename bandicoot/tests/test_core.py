@@ -28,7 +28,11 @@ import bandicoot as bc
 from .testing_tools import parse_dict
 
 import unittest
+import copy
+import tempfile
+import threading
 import datetime
+import time
 import sys
 import os
 
@@ -88,7 +92,305 @@ class TestTowers(unittest.TestCase):
         towers = parse_dict("samples/towers.json")
         towers = {key: tuple(value) for (key, value) in towers.items()}
 
-        self.assertDictEqual(self.user.antennas, towers)
+        self.assertIsInstance(self.user.antennas, bc.core.AntennaRegistry)
+        self.assertDictEqual(dict(self.user.antennas), towers)
+
+    def test_shared_registry(self):
+        other = bc.io.read_csv(
+            "B", "samples/manual/", "samples/towers.csv", describe=False)
+        self.assertIs(other.antennas.locations, self.user.antennas.locations)
+
+        registry = self.user.antennas
+        code = registry.codes['1']
+        self.assertEqual(registry.ids[code], '1')
+        self.assertIs(registry['1'], registry.locations[code])
+        self.assertIsNone(registry.get('unknown'))
+
+        # Registries are copied when modified
+        registry['new'] = (1., 2.)
+        del registry['1']
+        self.assertEqual(registry['new'], (1., 2.))
+        self.assertNotIn('1', registry)
+        self.assertEqual([registry.codes[a] for a in registry],
+                         list(range(len(registry))))
+        self.assertNotIn('new', other.antennas)
+        self.assertIn('1', other.antennas)
+
+    def test_registry_file_changed(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'antennas.csv')
+        try:
+            for location in ['1,2', '3.5,4']:
+                with open(path, 'w') as f:
+                    f.write('antenna_id,latitude,longitude\n')
+                    f.write('a,%s\n' % location)
+                registry = bc.io._load_antennas(path)
+            self.assertEqual(registry['a'], (3.5, 4.))
+        finally:
+            os.unlink(path)
+            os.rmdir(directory)
+
+
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        self.user = bc.io.read_csv(
+            "A", "samples/manual/", "samples/towers.csv", describe=False)
+        self.columnar_user = bc.io.read_csv(
+            "A", "samples/manual/", "samples/towers.csv", describe=False,
+            columnar=True)
+
+    def test_records(self):
+        self.assertIsInstance(self.columnar_user.records,
+                              bc.core.ColumnarRecords)
+        self.assertEqual(list(self.columnar_user.records),
+                         list(self.user.records))
+        self.assertEqual(self.columnar_user.records[-1],
+                         self.user.records[-1])
+        self.assertEqual(self.columnar_user.home, self.user.home)
+
+    def test_indicators(self):
+        rv = bc.utils.all(self.user, flatten=True, split_week=True)
+        columnar_rv = bc.utils.all(self.columnar_user, flatten=True,
+                                   split_week=True)
+        self.assertEqual(rv, columnar_rv)
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.user = bc.io.read_csv(
+            "A", "samples/manual/", "samples/towers.csv", describe=False)
+
+    def test_lru(self):
+        cache = bc.helper.cache.LRUCache(max_size=3)
+        cache.put('a', 1, tags=['records'], size=2)
+        cache.put('b', 2, tags=['positions'], size=1)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3, size=1)
+
+        # 'b' is the least recently used entry
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.invalidate('records'), 1)
+        self.assertRaises(KeyError, cache.get, 'a')
+        self.assertEqual(cache.info(), (1, 1, 1, 1, 1, 3))
+
+    def test_invalidation(self):
+        # One scan for calls, one for texts, and one for binned positions
+        bc.individual.number_of_contacts(self.user)
+        bc.spatial.number_of_antennas(self.user)
+        self.assertEqual(self.user.cache_info().entries, 3)
+
+        bc.individual.number_of_contacts(self.user)
+        self.assertEqual(self.user.cache_info().hits, 2)
+
+        # Queries with other interactions share the same scans
+        bc.individual.call_duration(self.user)
+        self.assertEqual(self.user.cache_info().entries, 3)
+        self.assertEqual(self.user.cache_info().hits, 3)
+
+        # Only the binned scan depends on the antennas
+        self.user.antennas = dict(self.user.antennas)
+        self.assertEqual(self.user.cache_info().entries, 2)
+        self.user.set_home((42.3555368, -71.099507))
+        self.assertEqual(self.user.cache_info().entries, 2)
+        self.user.weekend = [6, 7]
+        self.assertEqual(self.user.cache_info().entries, 2)
+        bc.individual.number_of_contacts(self.user, split_week=True)
+        self.assertEqual(self.user.cache_info().entries, 6)
+        self.user.weekend = [7]
+        self.assertEqual(self.user.cache_info().entries, 2)
+
+        self.user.records = self.user.records
+        self.assertEqual(self.user.cache_info().entries, 0)
+
+    def test_single_flight(self):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+        grouping_scan = bc.core.grouping_scan
+
+        def slow_scan(user, scan):
+            calls.append(scan.groupby)
+            started.set()
+            release.wait()
+            if scan.groupby == 'day':
+                raise ValueError("failed")
+            return grouping_scan(user, scan)
+
+        def compute(groupby, results):
+            try:
+                results.append(bc.individual.number_of_contacts(
+                    self.user, groupby=groupby, interaction='call'))
+            except ValueError as e:
+                results.append(e)
+
+        bc.core.grouping_scan = slow_scan
+        try:
+            for groupby in ['week', 'day']:
+                results = []
+                started.clear()
+                release.clear()
+                threads = [threading.Thread(target=compute,
+                                            args=(groupby, results))
+                           for _ in range(4)]
+                threads[0].start()
+                started.wait()
+                for t in threads[1:]:
+                    t.start()
+                time.sleep(0.2)  # Let the other threads wait for the first
+                release.set()
+                for t in threads:
+                    t.join()
+                self.assertEqual(len(results), 4)
+                self.assertTrue(all(r == results[0] for r in results))
+        finally:
+            bc.core.grouping_scan = grouping_scan
+
+        # Each scan was computed once, and the failed one was not cached
+        self.assertEqual(calls, ['week', 'day'])
+        self.assertIsInstance(results[0], ValueError)
+        self.assertEqual(self.user.cache_info().entries, 1)
+
+    def test_bounded(self):
+        self.user.cache_max_records = 1
+        rv = bc.utils.all(self.user, flatten=True)
+        info = self.user.cache_info()
+        self.assertEqual(info.entries, 1)
+        self.assertGreater(info.evictions, 0)
+
+        self.user.cache_max_records = None
+        self.assertEqual(bc.utils.all(self.user, flatten=True), rv)
+
+
+class TestAppend(unittest.TestCase):
+    def setUp(self):
+        self.user = bc.io.read_csv(
+            "A", "samples/manual/", "samples/towers.csv", describe=False)
+        self.records = list(self.user.records)
+        last_day = self.records[-1].datetime.date()
+        self.split = min(i for i, r in enumerate(self.records)
+                         if r.datetime.date() == last_day)
+
+    def _load(self, records, columnar=False):
+        user = bc.io.read_csv(
+            "A", "samples/manual/", "samples/towers.csv", describe=False,
+            columnar=columnar)
+        user.records = records
+        return user
+
+    def test_append(self):
+        for columnar in [False, True]:
+            # New records after the existing ones, or in the middle
+            for batch in [self.records[self.split:], self.records[:5]]:
+                user = self._load([r for r in self.records
+                                   if r not in batch], columnar)
+                user.append_records(batch)
+
+                self.assertEqual(list(user.records), self.records)
+                self.assertEqual(user.home, self.user.home)
+                self.assertEqual(user.start_time, self.user.start_time)
+                self.assertEqual(user.end_time, self.user.end_time)
+                self.assertEqual(
+                    (user.has_call, user.has_text, user.has_antennas),
+                    (self.user.has_call, self.user.has_text,
+                     self.user.has_antennas))
+
+        self.assertRaises(ValueError, self.user.append_records,
+                          self.records[::-1])
+
+    def test_validate(self):
+        for columnar in [False, True]:
+            user = self._load(self.records[:self.split], columnar)
+            clone = copy.copy(user)
+            last = self.records[-1]
+            batch = [bc.Record(r.interaction, r.direction, r.correspondent_id,
+                               r.datetime, r.call_duration,
+                               bc.Position(antenna=r.position.antenna))
+                     for r in self.records[self.split:]]
+            invalid = bc.Record('call', 'in', 'C', last.datetime, None,
+                                last.position)
+            user.append_records(batch + [invalid])
+
+            # Invalid records are removed, and locations are updated
+            self.assertEqual(list(user.records), self.records)
+            self.assertEqual(user.ignored_records['all'], 1)
+            self.assertEqual(user.ignored_records['call_duration'], 1)
+
+            # Copies of the user are not modified
+            self.assertEqual(list(clone.records),
+                             self.records[:self.split])
+
+    def test_home(self):
+        night = datetime.datetime(2014, 8, 1, 23)
+
+        def record(minutes, antenna):
+            return bc.Record('text', 'out', 'B',
+                             night + datetime.timedelta(minutes=minutes),
+                             None, bc.Position(antenna=antenna))
+
+        user = bc.User()
+        user.records = [record(0, 'a'), record(1440, 'b')]
+        # Ties with the candidate of the last chunk, binned again
+        for batch in [[record(1450, 'c'), record(1455, 'c')],
+                      [record(2880, 'b')], [record(4320, 'c')],
+                      [record(5760, 'a')], [record(5770, 'b')]]:
+            user.append_records(batch)
+            home = user.home
+            self.assertEqual(home, user.recompute_home())
+
+    def test_indicators(self):
+        sample = bc.tests.sample_user()
+        sample.use_aggregates = True
+        records = list(sample.records)
+        split = len(records) - 20
+
+        user = bc.tests.sample_user()
+        user.use_aggregates = True
+        user.records = records[:split]
+        bc.utils.all(user, flatten=True, split_week=True)
+        user.append_records(records[split:])
+
+        def stale():
+            return [k for k, _, _ in user._cache.items() if k[0] == 'stale']
+
+        # Periods before the last week are kept
+        self.assertGreater(len(stale()), 0)
+        rv = bc.utils.all(sample, flatten=True, split_week=True)
+        self.assertEqual(bc.utils.all(user, flatten=True, split_week=True),
+                         rv)
+        self.assertEqual(len(stale()), 0)
+
+        # Kept periods are bounded by the cache
+        user.records = records[:split]
+        user.cache_max_records = 1000
+        bc.utils.all(user, flatten=True, split_week=True)
+        user.append_records(records[split:])
+        self.assertLessEqual(user.cache_info().size, 1000)
+        self.assertEqual(bc.utils.all(user, flatten=True, split_week=True),
+                         rv)
+
+
+class TestDeduplicator(unittest.TestCase):
+    def setUp(self):
+        records = bc.io.read_csv("A", "samples/manual/", describe=False,
+                                 warnings=False).records
+        self.records = sorted(list(records) + list(records)[::3],
+                              key=lambda r: r.datetime)
+
+    def test_filter(self):
+        dedup = bc.core.Deduplicator([('interaction', 'direction')])
+        kept = list(dedup.filter(self.records))
+
+        self.assertEqual(len(kept), len(set(self.records)))
+        self.assertEqual(set(kept), set(self.records))
+        self.assertEqual(dedup.duplicated_records,
+                         len(self.records) - len(kept))
+        self.assertGreaterEqual(dedup.counts[('interaction', 'direction')],
+                                dedup.duplicated_records)
+
+    def test_unsorted(self):
+        dedup = bc.core.Deduplicator()
+        with self.assertRaises(ValueError):
+            list(dedup.filter(self.records[::-1]))
 
 
 class TestDescribe(unittest.TestCase):
@@ -24,6 +24,10 @@ import bandicoot as bc
 import unittest
 from .testing_tools import file_equality
 import tempfile
+import shutil
+import gzip
+import json
+import csv
 import os
 from collections import OrderedDict as OD
 
@@ -104,3 +108,68 @@ class TestExport(unittest.TestCase):
         finally:
             tmp_file.close()
             os.unlink(tmp_file.name)
+
+    def test_csv_writer(self):
+        dict1 = OD([("x", 1), ("y", 2), ("z", 3)])
+        dict2 = OD([("a", 4), ("b", 5), ("c", 6)])
+        tmp_dir = tempfile.mkdtemp()
+        filename = os.path.join(tmp_dir, 'results.csv.gz')
+
+        try:
+            fields = ["x", "y", "z", "a", "b", "c"]
+            with bc.io.CsvIndicatorWriter(filename, fields) as writer:
+                writer.write(dict1)
+            with bc.io.CsvIndicatorWriter(filename, append=True) as writer:
+                writer.write(dict2)
+                self.assertEqual(writer.fields, fields)
+
+            with gzip.open(filename, 'rt') as f:
+                rows = list(csv.reader(f))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        with open("samples/to_csv_different_keys.csv") as f:
+            self.assertEqual(rows, list(csv.reader(f)))
+
+    def test_ndjson_writer(self):
+        dict1 = OD([("name", "dict1"), ("x", 1), ("y", OD([("z", 3)]))])
+        dict2 = OD([("name", "dict2"), ("a", 4.5)])
+        tmp_file = tempfile.NamedTemporaryFile(delete=False)
+        tmp_file.close()
+
+        try:
+            with bc.io.NdjsonIndicatorWriter(tmp_file.name) as writer:
+                writer.write(dict1)
+                writer.write(dict2)
+            with open(tmp_file.name) as f:
+                rows = [json.loads(line, object_pairs_hook=OD) for line in f]
+        finally:
+            os.unlink(tmp_file.name)
+
+        self.assertEqual(rows, [dict1, dict2])
+
+    def test_user_snapshot(self):
+        user = bc.read_csv('A', 'samples/manual', 'samples/towers.csv',
+                           recharges_path='samples/manual/recharges',
+                           attributes_path='samples/attributes',
+                           describe=False)
+        tmp_file = tempfile.NamedTemporaryFile(delete=False)
+        tmp_file.close()
+
+        try:
+            bc.io.save_user(user, tmp_file.name)
+            snapshot = bc.io.load_user(tmp_file.name)
+            list_snapshot = bc.io.load_user(tmp_file.name, columnar=False)
+        finally:
+            os.unlink(tmp_file.name)
+
+        self.assertEqual(list(snapshot.records), user.records)
+        self.assertEqual(list_snapshot.records, user.records)
+        self.assertEqual(snapshot.antennas, user.antennas)
+        self.assertEqual(snapshot.home, user.home)
+        self.assertEqual(snapshot.ignored_records, user.ignored_records)
+
+        rv = bc.utils.all(user, split_week=True, flatten=True)
+        for u in [snapshot, list_snapshot]:
+            self.assertEqual(bc.utils.all(u, split_week=True, flatten=True),
+                             rv)
@@ -32,7 +32,7 @@ import unittest
 from bandicoot.tests.generate_user import random_burst
 from bandicoot.helper.group import group_records
 from bandicoot.helper.maths import std, mean, SummaryStats
-from datetime import timedelta
+from datetime import timedelta, time
 import numpy as np
 import os
 
@@ -109,6 +109,32 @@ class TestGroup(unittest.TestCase):
         groups = [[r for r in l] for l in grouping]
         self.assertEqual(groups, [[records[0]], [records[1]], [records[2]]])
 
+    def test_padding_group(self):
+        records = [
+            Record("call", "in", "1", dt(2014, 1, 31), 1, Position()),
+            Record("call", "in", "1", dt(2014, 3, 15), 1, Position()),
+            Record("call", "in", "1", dt(2014, 3, 16), 1, Position())
+        ]
+        grouping = bc.helper.group.group_records_with_padding
+        self.assertEqual(list(grouping(records, groupby='month')),
+                         [[records[0]], [], records[1:]])
+        self.assertEqual(len(list(grouping(records, groupby='week'))), 7)
+        self.assertEqual(list(grouping(records, groupby='year')), [records])
+
+    def test_calendar_keys(self):
+        records = list(random_burst(100, delta=timedelta(hours=11)))
+        user = bc.User()
+        user.records = records
+        columnar = bc.User(columnar=True)
+        columnar.records = records
+
+        for groupby in ['day', 'week', 'month', 'year']:
+            keys = bc.helper.group.calendar_keys(user, groupby)
+            self.assertEqual(list(keys), list(bc.helper.group.calendar_keys(
+                columnar, groupby)))
+            self.assertEqual(len(set(keys)), len(list(
+                group_records(records, groupby=groupby))))
+
     def test_weekday_filter(self):
         records = [
             Record("test_itr", "in", "1", dt(2014, 8, 22), 1, Position()),
@@ -151,6 +177,39 @@ class TestGroup(unittest.TestCase):
         rv = bc.helper.group.filter_user(user, part_of_day='day')
         self.assertEqual(rv, [records[0], records[1], records[2]])
 
+    def test_partitions(self):
+        records = [
+            Record("call", "in", "1", dt(2014, 8, 22, 10, 00), 1, Position()),
+            Record("text", "in", "2", dt(2014, 8, 23, 10, 00), 1, Position()),
+            Record("call", "in", "1", dt(2014, 8, 23, 22, 00), 1, Position()),
+            Record("call", "in", "2", dt(2014, 8, 24, 2, 00), 1, Position())
+        ]
+        user = bc.User()
+        user.records = records
+        filter_user = bc.helper.group.filter_user
+
+        rv = filter_user(user, interaction='call', part_of_week='weekend',
+                         part_of_day='night')
+        self.assertEqual(rv, [records[2], records[3]])
+
+        # Masks are updated with the settings of the user
+        user.weekend = [5]
+        rv = filter_user(user, part_of_week='weekend')
+        self.assertEqual(rv, [records[0]])
+        user.night_start = time(23)
+        rv = filter_user(user, part_of_week='weekday', part_of_day='night')
+        self.assertEqual(rv, [records[3]])
+
+        user.add_partition('friend', lambda r: r.correspondent_id == '1')
+        rv = filter_user(user, interaction='call', friend=True)
+        self.assertEqual(rv, [records[0], records[2]])
+        rv = bc.individual.number_of_interactions(
+            user, groupby=None, split_by={'friend': [True, False]})
+        self.assertEqual(rv['allweek']['allday']['call'][True], 2)
+        self.assertEqual(rv['allweek']['allday']['call'][False], 1)
+
+        self.assertRaises(KeyError, filter_user, user, family=True)
+
     def test_none_group(self):
         records = [
             Record("call", "in", "1", dt(2014, 9, 4), 1, Position()),
@@ -164,6 +223,30 @@ class TestGroup(unittest.TestCase):
         with self.assertRaises(StopIteration):
             next(grouping)
 
+    def test_shared(self):
+        calls = []
+
+        def _count(records, direction):
+            calls.append(direction)
+            return len([r for r in records if r.direction == direction])
+
+        records = list(random_burst(20))
+        group = bc.helper.group.RecordGroup(records)
+        shared = bc.helper.group.shared
+
+        self.assertEqual(shared(group, _count, 'in'),
+                         shared(records, _count, 'in'))
+        self.assertEqual(shared(group, _count, 'in'),
+                         _count(records, 'in'))
+        shared(group, _count, 'out')
+        self.assertEqual(calls, ['in', 'in', 'in', 'out'])
+
+        # Groups keep a bounded number of values
+        for i in range(2 * bc.helper.group.SHARED_MAX_VALUES):
+            shared(group, _count, i)
+        self.assertEqual(len(group._shared),
+                         bc.helper.group.SHARED_MAX_VALUES)
+
 
 class ConsistencyTests(unittest.TestCase):
     def setUp(self):
@@ -25,7 +25,9 @@ Test the unweighted and weighted clustering methods from bandicoot.network.
 """
 
 import bandicoot as bc
+from datetime import datetime, timedelta
 import unittest
+import random
 import os
 import networkx as nx
 
@@ -78,6 +80,65 @@ class TestClustering(unittest.TestCase):
         self.assertAlmostEqual(bc_clustering_coeff, nx_clustering_coeff)
 
 
+class TestNetworkLoader(unittest.TestCase):
+    def setUp(self):
+        abspath = os.path.abspath(__file__)
+        os.chdir(abspath[:abspath.index(os.path.basename(__file__))])
+
+    def test_read(self):
+        with bc.io.NetworkLoader(
+                'samples/network', 'samples/towers.csv',
+                attributes_path='samples/attributes') as loader:
+            self.assertIn('ego', loader.user_ids)
+
+            for user_id in ['ego', 'A', 'ego']:
+                expected = bc.read_csv(user_id, 'samples/network',
+                                       'samples/towers.csv',
+                                       attributes_path='samples/attributes',
+                                       network=True, describe=False,
+                                       warnings=False)
+                user = loader.read(user_id, warnings=False)
+
+                self.assertEqual(
+                    bc.utils.all(user, network=True, flatten=True),
+                    bc.utils.all(expected, network=True, flatten=True))
+
+            # Cached users are shared, and never filtered in place
+            shared = loader.get(['A'])['A']
+            self.assertIs(shared, loader.get(['A'])['A'])
+            self.assertEqual(shared.records, bc.read_csv(
+                'A', 'samples/network', describe=False,
+                warnings=False).records)
+
+    def test_max_records(self):
+        loader = bc.io.NetworkLoader('samples/network', max_records=1)
+        loader.read('ego', warnings=False)
+        self.assertEqual(len(loader._cache), 1)
+        loader.close()
+
+
+class TestMatchIndex(unittest.TestCase):
+    def test_has_match(self):
+        random.seed(42)
+        start = datetime(2014, 1, 1)
+
+        def random_record():
+            return bc.Record(
+                interaction=random.choice(['call', 'text']),
+                direction=random.choice(['in', 'out', None]),
+                correspondent_id='A',
+                datetime=start + timedelta(seconds=random.randint(0, 600)),
+                call_duration=random.choice([None, 10, 10.0, 20]),
+                position=bc.Position())
+
+        records = [random_record() for _ in range(200)]
+        index = bc.core.MatchIndex(records)
+
+        candidates = [random_record() for _ in range(500)]
+        self.assertEqual([index.has_match(r) for r in candidates],
+                         [r.has_match(records) for r in candidates])
+
+
 class TestAssortativity(unittest.TestCase):
 
     @classmethod
@@ -28,6 +28,8 @@ import bandicoot as bc
 from bandicoot.core import Record, Position
 from datetime import datetime as dt
 import unittest
+import tempfile
+import csv
 import os
 
 
@@ -107,6 +109,89 @@ class TestParsers(unittest.TestCase):
             'individual_id': '7atr8f53fg41'
         })
 
+    def test_iter_users(self):
+        tmp_file = tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                               delete=False)
+        try:
+            with tmp_file:
+                writer = csv.writer(tmp_file)
+                for i, name in enumerate(['A', 'B']):
+                    with open('samples/manual/%s.csv' % name) as f:
+                        rows = list(csv.reader(f))
+                    if i == 0:
+                        writer.writerow(['user_id'] + rows[0])
+                    writer.writerows([name] + row for row in rows[1:])
+
+            users = list(bc.io.iter_users(
+                tmp_file.name, antennas_path='samples/towers.csv',
+                recharges_path='samples/manual/recharges'))
+        finally:
+            os.unlink(tmp_file.name)
+
+        self.assertEqual([u.name for u in users], ['A', 'B'])
+        for user in users:
+            expected = bc.read_csv(user.name, 'samples/manual',
+                                   'samples/towers.csv', describe=False,
+                                   recharges_path='samples/manual/recharges')
+            self.assertEqual(user.records, expected.records)
+            self.assertEqual(user.antennas, expected.antennas)
+            self.assertEqual(len(user.recharges), len(expected.recharges))
+            self.assertEqual(user.ignored_records, expected.ignored_records)
+            self.assertEqual(user.home, expected.home)
+
+    def test_parse_records(self):
+        header = ['interaction', 'direction', 'correspondent_id', 'datetime',
+                  'call_duration', 'antenna_id', 'latitude', 'longitude']
+        rows = [
+            ['call', 'in', 'A', '2014-06-01 01:00:00', '00:14:33', '11201'],
+            ['', 'out', 'B', '2014-6-1 01:00:00', '', '', '42.3', '-71.1'],
+            ['text', 'in', 'C', '2014-13-01 01:00:00', '14:33', '', 'x', '0'],
+            [],
+            ['call', 'out']
+        ]
+
+        rv = bc.io._parse_records(iter(rows), header, '%H:%M:%S')
+        expected = [bc.io._parse_record(dict(zip(header, r + [None] * 8)),
+                                        '%H:%M:%S') for r in rows if r]
+        self.assertEqual(list(map(repr, rv)), list(map(repr, expected)))
+        self.assertEqual(rv[0].call_duration, 873)
+        self.assertEqual(rv[1].datetime, dt(2014, 6, 1, 1, 0, 0))
+        self.assertIs(rv[2].position, ValueError)
+
+    def test_read_csv_empty(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'empty.csv')
+        try:
+            for content in ['', 'interaction,direction\n']:
+                with open(path, 'w') as f:
+                    f.write(content)
+                user = bc.read_csv('empty', directory, describe=False,
+                                   warnings=False)
+                self.assertEqual(len(user.records), 0)
+                self.assertEqual(user.home, None)
+        finally:
+            os.unlink(path)
+            os.rmdir(directory)
+
+    def test_load_home(self):
+        def record(day, position):
+            return Record('text', 'out', 'A', dt(2014, 6, day, 23), None,
+                          position)
+
+        records = [record(1, Position(antenna='1')),
+                   record(2, Position(antenna='1')),
+                   record(3, Position(location=(42.3, -71.1))),
+                   record(4, Position(location=(42.4, -71.1))),
+                   record(5, Position(location=(42.5, -71.1)))]
+        antennas = {'1': (42.36, -71.09)}
+
+        # The home is computed before the locations of the antennas are
+        # given to the records: GPS locations are distinct candidates
+        user, _ = bc.io.load('A', records, antennas, warnings=False)
+        self.assertEqual(user.home, Position(antenna='1'))
+        self.assertEqual(user.home.location, (42.36, -71.09))
+        self.assertEqual(user.records[2].position.location, None)
+
     def test_read_duration_format(self):
         raw = {
             'antenna_id': '11201|11243',
@@ -131,3 +216,29 @@ class TestParsers(unittest.TestCase):
         raw['call_duration'] = ''
         rv = bc.io._parse_record(raw, duration_format='seconds').call_duration
         self.assertEqual(rv, None)
+
+    def test_data_quality(self):
+        user = bc.read_csv('u_test_antennas', 'samples',
+                           'samples/towers.csv', describe=False)
+        records = list(user.records) + list(user.records)[:10]
+
+        user, _ = bc.io.load('test', records, user.antennas, warnings=False)
+        report = user.data_quality
+        self.assertEqual(report.number_of_records, len(records))
+        self.assertEqual(report.duplicated_records,
+                         len(records) - len(set(records)))
+        self.assertAlmostEqual(
+            report.percent_records_missing_location,
+            bc.helper.tools.percent_records_missing_location(user))
+        self.assertEqual(report.antennas_missing_location,
+                         bc.helper.tools.antennas_missing_locations(user))
+        self.assertEqual(report.percent_overlapping_calls,
+                         bc.helper.tools.percent_overlapping_calls(
+                             user.records, 300))
+
+        dropped, _ = bc.io.load('test', records, user.antennas,
+                                warnings=False, drop_duplicates=True)
+        self.assertEqual(len(dropped.records), len(set(records)))
+        self.assertEqual(dropped.data_quality.number_of_calls,
+                         len([r for r in dropped.records
+                              if r.interaction == 'call']))
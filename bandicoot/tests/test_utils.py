@@ -28,8 +28,12 @@ import bandicoot as bc
 import unittest
 from scipy import stats
 import numpy as np
+import json
 import os
 import copy
+from collections import Counter
+from functools import partial
+import multiprocessing
 from datetime import datetime
 
 
@@ -146,6 +150,32 @@ class TestUtils(unittest.TestCase):
             skewness=None, kurtosis=None, distribution=[])
         self.assertEqual(bc.helper.maths.summary_stats([]), rv)
 
+    def test_summary_stats_accumulator(self):
+        data = [float(x) for x in self.list_2]
+        expected = bc.helper.maths.summary_stats(data)
+
+        rv = bc.helper.maths.SummaryStats(distribution=[])
+        for x in data[:100]:
+            rv.push(x)
+        rv.merge(bc.helper.maths.summary_stats(data[100:]))
+
+        self.assertEqual(rv.count, len(data))
+        self.assertEqual(rv.distribution, expected.distribution)
+        for key in ['mean', 'std', 'min', 'max', 'median', 'skewness',
+                    'kurtosis']:
+            self.assertAlmostEqual(getattr(rv, key), getattr(expected, key))
+
+        rv = bc.helper.maths.summary_stats(data, keep_distribution=False)
+        self.assertIsNone(rv.distribution)
+        self.assertAlmostEqual(rv.median, expected.median)
+        rv.merge(bc.helper.maths.summary_stats([1, 2]))
+        self.assertIsNone(rv.median)
+
+        with bc.helper.maths.keep_distributions(False):
+            self.assertIsNone(bc.helper.maths.summary_stats(data).distribution)
+        self.assertRaises(ValueError, expected.merge,
+                          bc.helper.maths.SummaryStats(1, 0, 1, 1, 1, 0, 0, []))
+
     def test_percent_overlap(self):
         raw = {
             'antenna_id': '11201|11243',
@@ -175,3 +205,236 @@ class TestUtils(unittest.TestCase):
             bc.helper.tools.percent_overlapping_calls(records, 0), 0.5)
         self.assertAlmostEqual(
             bc.helper.tools.percent_overlapping_calls(records, 300), 0.25)
+
+    def test_all_workers(self):
+        user = bc.read_csv("A", "samples/manual", "samples/towers.csv",
+                           describe=False, warnings=False)
+        expected = bc.utils.all(user, split_week=True, summary='extended')
+
+        user.reset_cache()
+        rv = bc.utils.all(user, split_week=True, summary='extended',
+                          workers=3)
+        self.assertEqual(list(rv.keys()), list(expected.keys()))
+        self.assertEqual(rv, expected)
+
+        # No workers is no parallelism
+        rv = bc.utils.all(user, split_week=True, summary='extended',
+                          workers=0)
+        self.assertEqual(rv, expected)
+        self.assertRaises(ValueError, bc.utils.all, user, workers=-1)
+
+        pool = multiprocessing.Pool(2)
+        try:
+            rv = bc.utils.all(user, split_week=True, summary='extended',
+                              executor=pool, workers=2)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(rv, expected)
+
+    def test_summary_stats_backends(self):
+        data = list(self.list_1)
+        rv = bc.helper.maths.summary_stats(data)
+
+        numpy = bc.helper.maths.np
+        bc.helper.maths.np = None
+        try:
+            python_rv = bc.helper.maths.summary_stats(data)
+        finally:
+            bc.helper.maths.np = numpy
+
+        self.assertEqual(rv.distribution, python_rv.distribution)
+        for key in ['mean', 'std', 'min', 'max', 'median', 'skewness',
+                    'kurtosis']:
+            self.assertIsInstance(getattr(rv, key), float)
+            self.assertAlmostEqual(getattr(rv, key), getattr(python_rv, key))
+
+    def test_quantile_sketch(self):
+        data = [float(x) for x in self.list_1]
+        sorted_data = sorted(data)
+        sketch = bc.helper.maths.QuantileSketch()
+        for i in range(4):
+            part = bc.helper.maths.summary_stats(data[i::4],
+                                                 keep_distribution='sketch')
+            self.assertIsNone(part.distribution)
+            sketch.merge(part.sketch)
+
+        self.assertEqual(sketch.count, len(data))
+        self.assertLess(len(sketch), 3 * sketch.k)
+        self.assertEqual(sketch.quantile(0), sorted_data[0])
+        self.assertEqual(sketch.quantile(1), sorted_data[-1])
+        for q in [0.1, 0.25, 0.5, 0.75, 0.9]:
+            rank = stats.percentileofscore(data, sketch.quantile(q)) / 100
+            self.assertLess(abs(rank - q), 0.03)
+
+        state = json.loads(str(sketch))
+        loaded = bc.helper.maths.QuantileSketch.from_dict(state)
+        self.assertEqual(loaded, sketch)
+
+        # Loaded sketches compact items as the original one
+        for s in [sketch, loaded]:
+            s.extend(data)
+        self.assertEqual(loaded, sketch)
+        self.assertRaises(ValueError, sketch.merge,
+                          bc.helper.maths.QuantileSketch(k=100))
+
+    def test_summary_sketch(self):
+        rv = bc.utils.all(self.user, summary='sketch', flatten=True)
+        expected = bc.utils.all(self.user, summary=None, flatten=True)
+
+        durations = [x for d in expected['call_duration__allweek__allday__call']
+                     for x in d]
+        sketch = rv['call_duration__allweek__allday__call']
+        self.assertIsInstance(sketch, bc.helper.maths.QuantileSketch)
+        self.assertEqual(sketch.count, len(durations))
+        self.assertEqual(sketch.max, max(durations))
+        self.assertEqual(rv['active_days__allweek__allday__callandtext'].count,
+                         len(expected['active_days__allweek__allday__callandtext']))
+
+    def test_cardinality_sketches(self):
+        data = [int(x) for x in self.list_1] + list(range(5000, 20000))
+        weeks = [data[:12000], data[12000:]]
+
+        distinct = bc.helper.maths.HyperLogLog()
+        frequent = bc.helper.maths.SpaceSaving(k=50)
+        for week in weeks:
+            week_distinct = bc.helper.maths.HyperLogLog()
+            week_distinct.update(week)
+            distinct.merge(week_distinct)
+            week_frequent = bc.helper.maths.SpaceSaving(k=50)
+            week_frequent.extend(week)
+            frequent.merge(week_frequent)
+
+        n = len(set(data))
+        self.assertLess(abs(distinct.cardinality() - n),
+                        3 * distinct.relative_error * n)
+        self.assertEqual(bc.helper.maths.HyperLogLog.from_dict(
+            json.loads(json.dumps(distinct.to_dict()))), distinct)
+
+        counts = Counter(data)
+        self.assertEqual(frequent.total, len(data))
+        for item, count, error in frequent.top():
+            self.assertGreaterEqual(count, counts[item])
+            self.assertLessEqual(count - error, counts[item])
+            self.assertLessEqual(error, 2 * frequent.error_bound)
+
+        # Counts are exact with at most k distinct items
+        exact = bc.helper.maths.SpaceSaving(k=10 ** 5)
+        exact.extend(data)
+        target = 0.8 * len(data)
+        pareto = 0
+        for _, count in counts.most_common():
+            if target <= 0:
+                break
+            target -= count
+            pareto += 1
+        self.assertEqual(exact.pareto(0.8, n), pareto)
+        self.assertAlmostEqual(exact.entropy(n),
+                               bc.helper.maths.entropy(list(counts.values())))
+
+    def test_all_approximate(self):
+        rv = bc.utils.all(self.user, split_week=True, flatten=True)
+        approximate = bc.utils.all(self.user, split_week=True, flatten=True,
+                                   approximate=True)
+        self.assertEqual(approximate, rv)
+
+        rv = bc.utils.all(self.user, approximate=['number_of_contacts'])
+        self.assertEqual(rv['number_of_contacts'],
+                         bc.individual.number_of_contacts(self.user,
+                                                          approximate=True))
+
+    def test_plan(self):
+        user = bc.read_csv("A", "samples/manual", "samples/towers.csv",
+                           describe=False, warnings=False)
+        plan = bc.utils.plan(user, split_week=True)
+
+        # Indicators with different interactions share their scans
+        self.assertEqual(len(plan.scans), 12)
+        self.assertIn(('records', 'interaction', 'call'), plan.masks)
+        self.assertEqual(plan.calendar_keys, [('records', 'week')])
+        self.assertEqual(len(plan.bins), 1)
+        self.assertIn('churn_rate', plan.explain())
+
+        plan.execute(user)
+        misses = user.cache_info().misses
+        rv = bc.utils.all(user, split_week=True, flatten=True)
+        self.assertEqual(user.cache_info().misses, misses)
+
+        user.reset_cache()
+        self.assertEqual(bc.utils.all(user, split_week=True, flatten=True), rv)
+
+        # Queries are given by the indicators, without calling them
+        indicator_queries = bc.helper.group.indicator_queries
+        query, = indicator_queries(
+            partial(bc.individual.number_of_interactions, interaction='call'),
+            groupby=None, split_day=True, summary='extended')
+        self.assertEqual(query['groupby'], None)
+        self.assertEqual(query['divide_by']['interaction'], ['call'])
+        self.assertEqual(query['divide_by']['part_of_day'],
+                         ['allday', 'day', 'night'])
+        self.assertTrue(indicator_queries(bc.spatial.churn_rate)[0]['binning'])
+        self.assertEqual(
+            indicator_queries(bc.recharge.average_balance_recharges), [])
+
+    def test_aggregates(self):
+        user = bc.read_csv("A", "samples/manual", "samples/towers.csv",
+                           describe=False, warnings=False)
+        aggregated = copy.deepcopy(user)
+        aggregated.use_aggregates = True
+
+        for kwargs in [{'groupby': 'week', 'split_week': True},
+                       {'groupby': 'month', 'filter_empty': False},
+                       {'groupby': None, 'summary': 'extended'},
+                       {'groupby': 'day', 'approximate': True}]:
+            rv = bc.utils.all(user, flatten=True, **kwargs)
+            aggregated_rv = bc.utils.all(aggregated, flatten=True, **kwargs)
+            self.assertEqual(list(aggregated_rv.keys()), list(rv.keys()))
+            for key, value in rv.items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(aggregated_rv[key], value)
+                else:
+                    self.assertEqual(aggregated_rv[key], value)
+
+        # States are merged from the cached states of shorter periods
+        states = [k for k in aggregated._cache._entries if k[0] == 'states']
+        self.assertIn('weekmonth', [k[-1] for k in states])
+
+        # States are charged by their content, not by their periods
+        content_size = bc.helper.cache.content_size
+        for key, value, _ in aggregated._cache.items():
+            if key[0] == 'states':
+                self.assertEqual(aggregated._cache.size_of(key),
+                                 content_size(value))
+                self.assertGreater(content_size(value), len(value))
+
+        # Distributions are only kept if the summary needs them
+        aggregated.reset_cache()
+        bc.individual.call_duration(aggregated)
+        for key, value, _ in aggregated._cache.items():
+            if key[0] == 'states':
+                for _, state in value:
+                    self.assertIsNone(state.distribution)
+
+        # Returned distributions are copies of the cached ones
+        rv = bc.individual.call_duration(aggregated, groupby=None,
+                                         summary=None)
+        distribution = rv['allweek']['allday']['call']
+        del distribution[:]
+        expected = bc.individual.call_duration(user, groupby=None,
+                                               summary=None)
+        self.assertEqual(bc.individual.call_duration(
+            aggregated, groupby=None, summary=None), expected)
+
+    def test_merge_states(self):
+        merge_states = bc.helper.aggregate.merge_states
+        self.assertEqual(merge_states([Counter(a=1), Counter(a=-1, b=2)]),
+                         Counter(a=0, b=2))
+        self.assertEqual(merge_states([(1, set([1])), (2, set([2]))]),
+                         (3, set([1, 2])))
+
+        stats = [bc.helper.maths.summary_stats([1, 2], keep_distribution=True),
+                 bc.helper.maths.summary_stats([0], keep_distribution=True)]
+        merged = merge_states(stats)
+        self.assertEqual(merged.distribution, [0, 1, 2])
+        self.assertEqual(stats[0].distribution, [1, 2])
+        self.assertRaises(TypeError, merge_states, ['a'])
@@ -21,8 +21,11 @@
 # SOFTWARE.
 
 from bandicoot.helper.tools import OrderedDict
-from bandicoot.helper.group import group_records, group_records_with_padding
+from bandicoot.helper.group import group_records, \
+    group_records_with_padding
+from bandicoot.helper.plan import QueryPlan
 from functools import partial
+from multiprocessing.pool import ThreadPool
 
 import bandicoot as bc
 
@@ -61,60 +64,40 @@ def flatten(d, parent_key='', separator='__'):
     return OrderedDict(items)
 
 
-def all(user, groupby='week', summary='default', network=False,
-        split_week=False, split_day=False, filter_empty=True, attributes=True,
-        flatten=False):
-    """
-    Returns a dictionary containing all bandicoot indicators for the user,
-    as well as reporting variables.
+# Indicators which can be estimated with sketches, see :meth:`all`
+APPROXIMATE_INDICATORS = ['number_of_contacts', 'entropy_of_contacts',
+                          'percent_pareto_interactions', 'number_of_antennas',
+                          'frequent_antennas']
 
-    Relevant indicators are defined in the 'individual', and 'spatial' modules.
 
-    =================================== =======================================================================
-    Reporting variables                 Description
-    =================================== =======================================================================
-    antennas_path                       path of the CSV file containing antennas locations
-    attributes_path                     directory where attributes were loaded
-    version                             bandicoot version
-    groupby                             grouping method ('week' or None)
-    split_week                          whether or not indicators are also computed for weekday and weekend
-    split_day                           whether or not indicators are also computed for day and night
-    start_time                          time of the first record
-    end_time                            time of the last record
-    night_start, night_end              start and end time to define nights
-    weekend                             days used to define the weekend (``[6, 7]`` by default, where 1 is Monday)
-    bins                                number of weeks if the record are grouped
-    has_call                            whether or not records include calls
-    has_text                            whether or not records include texts
-    has_home                            whether or not a :meth:`home location <bandicoot.core.User.recompute_home>` has been found
-    has_network                         whether or not correspondents where loaded
-    percent_records_missing_location    percentage of records without location
-    antennas_missing_locations          number of antennas missing a location
-    percent_outofnetwork_calls          percentage of calls, received or emitted, made with a correspondant not loaded in the network
-    percent_outofnetwork_texts          percentage of texts with contacts not loaded in the network
-    percent_outofnetwork_contacts       percentage of contacts not loaded in the network
-    percent_outofnetwork_call_durations percentage of minutes of calls where the contact was not loaded in the network
-    number_of_records                   total number of records
-    number_of_weeks                     number of weeks with records
-    =================================== =======================================================================
+def _evaluate(args):
+    """
+    Compute a chunk of indicators, given as ``(name, function, datatype)``
+    tuples, for a user. Network indicators have no datatype.
+    """
+    user, chunk, kwargs = args
+    results = []
 
-    We also include a last set of reporting variables, for the records ignored
-    at load-time. Values can be ignored due to missing or inconsistent fields
-    (e.g., not including a valid 'datetime' value).
+    for name, fun, datatype in chunk:
+        if datatype is None:
+            results.append((name, fun(user)))
+            continue
 
-    .. code-block:: python
+        try:
+            metric = fun(user, datatype=datatype, **kwargs)
+        except ValueError:
+            fallback = dict(kwargs)
+            del fallback['summary']
+            metric = fun(user, datatype=datatype, **fallback)
+        results.append((name, metric))
 
-        {
-            'all': 0,
-            'interaction': 0,
-            'direction': 0,
-            'correspondent_id': 0,
-            'datetime': 0,
-            'call_duration': 0
-        }
+    return results
 
-    with the total number of records ignored (key ``'all'``), as well as the
-    number of records with faulty values for each columns.
+
+def _tasks(user, groupby, network, approximate):
+    """
+    Return the indicators computed by :meth:`all`, as ``(name, function,
+    datatype)`` tuples. Network indicators have no datatype.
     """
     scalar_type = 'distribution_scalar' if groupby is not None else 'scalar'
     summary_type = 'distribution_summarystats' if groupby is not None else 'summarystats'
@@ -150,6 +133,14 @@ def all(user, groupby='week', summary='default', network=False,
         (bc.spatial.churn_rate, scalar_type)
     ]
 
+    if approximate is True:
+        approximate = APPROXIMATE_INDICATORS
+    for i, (fun, datatype) in enumerate(functions):
+        if fun.__name__ in (approximate or []):
+            approximated = partial(fun, approximate=True)
+            approximated.__name__ = fun.__name__
+            functions[i] = (approximated, datatype)
+
     if user.has_recharges:
         functions += [
             (bc.recharge.amount_recharges, summary_type),
@@ -166,6 +157,112 @@ def all(user, groupby='week', summary='default', network=False,
         bc.network.assortativity_indicators
     ]
 
+    tasks = [(fun.__name__, fun, datatype) for fun, datatype in functions]
+    if network and user.has_network:
+        tasks += [(fun.__name__, fun, None) for fun in network_functions]
+    return tasks
+
+
+def _plan(user, tasks, kwargs):
+    # Network indicators do not group records
+    return QueryPlan.from_indicators(
+        user, [(name, fun) for name, fun, datatype in tasks
+               if datatype is not None], **kwargs)
+
+
+def plan(user, groupby='week', summary='default', network=False,
+         split_week=False, split_day=False, filter_empty=True,
+         approximate=False):
+    """
+    Return the :class:`~bandicoot.helper.plan.QueryPlan` of the indicators
+    computed by :meth:`all` with the same parameters, without computing
+    them.
+
+    Examples
+    --------
+    >>> print(bc.utils.plan(user, split_week=True).explain())
+    """
+    tasks = _tasks(user, groupby, network, approximate)
+    kwargs = dict(groupby=groupby, summary=summary, filter_empty=filter_empty,
+                  split_week=split_week, split_day=split_day)
+    return _plan(user, tasks, kwargs)
+
+
+def all(user, groupby='week', summary='default', network=False,
+        split_week=False, split_day=False, filter_empty=True, attributes=True,
+        flatten=False, workers=None, executor=None, approximate=False):
+    """
+    Returns a dictionary containing all bandicoot indicators for the user,
+    as well as reporting variables.
+
+    Relevant indicators are defined in the 'individual', and 'spatial' modules.
+
+    =================================== =======================================================================
+    Reporting variables                 Description
+    =================================== =======================================================================
+    antennas_path                       path of the CSV file containing antennas locations
+    attributes_path                     directory where attributes were loaded
+    version                             bandicoot version
+    groupby                             grouping method ('week' or None)
+    split_week                          whether or not indicators are also computed for weekday and weekend
+    split_day                           whether or not indicators are also computed for day and night
+    start_time                          time of the first record
+    end_time                            time of the last record
+    night_start, night_end              start and end time to define nights
+    weekend                             days used to define the weekend (``[6, 7]`` by default, where 1 is Monday)
+    bins                                number of weeks if the record are grouped
+    has_call                            whether or not records include calls
+    has_text                            whether or not records include texts
+    has_home                            whether or not a :meth:`home location <bandicoot.core.User.recompute_home>` has been found
+    has_network                         whether or not correspondents where loaded
+    percent_records_missing_location    percentage of records without location
+    antennas_missing_locations          number of antennas missing a location
+    percent_outofnetwork_calls          percentage of calls, received or emitted, made with a correspondant not loaded in the network
+    percent_outofnetwork_texts          percentage of texts with contacts not loaded in the network
+    percent_outofnetwork_contacts       percentage of contacts not loaded in the network
+    percent_outofnetwork_call_durations percentage of minutes of calls where the contact was not loaded in the network
+    number_of_records                   total number of records
+    number_of_weeks                     number of weeks with records
+    =================================== =======================================================================
+
+    We also include a last set of reporting variables, for the records ignored
+    at load-time. Values can be ignored due to missing or inconsistent fields
+    (e.g., not including a valid 'datetime' value).
+
+    .. code-block:: python
+
+        {
+            'all': 0,
+            'interaction': 0,
+            'direction': 0,
+            'correspondent_id': 0,
+            'datetime': 0,
+            'call_duration': 0
+        }
+
+    with the total number of records ignored (key ``'all'``), as well as the
+    number of records with faulty values for each columns.
+
+    Indicators are computed one after the other, unless ``workers`` or
+    ``executor`` is given:
+
+    * with ``workers=n``, for ``n`` at least 1, indicators are divided in ``n`` chunks, computed
+      concurrently by a pool of threads sharing the cache of the user;
+    * with ``executor``, chunks are given to ``executor.map``, such as a
+      ``multiprocessing.Pool`` or a ``concurrent.futures`` executor. With
+      processes, each chunk receives a copy of the user, without its
+      cache, so that processes only pay off for users with many records.
+
+    Results are the same, and in the same order, in all cases.
+
+    With ``approximate=True``, the indicators counting contacts or
+    antennas (``number_of_contacts``, ``entropy_of_contacts``,
+    ``percent_pareto_interactions``, ``number_of_antennas``, and
+    ``frequent_antennas``) are estimated with sketches of a fixed size,
+    instead of counting the interactions with each contact. See the
+    documentation of each indicator for the error bounds. ``approximate``
+    can also be a list of the names of the indicators to estimate.
+    """
     groups = list(group_records(user.records, groupby=groupby))
     bins_with_data = len(groups)
 
@@ -215,21 +312,40 @@ def all(user, groupby='week', summary='default', network=False,
         ('reporting', reporting)
     ])
 
-    for fun, datatype in functions:
-        try:
-            metric = fun(user, groupby=groupby, summary=summary,
-                         datatype=datatype, filter_empty=filter_empty,
-                         split_week=split_week, split_day=split_day)
-        except ValueError:
-            metric = fun(user, groupby=groupby, datatype=datatype,
-                         split_week=split_week, filter_empty=filter_empty,
-                         split_day=split_day)
+    if workers is not None and workers < 0:
+        raise ValueError("The number of workers must be positive, not "
+                         "{}.".format(workers))
 
-        returned[fun.__name__] = metric
+    tasks = _tasks(user, groupby, network, approximate)
+    kwargs = dict(groupby=groupby, summary=summary, filter_empty=filter_empty,
+                  split_week=split_week, split_day=split_day)
 
-    if network and user.has_network:
-        for fun in network_functions:
-            returned[fun.__name__] = fun(user)
+    # With processes, chunks receive copies of the user without its cache.
+    # With aggregates, scans are only computed for the periods not cached.
+    if executor is None and not user.use_aggregates:
+        _plan(user, tasks, kwargs).execute(user)
+
+    if not workers and executor is None:
+        results = _evaluate((user, tasks, kwargs))
+    else:
+        n = min(workers or len(tasks), len(tasks))
+        chunks = [(user, tasks[i::n], kwargs) for i in range(n)]
+
+        if executor is None:
+            pool = ThreadPool(n)
+            try:
+                chunk_results = pool.map(_evaluate, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            chunk_results = executor.map(_evaluate, chunks)
+
+        computed = dict(r for c in chunk_results for r in c)
+        results = [(name, computed[name]) for name, _, _ in tasks]
+
+    for name, metric in results:
+        returned[name] = metric
 
     if attributes and user.attributes != {}:
         returned['attributes'] = OrderedDict(user.attributes)
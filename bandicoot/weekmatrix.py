@@ -191,7 +191,7 @@ def _calculate_channels(records, sections, split_interval, channel_funcs, user,
 
             # _records is used to avoid recomputing home
             user._records = section_records
-            user._cache = {}
+            user.reset_cache()
             output = list(indicator_fun(user)['allweek']['allday'].values())[0]
 
             if return_type == 'scalar':
@@ -0,0 +1,82 @@
+"""
+Compare the column-wise CSV parser used by bandicoot.read_csv with the
+previous row-by-row parser (csv.DictReader and _parse_record).
+
+Usage: python benchmark_read_csv.py [number_of_rows] [duration_format]
+"""
+
+import sys
+sys.path.append("../")
+import bandicoot as bc
+from bandicoot.io import _parse_record, _parse_records
+import datetime
+import tempfile
+import random
+import time
+import csv
+import os
+
+number_of_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+duration_format = sys.argv[2] if len(sys.argv) > 2 else 'seconds'
+
+
+def write_sample_file(path, n):
+    start = datetime.datetime(2014, 1, 1)
+    with open(path, 'w') as f:
+        w = csv.writer(f)
+        w.writerow(['interaction', 'direction', 'correspondent_id',
+                    'datetime', 'call_duration', 'antenna_id'])
+        for i in range(n):
+            dt = start + datetime.timedelta(seconds=37 * i)
+            duration = random.randint(0, 3600)
+            if duration_format != 'seconds':
+                duration = time.strftime(duration_format,
+                                         time.gmtime(duration))
+            w.writerow([random.choice(['call', 'text']),
+                        random.choice(['in', 'out']),
+                        'c%i' % random.randint(0, 500),
+                        dt.strftime('%Y-%m-%d %H:%M:%S'),
+                        duration,
+                        'a%i' % random.randint(0, 100)])
+
+
+def row_by_row(path):
+    with open(path, 'r') as f:
+        return [_parse_record(r, duration_format) for r in csv.DictReader(f)]
+
+
+def column_wise(path):
+    with open(path, 'r') as f:
+        reader = csv.reader(f)
+        return _parse_records(reader, next(reader), duration_format)
+
+
+def timed(function, path):
+    t = time.time()
+    rv = function(path)
+    return rv, time.time() - t
+
+
+if __name__ == '__main__':
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+
+    try:
+        write_sample_file(path, number_of_rows)
+        old, t_old = timed(row_by_row, path)
+        new, t_new = timed(column_wise, path)
+
+        assert len(old) == len(new)
+        assert all(repr(a) == repr(b) for a, b in zip(old, new))
+
+        _, ignored, _ = bc.io.filter_record(old)
+        _, ignored_new, _ = bc.io.filter_record(new)
+        assert ignored == ignored_new
+
+        print("{} rows, duration format {!r}".format(number_of_rows,
+                                                    duration_format))
+        print("row by row (DictReader): {:.2f}s".format(t_old))
+        print("column-wise:             {:.2f}s ({:.1f}x)".format(
+            t_new, t_old / t_new))
+    finally:
+        os.unlink(path)
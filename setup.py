@@ -31,6 +31,10 @@ setup(
         'Topic :: Scientific/Engineering :: Information Analysis',
         'Topic :: Scientific/Engineering :: Mathematics'
     ],
+    entry_points={
+        'console_scripts': ['bandicoot-batch = bandicoot.batch:main']
+    },
     extras_require={
-        'tests': ['numpy', 'scipy', 'networkx']
+        'tests': ['numpy', 'scipy', 'networkx'],
+        'numpy': ['numpy']
     })